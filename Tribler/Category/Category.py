@@ -29,6 +29,9 @@ class Category(object):
         try:
             self.category_info = getCategoryInfo(filename)
             self.category_info.sort(cmp_rank)
+            for category in self.category_info:
+                # str.endswith accepts a tuple, which checks all suffixes in a single call
+                category['suffix'] = tuple(category['suffix'])
         except:
             self.category_info = []
             self._logger.critical('', exc_info=True)
@@ -96,11 +99,14 @@ class Category(object):
             self._logger.critical(
                 'Category: Exception in explicit terms filter in torrent: %s', display_name, exc_info=True)
 
+        # the names are lowercased and split into words only once, instead of once for every category
+        display_words = set(self._getWords(display_name.lower()))
+        files = self._prepare_files(files_list)
+
         torrent_category = None
-        # filename_list ready
         strongest_cat = 0.0
         for category in self.category_info:  # for each category
-            (decision, strength) = self.judge(category, files_list, display_name)
+            (decision, strength) = self._judge(category, files, display_words)
             if decision and (strength > strongest_cat):
                 torrent_category = category['name']
                 strongest_cat = strength
@@ -110,21 +116,25 @@ class Category(object):
 
         return torrent_category
 
+    def _prepare_files(self, files_list):
+        files = []
+        for name, length in files_list:
+            name = name.lower()
+            files.append((name, length, set(self._getWords(name))))
+        return files
+
     # judge whether a torrent file belongs to a certain category
     # return bool
     def judge(self, category, files_list, display_name=''):
+        return self._judge(category, self._prepare_files(files_list), set(self._getWords(display_name.lower())))
+
+    def _judge(self, category, files, display_words):
+        keywords = category['keywords']
 
         # judge file keywords
-        display_name = display_name.lower()
         factor = 1.0
-        fileKeywords = self._getWords(display_name)
-
-        for ikeywords in category['keywords'].keys():
-            try:
-                fileKeywords.index(ikeywords)
-                factor *= 1 - category['keywords'][ikeywords]
-            except:
-                pass
+        for keyword in display_words.intersection(keywords):
+            factor *= 1 - keywords[keyword]
         if (1 - factor) > 0.5:
             if 'strength' in category:
                 return (True, category['strength'])
@@ -132,35 +142,26 @@ class Category(object):
                 return (True, (1 - factor))
 
         # judge each file
+        suffixes = category['suffix']
+        minfilesize = category['minfilesize']
+        maxfilesize = category['maxfilesize']
         matchSize = 0
         totalSize = 1e-19
-        for name, length in files_list:
+        for name, length, words in files:
             totalSize += length
             # judge file size
-            if length < category['minfilesize'] or 0 < category['maxfilesize'] < length:
+            if length < minfilesize or 0 < maxfilesize < length:
                 continue
 
             # judge file suffix
-            OK = False
-            for isuffix in category['suffix']:
-                if name.lower().endswith(isuffix):
-                    OK = True
-                    break
-            if OK:
+            if suffixes and name.endswith(suffixes):
                 matchSize += length
                 continue
 
             # judge file keywords
             factor = 1.0
-            fileKeywords = self._getWords(name.lower())
-
-            for ikeywords in category['keywords'].keys():
-                try:
-                    fileKeywords.index(ikeywords)
-                    # print ikeywords
-                    factor *= 1 - category['keywords'][ikeywords]
-                except:
-                    pass
+            for keyword in words.intersection(keywords):
+                factor *= 1 - keywords[keyword]
             if factor < 0.5:
                 matchSize += length
 
@@ -18,6 +18,8 @@ class XXXFilter(object):
 
         termfilename = os.path.join(install_dir, LIBRARYNAME, 'Category', 'filter_terms.filter')
         self.xxx_terms, self.xxx_searchterms = self.initTerms(termfilename)
+        self.xxx_words = self.get_term_variants(self.xxx_terms)
+        self.xxx_searchterms_regexp = self.compile_searchterms(self.xxx_searchterms)
 
     def initTerms(self, filename):
         terms = set()
@@ -39,6 +41,30 @@ class XXXFilter(object):
         self._logger.debug('Read %d XXX terms from file %s', len(terms) + len(searchterms), filename)
         return terms, searchterms
 
+    @staticmethod
+    def get_term_variants(terms):
+        """
+        Returns the set of all words that isXXXTerm considers dirty, i.e. the terms and their plural forms.
+        A word ending with 'es' is only matched against the term without the 'es'.
+        """
+        variants = set(terms)
+        for term in terms:
+            variants.add(term + 'es')
+            variants.add(term + 'n')
+            if not term.endswith('e'):
+                variants.add(term + 's')
+        return variants
+
+    @staticmethod
+    def compile_searchterms(searchterms):
+        """
+        Compiles the search terms into a single regular expression, allowing foundXXXTerm to find any of them in
+        one scan over the string.
+        """
+        if not searchterms:
+            return None
+        return re.compile('|'.join(re.escape(term) for term in sorted(searchterms, key=len, reverse=True)))
+
     def _getWords(self, string):
         return [a.lower() for a in WORDS_REGEXP.findall(string)]
 
@@ -64,26 +90,30 @@ class XXXFilter(object):
         s = s.lower()
         if self.isXXXTerm(s):  # We have also put some full titles in the filter file
             return True
-        if not self.isAudio(s) and self.foundXXXTerm(s):
+        is_audio = self.isAudio(s)
+        if not is_audio and self.foundXXXTerm(s):
             return True
-        words = self._getWords(s)
+        words = WORDS_REGEXP.findall(s)
         words2 = [' '.join(words[i:i + 2]) for i in xrange(0, len(words) - 1)]
-        num_xxx = len([w for w in words + words2 if self.isXXXTerm(w, s)])
-        if isFilename and self.isAudio(s):
-            return num_xxx > 2  # almost never classify mp3 as porn
-        else:
-            return num_xxx > 0
+        if isFilename and is_audio:
+            # almost never classify mp3 as porn
+            return sum(1 for w in words + words2 if w in self.xxx_words) > 2
+        return any(self.isXXXTerm(w, s) for w in words + words2 if w in self.xxx_words)
 
     def foundXXXTerm(self, s):
-        for term in self.xxx_searchterms:
-            if term in s:
-                self._logger.debug('XXXFilter: Found term "%s" in %s', term, s)
-                return True
+        if self.xxx_searchterms_regexp is None:
+            return False
+        match = self.xxx_searchterms_regexp.search(s)
+        if match:
+            self._logger.debug('XXXFilter: Found term "%s" in %s', match.group(0), s)
+            return True
         return False
 
     def isXXXTerm(self, s, title=None):
         # check if term-(e)s is in xxx-terms
         s = s.lower()
+        if s not in self.xxx_words:
+            return False
         if s in self.xxx_terms:
             self._logger.debug('XXXFilter: "%s" is dirty%s', s, title and ' in %s' % title or '')
             return True
@@ -98,7 +128,7 @@ class XXXFilter(object):
 
         return False
 
-    audio_extensions = ['cda', 'flac', 'm3u', 'mp2', 'mp3', 'md5', 'vorbis', 'wav', 'wma', 'ogg']
+    audio_extensions = frozenset(['cda', 'flac', 'm3u', 'mp2', 'mp3', 'md5', 'vorbis', 'wav', 'wma', 'ogg'])
 
     def isAudio(self, s):
         return s[s.rfind('.') + 1:] in self.audio_extensions
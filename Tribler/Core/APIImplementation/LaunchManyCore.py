@@ -22,6 +22,7 @@ from Tribler.Core.exceptions import DuplicateDownloadException
 from Tribler.Core.simpledefs import NTFY_DISPERSY, NTFY_STARTED, NTFY_TORRENTS, NTFY_UPDATE
 from Tribler.Main.globals import DefaultDownloadStartupConfig
 from Tribler.dispersy.util import blockingCallFromThread, blocking_call_on_reactor_thread
+from Tribler.Core.APIImplementation.startupgraph import StartupGraph
 from Tribler.Core.APIImplementation.threadpoolmanager import ThreadPoolManager
 
 try:
@@ -90,6 +91,9 @@ class TriblerLaunchMany(object):
         self.torrent_checker = None
         self.tunnel_community = None
 
+        # per startup step the time it started, relative to the start of the session, and its duration
+        self.startup_timings = None
+
     def register(self, session, sesslock, autoload_discovery=True):
         if not self.registered:
             self.registered = True
@@ -97,128 +101,175 @@ class TriblerLaunchMany(object):
             self.session = session
             self.sesslock = sesslock
 
-            if self.session.get_torrent_store():
-                from Tribler.Core.leveldbstore import LevelDbStore
-                self.torrent_store = LevelDbStore(self.session.get_torrent_store_dir())
-
-            if self.session.get_enable_metadata():
-                from Tribler.Core.leveldbstore import LevelDbStore
-                self.metadata_store = LevelDbStore(self.session.get_metadata_store_dir())
-
             # torrent collecting: RemoteTorrentHandler
             if self.session.get_torrent_collecting():
                 from Tribler.Core.RemoteTorrentHandler import RemoteTorrentHandler
                 self.rtorrent_handler = RemoteTorrentHandler(self.session)
 
-            # TODO(emilon): move this to a megacache component or smth
-            if self.session.get_megacache():
-                from Tribler.Core.CacheDB.SqliteCacheDBHandler import (PeerDBHandler, TorrentDBHandler,
-                                                                       MyPreferenceDBHandler, VoteCastDBHandler,
-                                                                       ChannelCastDBHandler)
-                from Tribler.Category.Category import Category
+            self.session.dispersy_member = None
 
-                self._logger.debug('tlm: Reading Session state from %s', self.session.get_state_dir())
+        if not self.initComplete:
+            self.init(autoload_discovery)
 
-                self.cat = Category.getInstance(self.session)
+    def init(self, autoload_discovery):
+        """
+        Starts the modules enabled in the session. The modules are started by a StartupGraph, so the modules that do
+        not depend on each other start at the same time. Blocks until all modules have started.
 
-                # create DBHandlers
-                self.peer_db = PeerDBHandler(self.session)
-                self.torrent_db = TorrentDBHandler(self.session)
-                self.mypref_db = MyPreferenceDBHandler(self.session)
-                self.votecast_db = VoteCastDBHandler(self.session)
-                self.channelcast_db = ChannelCastDBHandler(self.session)
+        The steps in the threadpool run concurrently and twisted's scheduler is not thread safe, so they only do
+        blocking work (opening databases, creating endpoints). Everything that starts a LoopingCall or calls
+        reactor.callLater runs in a step on the reactor thread.
+        """
+        graph = StartupGraph(u"lmc")
 
-                # initializes DBHandlers
-                self.peer_db.initialize()
-                self.torrent_db.initialize()
-                self.mypref_db.initialize()
-                self.votecast_db.initialize()
-                self.channelcast_db.initialize()
+        if self.session.get_torrent_store():
+            graph.add_step("torrent_store", self._init_torrent_store)
+        if self.session.get_enable_metadata():
+            graph.add_step("metadata_store", self._init_metadata_store)
+        if self.session.get_megacache():
+            graph.add_step("megacache_handlers", self._init_megacache)
+            graph.add_step("megacache", self._initialize_megacache, ["megacache_handlers"], in_thread=False)
+        if self.session.get_videoplayer():
+            graph.add_step("videoplayer", self._init_videoplayer)
+        if self.session.get_dispersy():
+            graph.add_step("dispersy", self._init_dispersy)
+            graph.add_step("tftp_handler", self._init_tftp_handler, ["dispersy"], in_thread=False)
+        if self.session.get_enable_torrent_search() or self.session.get_enable_channel_search():
+            graph.add_step("search_manager", self._init_search_manager, ["megacache", "dispersy"])
+        if self.session.get_dispersy():
+            graph.add_step("dispersy_start", lambda: self._start_dispersy(autoload_discovery), ["tftp_handler"])
+            # the communities and the channel manager start looping calls
+            graph.add_step("communities", self._load_communities, ["dispersy_start", "megacache", "search_manager"],
+                           in_thread=False)
+
+        graph.add_step("mainline_dht", self._init_mainline_dht)
+        if self.session.get_libtorrent():
+            graph.add_step("libtorrent", self._init_libtorrent, in_thread=False)
+        if self.session.get_torrent_checking():
+            graph.add_step("torrent_checker", self._init_torrent_checker, ["megacache", "libtorrent"], in_thread=False)
+        if self.rtorrent_handler:
+            graph.add_step("remote_torrent_handler", self.rtorrent_handler.initialize,
+                           ["torrent_store", "megacache", "communities", "tftp_handler", "libtorrent"],
+                           in_thread=False)
 
-                from Tribler.Core.Modules.tracker_manager import TrackerManager
-                self.tracker_manager = TrackerManager(self.session)
-                self.tracker_manager.initialize()
+        self.startup_timings = blockingCallFromThread(reactor, graph.run)
+        self.initComplete = True
 
-            if self.session.get_videoplayer():
-                self.videoplayer = VideoPlayer(self.session)
+    def _init_torrent_store(self):
+        from Tribler.Core.leveldbstore import LevelDbStore
+        self.torrent_store = LevelDbStore(self.session.get_torrent_store_dir())
 
-            # Dispersy
-            self.session.dispersy_member = None
-            self.tftp_handler = None
-            if self.session.get_dispersy():
-                from Tribler.dispersy.dispersy import Dispersy
-                from Tribler.dispersy.endpoint import StandaloneEndpoint
+    def _init_metadata_store(self):
+        from Tribler.Core.leveldbstore import LevelDbStore
+        self.metadata_store = LevelDbStore(self.session.get_metadata_store_dir())
 
-                # set communication endpoint
-                endpoint = StandaloneEndpoint(self.session.get_dispersy_port(), ip=self.session.get_ip())
+    def _init_megacache(self):
+        # TODO(emilon): move this to a megacache component or smth
+        from Tribler.Core.CacheDB.SqliteCacheDBHandler import (PeerDBHandler, TorrentDBHandler,
+                                                               MyPreferenceDBHandler, VoteCastDBHandler,
+                                                               ChannelCastDBHandler)
+        from Tribler.Category.Category import Category
 
-                working_directory = unicode(self.session.get_state_dir())
-                self.dispersy = Dispersy(endpoint, working_directory)
+        self._logger.debug('tlm: Reading Session state from %s', self.session.get_state_dir())
 
-                # register TFTP service
-                from Tribler.Core.TFTP.handler import TftpHandler
-                self.tftp_handler = TftpHandler(self.session, endpoint, "fffffffd".decode('hex'), block_size=1024)
-                self.tftp_handler.initialize()
+        self.cat = Category.getInstance(self.session)
 
-            if self.session.get_enable_torrent_search() or self.session.get_enable_channel_search():
-                self.search_manager = SearchManager(self.session)
-                self.search_manager.initialize()
+        # create DBHandlers
+        self.peer_db = PeerDBHandler(self.session)
+        self.torrent_db = TorrentDBHandler(self.session)
+        self.mypref_db = MyPreferenceDBHandler(self.session)
+        self.votecast_db = VoteCastDBHandler(self.session)
+        self.channelcast_db = ChannelCastDBHandler(self.session)
 
-        if not self.initComplete:
-            self.init(autoload_discovery)
+    def _initialize_megacache(self):
+        # initializes DBHandlers, some of them start looping calls
+        self.peer_db.initialize()
+        self.torrent_db.initialize()
+        self.mypref_db.initialize()
+        self.votecast_db.initialize()
+        self.channelcast_db.initialize()
 
-    def init(self, autoload_discovery):
-        if self.dispersy:
-            from Tribler.dispersy.community import HardKilledCommunity
+        from Tribler.Core.Modules.tracker_manager import TrackerManager
+        self.tracker_manager = TrackerManager(self.session)
+        self.tracker_manager.initialize()
 
-            self._logger.info("lmc: Starting Dispersy...")
+    def _init_videoplayer(self):
+        self.videoplayer = VideoPlayer(self.session)
 
-            now = timemod.time()
-            success = self.dispersy.start(autoload_discovery)
+    def _init_dispersy(self):
+        from Tribler.dispersy.dispersy import Dispersy
+        from Tribler.dispersy.endpoint import StandaloneEndpoint
 
-            diff = timemod.time() - now
-            if success:
-                self._logger.info("lmc: Dispersy started successfully in %.2f seconds [port: %d]",
-                                  diff, self.dispersy.wan_address[1])
-            else:
-                self._logger.info("lmc: Dispersy failed to start in %.2f seconds", diff)
+        # set communication endpoint
+        endpoint = StandaloneEndpoint(self.session.get_dispersy_port(), ip=self.session.get_ip())
+
+        working_directory = unicode(self.session.get_state_dir())
+        self.dispersy = Dispersy(endpoint, working_directory)
+
+    def _init_tftp_handler(self):
+        # register TFTP service
+        from Tribler.Core.TFTP.handler import TftpHandler
+        self.tftp_handler = TftpHandler(self.session, self.dispersy.endpoint, "fffffffd".decode('hex'),
+                                        block_size=1024)
+        self.tftp_handler.initialize()
 
-            self.upnp_ports.append((self.dispersy.wan_address[1], 'UDP'))
+    def _init_search_manager(self):
+        self.search_manager = SearchManager(self.session)
+        self.search_manager.initialize()
 
-            from Tribler.dispersy.crypto import M2CryptoSK
-            self.session.dispersy_member = blockingCallFromThread(reactor, self.dispersy.get_member,
-                                                                  private_key=self.dispersy.crypto.key_to_bin(M2CryptoSK(filename=self.session.get_permid_keypair_filename())))
+    def _start_dispersy(self, autoload_discovery):
+        from Tribler.dispersy.community import HardKilledCommunity
 
-            blockingCallFromThread(reactor, self.dispersy.define_auto_load, HardKilledCommunity,
-                                   self.session.dispersy_member, load=True)
+        self._logger.info("lmc: Starting Dispersy...")
 
-            if self.session.get_megacache():
-                self.dispersy.database.attach_commit_callback(self.session.sqlite_db.commit_now)
+        now = timemod.time()
+        success = self.dispersy.start(autoload_discovery)
 
-            # notify dispersy finished loading
-            self.session.notifier.notify(NTFY_DISPERSY, NTFY_STARTED, None)
+        diff = timemod.time() - now
+        if success:
+            self._logger.info("lmc: Dispersy started successfully in %.2f seconds [port: %d]",
+                              diff, self.dispersy.wan_address[1])
+        else:
+            self._logger.info("lmc: Dispersy failed to start in %.2f seconds", diff)
+
+        self.upnp_ports.append((self.dispersy.wan_address[1], 'UDP'))
 
-            @blocking_call_on_reactor_thread
-            def load_communities():
-                # load communities
-                # Search Community
-                if self.session.get_enable_torrent_search():
-                    from Tribler.community.search.community import SearchCommunity
-                    self.dispersy.define_auto_load(SearchCommunity, self.session.dispersy_member, load=True,
-                                                   kargs={'tribler_session': self.session})
+        from Tribler.dispersy.crypto import M2CryptoSK
+        self.session.dispersy_member = blockingCallFromThread(reactor, self.dispersy.get_member,
+                                                              private_key=self.dispersy.crypto.key_to_bin(M2CryptoSK(filename=self.session.get_permid_keypair_filename())))
 
-                # AllChannel Community
-                if self.session.get_enable_channel_search():
-                    from Tribler.community.allchannel.community import AllChannelCommunity
-                    self.dispersy.define_auto_load(AllChannelCommunity, self.session.dispersy_member, load=True,
-                                                   kargs={'tribler_session': self.session})
-            load_communities()
+        blockingCallFromThread(reactor, self.dispersy.define_auto_load, HardKilledCommunity,
+                               self.session.dispersy_member, load=True)
 
+    def _load_communities(self):
+        if self.session.get_megacache():
+            self.dispersy.database.attach_commit_callback(self.session.sqlite_db.commit_now)
+
+        # notify dispersy finished loading
+        self.session.notifier.notify(NTFY_DISPERSY, NTFY_STARTED, None)
+
+        @blocking_call_on_reactor_thread
+        def load_communities():
+            # load communities
+            # Search Community
+            if self.session.get_enable_torrent_search():
+                from Tribler.community.search.community import SearchCommunity
+                self.dispersy.define_auto_load(SearchCommunity, self.session.dispersy_member, load=True,
+                                               kargs={'tribler_session': self.session})
+
+            # AllChannel Community
             if self.session.get_enable_channel_search():
-                from Tribler.Core.Modules.channel.channel_manager import ChannelManager
-                self.channel_manager = ChannelManager(self.session)
-                self.channel_manager.initialize()
+                from Tribler.community.allchannel.community import AllChannelCommunity
+                self.dispersy.define_auto_load(AllChannelCommunity, self.session.dispersy_member, load=True,
+                                               kargs={'tribler_session': self.session})
+        load_communities()
 
+        if self.session.get_enable_channel_search():
+            from Tribler.Core.Modules.channel.channel_manager import ChannelManager
+            self.channel_manager = ChannelManager(self.session)
+            self.channel_manager.initialize()
+
+    def _init_mainline_dht(self):
         from Tribler.Core.DecentralizedTracking import mainlineDHT
         try:
             self.mainline_dht = mainlineDHT.init(('127.0.0.1', self.session.get_mainline_dht_listen_port()),
@@ -227,27 +278,22 @@ class TriblerLaunchMany(object):
         except:
             print_exc()
 
-        if self.session.get_libtorrent():
-            from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
-            self.ltmgr = LibtorrentMgr(self.session)
-            self.ltmgr.initialize()
-            # FIXME(lipu): upnp APIs are not exported in libtorrent python-binding.
-            #for port, protocol in self.upnp_ports:
-            #    self.ltmgr.add_upnp_mapping(port, protocol)
+    def _init_libtorrent(self):
+        from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
+        self.ltmgr = LibtorrentMgr(self.session)
+        self.ltmgr.initialize()
+        # FIXME(lipu): upnp APIs are not exported in libtorrent python-binding.
+        #for port, protocol in self.upnp_ports:
+        #    self.ltmgr.add_upnp_mapping(port, protocol)
 
+    def _init_torrent_checker(self):
         # add task for tracker checking
-        if self.session.get_torrent_checking():
-            try:
-                from Tribler.Core.TorrentChecker.torrent_checker import TorrentChecker
-                self.torrent_checker = TorrentChecker(self.session)
-                self.torrent_checker.initialize()
-            except:
-                print_exc()
-
-        if self.rtorrent_handler:
-            self.rtorrent_handler.initialize()
-
-        self.initComplete = True
+        try:
+            from Tribler.Core.TorrentChecker.torrent_checker import TorrentChecker
+            self.torrent_checker = TorrentChecker(self.session)
+            self.torrent_checker.initialize()
+        except:
+            print_exc()
 
     def add(self, tdef, dscfg, pstate=None, initialdlstatus=None, setupDelay=0, hidden=False):
         """ Called by any thread """
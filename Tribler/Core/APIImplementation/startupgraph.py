@@ -0,0 +1,113 @@
+import logging
+from collections import OrderedDict
+from time import time
+
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.internet.threads import deferToThread
+from twisted.python.failure import Failure
+
+
+class StartupGraph(object):
+    """
+    Runs startup steps as soon as the steps they depend on have finished, so steps that do not depend on each other
+    run concurrently. Every step is timed, the timings are logged and kept in timings.
+    """
+
+    def __init__(self, name):
+        super(StartupGraph, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.name = name
+
+        self._steps = OrderedDict()
+        self._dependents = {}
+        self._waiting_for = {}
+        self._remaining = 0
+        self._start_time = None
+        self._failure = None
+        self._finished = None
+
+        # step name to the time it started, relative to the start of the graph, and its duration
+        self.timings = OrderedDict()
+
+    def add_step(self, name, function, dependencies=(), in_thread=True):
+        """
+        Adds a step that calls function once all dependencies have finished. Dependencies have to be added before
+        the steps depending on them, which rules out cycles, dependencies that are not in the graph (e.g. disabled
+        modules) are ignored. Steps in_thread are called in the reactor threadpool, the other steps are called on
+        the reactor thread and may return a Deferred. Steps in_thread may run at the same time as other steps, so
+        they should not schedule reactor work (LoopingCall, callLater): twisted's scheduler is not thread safe.
+        """
+        assert name not in self._steps, name
+        dependencies = [dependency for dependency in dependencies if dependency in self._steps]
+
+        self._steps[name] = (function, in_thread)
+        self._dependents[name] = []
+        self._waiting_for[name] = set(dependencies)
+        for dependency in dependencies:
+            self._dependents[dependency].append(name)
+
+    def has_step(self, name):
+        return name in self._steps
+
+    def run(self):
+        """
+        Starts the steps and returns a Deferred that fires with the timings once all steps have finished, or fails
+        with the first failure. The steps depending on a failed step are skipped. Call this on the reactor thread.
+        """
+        assert self._finished is None, "a StartupGraph runs once"
+        self._finished = Deferred()
+        self._start_time = time()
+        self._remaining = len(self._steps)
+
+        ready = [name for name, dependencies in self._waiting_for.iteritems() if not dependencies]
+        if not ready:
+            self._finish()
+        for name in ready:
+            self._start_step(name)
+        return self._finished
+
+    def _start_step(self, name):
+        function, in_thread = self._steps[name]
+        self._logger.debug("%s: starting %s", self.name, name)
+
+        started = time()
+        deferred = deferToThread(function) if in_thread else maybeDeferred(function)
+        deferred.addBoth(self._on_step_finished, name, started)
+
+    def _on_step_finished(self, result, name, started):
+        duration = time() - started
+        self.timings[name] = (started - self._start_time, duration)
+        self._remaining -= 1
+
+        if isinstance(result, Failure):
+            self._logger.error("%s: %s failed after %.2f seconds: %s", self.name, name, duration,
+                               result.getTraceback())
+            self._failure = self._failure or result
+            self._skip_dependents(name)
+        else:
+            self._logger.info("%s: %s finished in %.2f seconds", self.name, name, duration)
+            for dependent in self._dependents[name]:
+                waiting_for = self._waiting_for[dependent]
+                waiting_for.discard(name)
+                if not waiting_for:
+                    self._start_step(dependent)
+
+        # a step that finishes synchronously may already have finished the graph
+        if not self._remaining and not self._finished.called:
+            self._finish()
+
+    def _skip_dependents(self, name):
+        for dependent in self._dependents[name]:
+            if dependent not in self.timings:
+                self._logger.error("%s: skipping %s, it depends on %s", self.name, dependent, name)
+                self.timings[dependent] = (None, 0.0)
+                self._remaining -= 1
+                self._skip_dependents(dependent)
+
+    def _finish(self):
+        self._logger.info("%s: started in %.2f seconds, the steps took %.2f seconds in total", self.name,
+                          time() - self._start_time, sum(duration for _, duration in self.timings.itervalues()))
+        if self._failure:
+            self._finished.errback(self._failure)
+        else:
+            self._finished.callback(self.timings)
@@ -5,20 +5,25 @@
 # Please reuse the functions in sqlitecachedb as much as possible
 import logging
 import os
+import random
 import threading
 import json
+from binascii import hexlify
+from bisect import insort
 from copy import deepcopy
 from pprint import pformat
 from struct import unpack_from
 from time import time
 from traceback import print_exc
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict, defaultdict, deque
+from heapq import nlargest
 from libtorrent import bencode
 from twisted.internet.task import LoopingCall
 
 from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Utilities.search_utils import split_into_keywords, filter_keywords
+from Tribler.Core.Utilities.suggestion_index import SuggestionIndex, levenshtein
 from Tribler.Core.Utilities.unicode import dunno2unicode
 from Tribler.Core.simpledefs import (INFOHASH_LENGTH, NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE, NTFY_CREATE,
                                      NTFY_MODIFIED, NTFY_TRACKERINFO, NTFY_MYPREFERENCES, NTFY_VOTECAST, NTFY_TORRENTS,
@@ -36,6 +41,23 @@ VOTECAST_FLUSH_DB_INTERVAL = 15
 MAX_KEYWORDS_STORED = 5
 MAX_KEYWORD_LENGTH = 50
 
+# search suggestions: allow one edit per SUGGESTION_EDIT_RATIO characters of a keyword
+SUGGESTION_EDIT_RATIO = 4
+MAX_SUGGESTION_TERMS = 10
+MAX_SUGGESTION_CANDIDATES = 100
+
+# channel previews: the number of recent torrents and the size of the random sample of older torrents that is
+# kept for every channel that getRecentAndRandomTorrents looked at
+PREVIEW_RECENT_TORRENTS = 64
+PREVIEW_RANDOM_TORRENTS = 32
+# the number of channels for which such a sample is kept, the least recently used one is dropped first
+MAX_CHANNEL_SAMPLES = 500
+
+# freeSpace selects the eviction candidates for this many calls with a single scan, the candidates are rescanned
+# once they are used up or older than EVICTION_CANDIDATES_TTL seconds
+EVICTION_CANDIDATES_STEPS = 20
+EVICTION_CANDIDATES_TTL = 300
+
 # Rahim:
 MAX_POPULARITY_REC_PER_TORRENT = 5  # maximum number of records in popularity table for each torrent
 MAX_POPULARITY_REC_PER_TORRENT_PEER = 3  # maximum number of records per each combination of torrent and peer
@@ -56,6 +78,60 @@ class LimitedOrderedDict(OrderedDict):
             self.popitem(last=False)
 
 
+class ChannelTorrentSample(object):
+
+    """
+    The most recent torrents of a channel and a uniform random sample (reservoir) of all older torrents.
+    Torrents are (time_stamp, infohash) tuples, they may be added in any order.
+    """
+
+    def __init__(self, nr_recent=PREVIEW_RECENT_TORRENTS, nr_random=PREVIEW_RANDOM_TORRENTS):
+        self._nr_recent = nr_recent
+        self._nr_random = nr_random
+
+        # sorted on time_stamp, oldest first
+        self.recent = []
+        self.reservoir = []
+        self.nr_older = 0
+
+    def __len__(self):
+        return len(self.recent) + self.nr_older
+
+    def add(self, time_stamp, infohash):
+        insort(self.recent, (time_stamp, infohash))
+        if len(self.recent) > self._nr_recent:
+            self._add_older(self.recent.pop(0))
+
+    def _add_older(self, torrent):
+        self.nr_older += 1
+        if len(self.reservoir) < self._nr_random:
+            self.reservoir.append(torrent)
+        else:
+            index = random.randrange(self.nr_older)
+            if index < self._nr_random:
+                self.reservoir[index] = torrent
+
+    def get_older(self, time_stamp):
+        """
+        Returns (weight, torrent) tuples for the torrents in this sample that are older than time_stamp. A recent
+        torrent only stands for itself, a torrent in the reservoir stands for nr_older / len(reservoir) torrents.
+        """
+        older = [(1.0, torrent) for torrent in self.recent if torrent[0] < time_stamp]
+        if self.reservoir:
+            weight = float(self.nr_older) / len(self.reservoir)
+            older.extend((weight, torrent) for torrent in self.reservoir if torrent[0] < time_stamp)
+        return older
+
+
+def weighted_sample(population, k):
+    """
+    Selects k distinct items from a list of (weight, item) tuples without replacement, an item is selected with a
+    probability proportional to its weight (Efraimidis and Spirakis).
+    """
+    keys = ((random.random() ** (1.0 / weight), item) for weight, item in population)
+    return [item for _, item in nlargest(k, keys)]
+
+
 class BasicDBHandler(TaskManager):
 
     def __init__(self, session, table_name):
@@ -237,6 +313,11 @@ class TorrentDBHandler(BasicDBHandler):
         self.mypref_db = self.votecast_db = self.channelcast_db = self._rtorrent_handler = None
 
         self.infohash_id = LimitedOrderedDict(DEFAULT_ID_CACHE_SIZE)
+        self._suggestion_index = SuggestionIndex()
+
+        # torrent_ids of collected torrents, lowest weight first
+        self._eviction_candidates = deque()
+        self._eviction_candidates_time = 0
 
     def initialize(self, *args, **kwargs):
         super(TorrentDBHandler, self).initialize(*args, **kwargs)
@@ -293,6 +374,18 @@ class TorrentDBHandler(BasicDBHandler):
 
         return to_return
 
+    def getDispersyIdsFromInfohashes(self, infohashes):
+        """
+        Returns a dictionary with the dispersy ids of the torrent messages by infohash, infohashes that are not in the
+        database are left out. The dispersy id is None for a torrent that has no torrent message.
+        """
+        if not infohashes:
+            return {}
+        parameters = '?,' * len(infohashes)
+        sql = u"SELECT infohash, dispersy_id FROM Torrent WHERE infohash IN (%s)" % parameters[:-1]
+        results = self._db.fetchall(sql, [bin2str(infohash) for infohash in infohashes])
+        return dict((str2bin(infohash), dispersy_id) for infohash, dispersy_id in results)
+
     def getInfohash(self, torrent_id):
         sql_get_infohash = "SELECT infohash FROM Torrent WHERE torrent_id==?"
         ret = self._db.fetchone(sql_get_infohash, (torrent_id,))
@@ -324,33 +417,10 @@ class TorrentDBHandler(BasicDBHandler):
 
     def addExternalTorrentNoDef(self, infohash, name, files, trackers, timestamp, extra_info={}):
         if not self.hasTorrent(infohash):
-            metainfo = {'info': {}, 'encoding': 'utf_8'}
-            metainfo['info']['name'] = name.encode('utf_8')
-            metainfo['info']['piece length'] = -1
-            metainfo['info']['pieces'] = ''
-
-            if len(files) > 1:
-                files_as_dict = []
-                for filename, file_lenght in files:
-                    filename = filename.encode('utf_8')
-                    files_as_dict.append({'path': [filename], 'length': file_lenght})
-                metainfo['info']['files'] = files_as_dict
-
-            elif len(files) == 1:
-                metainfo['info']['length'] = files[0][1]
-            else:
-                return
-
-            if len(trackers) > 0:
-                metainfo['announce'] = trackers[0]
-            else:
-                metainfo['nodes'] = []
-
-            metainfo['creation date'] = timestamp
-
             try:
-                torrentdef = TorrentDef.load_from_dict(metainfo)
-                torrentdef.infohash = infohash
+                torrentdef = self._get_torrentdef_no_def(infohash, name, files, trackers, timestamp)
+                if torrentdef is None:
+                    return
 
                 torrent_id = self._addTorrentToDB(torrentdef, extra_info)
                 if self._rtorrent_handler:
@@ -364,6 +434,99 @@ class TorrentDBHandler(BasicDBHandler):
                 self._logger.error("Could not create a TorrentDef instance %r %r %r %r %r %r", infohash, timestamp, name, files, trackers, extra_info)
                 print_exc()
 
+    def addExternalTorrentsNoDef(self, torrents):
+        """
+        Stores the torrents that are in the database but not collected yet, given as tuples of torrent_id, infohash,
+        name, files, trackers and timestamp, as addExternalTorrentNoDef does one by one.
+
+        Every table is written with a single statement for all the torrents.
+        """
+        if not torrents:
+            return
+
+        parameters = u"?," * len(torrents)
+        sql = u"SELECT torrent_id FROM CollectedTorrent WHERE torrent_id IN (%s)" % parameters[:-1]
+        collected = set(torrent_id for torrent_id, in self._db.fetchall(sql, [torrent[0] for torrent in torrents]))
+
+        columns = ("name", "length", "creation_date", "num_files", "insert_time", "secret", "relevance", "category",
+                   "status", "comment", "is_collected")
+        update_torrents = []
+        index_torrents = []
+        tracker_mappings = []
+        insert_files = []
+        infohashes = []
+        for torrent_id, infohash, name, files, trackers, timestamp in torrents:
+            if torrent_id in collected:
+                continue
+            try:
+                torrentdef = self._get_torrentdef_no_def(infohash, name, files, trackers, timestamp)
+                if torrentdef is None:
+                    continue
+                database_dict = self._get_database_dict(torrentdef)
+            except:
+                self._logger.error("Could not create a TorrentDef instance %r %r %r %r %r", infohash, timestamp, name,
+                                   files, trackers)
+                print_exc()
+                continue
+
+            update_torrents.append([database_dict[column] for column in columns] + [torrent_id])
+
+            swarmname = torrentdef.get_name_as_unicode()
+            if not torrentdef.is_multifile_torrent():
+                swarmname, _ = os.path.splitext(swarmname)
+            index_torrents.append(self._get_index_values(torrent_id, swarmname, torrentdef.get_files_as_unicode()))
+
+            tracker_mappings.extend((torrent_id, infohash, tracker) for tracker in self._get_tracker_set(torrentdef))
+            insert_files.extend((torrent_id, unicode(path), length) for path, length in files)
+            infohashes.append(infohash)
+
+        if update_torrents:
+            sql = u"UPDATE Torrent SET %s WHERE torrent_id = ?" % u", ".join(u"%s = ?" % column for column in columns)
+            self._db.executemany(sql, update_torrents)
+            self._insert_index_values(index_torrents)
+            self._addTorrentTrackerMappings(tracker_mappings)
+
+        if self._rtorrent_handler:
+            for infohash in infohashes:
+                self._rtorrent_handler.notify_possible_torrent_infohash(infohash)
+
+        if insert_files:
+            sql_insert_files = "INSERT OR IGNORE INTO TorrentFiles (torrent_id, path, length) VALUES (?,?,?)"
+            self._db.executemany(sql_insert_files, insert_files)
+
+    def _get_torrentdef_no_def(self, infohash, name, files, trackers, timestamp):
+        """
+        Returns a TorrentDef without pieces for the torrent described by NAME, FILES and TRACKERS, or None when it
+        has no files.
+        """
+        metainfo = {'info': {}, 'encoding': 'utf_8'}
+        metainfo['info']['name'] = name.encode('utf_8')
+        metainfo['info']['piece length'] = -1
+        metainfo['info']['pieces'] = ''
+
+        if len(files) > 1:
+            files_as_dict = []
+            for filename, file_lenght in files:
+                filename = filename.encode('utf_8')
+                files_as_dict.append({'path': [filename], 'length': file_lenght})
+            metainfo['info']['files'] = files_as_dict
+
+        elif len(files) == 1:
+            metainfo['info']['length'] = files[0][1]
+        else:
+            return None
+
+        if len(trackers) > 0:
+            metainfo['announce'] = trackers[0]
+        else:
+            metainfo['nodes'] = []
+
+        metainfo['creation date'] = timestamp
+
+        torrentdef = TorrentDef.load_from_dict(metainfo)
+        torrentdef.infohash = infohash
+        return torrentdef
+
     def addOrGetTorrentID(self, infohash):
         assert isinstance(infohash, str), "INFOHASH has invalid type: %s" % type(infohash)
         assert len(infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(infohash)
@@ -447,6 +610,9 @@ class TorrentDBHandler(BasicDBHandler):
         if existed:
             return
 
+        self._insert_index_values([self._get_index_values(torrent_id, swarmname, files)])
+
+    def _get_index_values(self, torrent_id, swarmname, files):
         # Niels: new method for indexing, replaces invertedindex
         # Making sure that swarmname does not include extension for single file torrents
         swarm_keywords = " ".join(split_into_keywords(swarmname))
@@ -467,20 +633,32 @@ class TorrentDBHandler(BasicDBHandler):
             filenames.sort(cmp=popSort, reverse=True)
             filenames = filenames[:1000]
 
-        values = (torrent_id, swarm_keywords, " ".join(filenames), " ".join(fileextensions))
+        return torrent_id, swarm_keywords, " ".join(filenames), " ".join(fileextensions)
+
+    def _insert_index_values(self, index_values):
         try:
             # INSERT OR REPLACE not working for fts3 table
-            self._db.execute_write(u"DELETE FROM FullTextIndex WHERE rowid = ?", (torrent_id,))
-            self._db.execute_write(
-                u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES(?,?,?,?)", values)
+            self._db.executemany(u"DELETE FROM FullTextIndex WHERE rowid = ?",
+                                 [(values[0],) for values in index_values])
+            self._db.executemany(
+                u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES(?,?,?,?)",
+                index_values)
         except:
             # this will fail if the fts3 module cannot be found
             print_exc()
+        else:
+            if self._suggestion_index.is_loaded:
+                for values in index_values:
+                    self._suggestion_index.add_swarmname(values[1])
 
     # ------------------------------------------------------------
     # Adds the trackers of a given torrent into the database.
     # ------------------------------------------------------------
     def _addTorrentTracker(self, torrent_id, torrentdef, extra_info={}):
+        # add trackers in batch
+        self.addTorrentTrackerMappingInBatch(torrent_id, list(self._get_tracker_set(torrentdef)))
+
+    def _get_tracker_set(self, torrentdef):
         # Set add_all to True if you want to put all multi-trackers into db.
         # In the current version (4.2) only the main tracker is used.
 
@@ -509,9 +687,7 @@ class TorrentDBHandler(BasicDBHandler):
                     tracker_url = get_uniformed_tracker_url(tracker)
                     if tracker_url:
                         new_tracker_set.add(tracker_url)
-
-        # add trackers in batch
-        self.addTorrentTrackerMappingInBatch(torrent_id, list(new_tracker_set))
+        return new_tracker_set
 
     def updateTorrent(self, infohash, notify=True, **kw):  # watch the schema of database
         if 'seeder' in kw:
@@ -644,6 +820,45 @@ class TorrentDBHandler(BasicDBHandler):
         if not tracker_list:
             return
 
+        self._add_unknown_trackers(tracker_list)
+
+        # update torrent-tracker mapping
+        sql = 'INSERT OR IGNORE INTO TorrentTrackerMapping(torrent_id, tracker_id)'\
+            + ' VALUES(?, (SELECT tracker_id FROM TrackerInfo WHERE tracker = ?))'
+        new_mapping_list = [(torrent_id, tracker) for tracker in tracker_list]
+        if new_mapping_list:
+            self._db.executemany(sql, new_mapping_list)
+
+        # add trackers into the torrent file if it has been collected
+        if not self.session.get_torrent_store() or self.session.lm.torrent_store is None:
+            return
+
+        self._add_trackers_to_collected_torrent(self.getInfohash(torrent_id), tracker_list)
+
+    def _addTorrentTrackerMappings(self, mappings):
+        """
+        Adds the trackers of several torrents, given as tuples of torrent_id, infohash and tracker, as
+        addTorrentTrackerMappingInBatch does for a single torrent.
+        """
+        if not mappings:
+            return
+
+        self._add_unknown_trackers(list(set(tracker for _, _, tracker in mappings)))
+
+        sql = 'INSERT OR IGNORE INTO TorrentTrackerMapping(torrent_id, tracker_id)'\
+            + ' VALUES(?, (SELECT tracker_id FROM TrackerInfo WHERE tracker = ?))'
+        self._db.executemany(sql, [(torrent_id, tracker) for torrent_id, _, tracker in mappings])
+
+        if not self.session.get_torrent_store() or self.session.lm.torrent_store is None:
+            return
+
+        infohash_trackers = defaultdict(list)
+        for _, infohash, tracker in mappings:
+            infohash_trackers[infohash].append(tracker)
+        for infohash, tracker_list in infohash_trackers.iteritems():
+            self._add_trackers_to_collected_torrent(infohash, tracker_list)
+
+    def _add_unknown_trackers(self, tracker_list):
         parameters = u"?," * len(tracker_list)
         parameters = parameters[:-1]
         sql = u"SELECT tracker FROM TrackerInfo WHERE tracker IN (%s)" % parameters
@@ -657,18 +872,7 @@ class TorrentDBHandler(BasicDBHandler):
             if self.session.lm.tracker_manager is not None:
                 self.session.lm.tracker_manager.add_tracker(tracker)
 
-        # update torrent-tracker mapping
-        sql = 'INSERT OR IGNORE INTO TorrentTrackerMapping(torrent_id, tracker_id)'\
-            + ' VALUES(?, (SELECT tracker_id FROM TrackerInfo WHERE tracker = ?))'
-        new_mapping_list = [(torrent_id, tracker) for tracker in tracker_list]
-        if new_mapping_list:
-            self._db.executemany(sql, new_mapping_list)
-
-        # add trackers into the torrent file if it has been collected
-        if not self.session.get_torrent_store() or self.session.lm.torrent_store is None:
-            return
-
-        infohash = self.getInfohash(torrent_id)
+    def _add_trackers_to_collected_torrent(self, infohash, tracker_list):
         if infohash and self.session.has_collected_torrent(infohash):
             torrent_data = self.session.get_collected_torrent(infohash)
             tdef = TorrentDef.load_from_memory(torrent_data)
@@ -833,55 +1037,69 @@ class TorrentDBHandler(BasicDBHandler):
     def getTorrentsStats(self):
         return self._db.getOne('CollectedTorrent', ['count(torrent_id)', 'sum(length)', 'sum(num_files)'])
 
-    def freeSpace(self, torrents2del):
+    def _get_eviction_exclusion(self):
+        """
+        Returns the SQL condition and arguments that keep my preferences and the torrents in my channel.
+        """
+        sql = u" AND torrent_id NOT IN (SELECT torrent_id FROM MyPreference)"
         if self.channelcast_db and self.channelcast_db._channel_id:
-            sql = U"""
-                SELECT torrent_file_name, torrent_id, relevance,
-                MIN(relevance, 2500) + MIN(500, num_leechers) + 4*MIN(500, num_seeders) - (MAX(0, MIN(500, (%d - creation_date)/86400)) ) AS weight
-                FROM CollectedTorrent
-                WHERE torrent_id NOT IN (SELECT torrent_id FROM MyPreference)
-                AND torrent_id NOT IN (SELECT torrent_id FROM ChannelTorrents WHERE channel_id == %d)
-                ORDER BY weight
-                LIMIT %d
-            """ % (int(time()), self.channelcast_db._channel_id, torrents2del)
-        else:
+            sql += u" AND torrent_id NOT IN (SELECT torrent_id FROM ChannelTorrents WHERE channel_id == ?)"
+            return sql, [self.channelcast_db._channel_id]
+        return sql, []
+
+    def _get_eviction_candidates(self, torrents2del):
+        """
+        Returns the torrent_ids of the torrents2del collected torrents with the lowest weight. The weight depends on
+        the current time, so instead of sorting the collected torrents on every call the candidates for the next
+        EVICTION_CANDIDATES_STEPS calls are selected at once.
+        """
+        if len(self._eviction_candidates) < torrents2del or \
+                time() - self._eviction_candidates_time > EVICTION_CANDIDATES_TTL:
+            exclusion, args = self._get_eviction_exclusion()
             sql = u"""
-                SELECT torrent_file_name, torrent_id, relevance,
-                    min(relevance,2500) +  min(500,num_leechers) + 4*min(500,num_seeders) - (max(0,min(500,(%d-creation_date)/86400)) ) AS weight
+                SELECT torrent_id,
+                MIN(relevance, 2500) + MIN(500, num_leechers) + 4*MIN(500, num_seeders) - (MAX(0, MIN(500, (? - creation_date)/86400)) ) AS weight
                 FROM CollectedTorrent
-                WHERE torrent_id NOT IN (SELECT torrent_id FROM MyPreference)
+                WHERE 1 %s
                 ORDER BY weight
-                LIMIT %d
-            """ % (int(time()), torrents2del)
-
-        res_list = self._db.fetchall(sql)
-        if len(res_list) == 0:
-            return False
+                LIMIT ?
+            """ % exclusion
+            args = [int(time())] + args + [torrents2del * EVICTION_CANDIDATES_STEPS]
+            self._eviction_candidates = deque(torrent_id for torrent_id, _ in self._db.fetchall(sql, args))
+            self._eviction_candidates_time = time()
 
-        # delete torrents from db
-        sql_del_torrent = u"UPDATE Torrent SET torrent_file_name = NULL WHERE torrent_id = ?"
-        # sql_del_tracker = "delete from TorrentTracker where torrent_id=?"
-        # sql_del_pref = "delete from Preference where torrent_id=?"
-        tids = [(torrent_id,) for torrent_file_name, torrent_id, relevance, weight in res_list]
+        return [self._eviction_candidates.popleft()
+                for _ in xrange(min(torrents2del, len(self._eviction_candidates)))]
 
-        self._db.executemany(sql_del_torrent, tids)
-        # self._db.executemany(sql_del_tracker, tids)
-        # self._db.executemany(sql_del_pref, tids)
+    def freeSpace(self, torrents2del):
+        candidates = self._get_eviction_candidates(torrents2del)
+        if not candidates:
+            return 0
 
-        # but keep the infohash in db to maintain consistence with preference db
-        # torrent_id_infohashes = [(torrent_id,infohash_str,relevance) for torrent_file_name, torrent_id, infohash_str, relevance, weight in res_list]
-        # sql_insert =  "insert into Torrent (torrent_id, infohash, relevance) values (?,?,?)"
-        # self._db.executemany(sql_insert, torrent_id_infohashes)
+        # my preferences and the torrents in my channel may have changed since the candidates were selected, this
+        # only does primary key lookups
+        exclusion, args = self._get_eviction_exclusion()
+        sql = u"SELECT torrent_id, infohash FROM CollectedTorrent WHERE torrent_id IN (%s) %s" % (
+            u",".join(u"?" * len(candidates)), exclusion)
+        res_list = self._db.fetchall(sql, candidates + args)
+        if not res_list:
+            return 0
 
-        deleted = 0  # deleted any file?
-        insert_files = []
+        self._db.executemany(u"UPDATE Torrent SET is_collected = 0 WHERE torrent_id = ?",
+                             [(torrent_id,) for torrent_id, _ in res_list])
 
-        if len(insert_files) > 0:
-            sql_insert_files = "INSERT OR IGNORE INTO TorrentFiles (torrent_id, path, length) VALUES (?,?,?)"
-            self._db.executemany(sql_insert_files, insert_files)
+        reclaimed = 0
+        if self.session.get_torrent_store() and self.session.lm.torrent_store is not None:
+            torrent_store = self.session.lm.torrent_store
+            for _, infohash in res_list:
+                key = hexlify(str2bin(infohash))
+                torrent_data = torrent_store.get(key)
+                if torrent_data is not None:
+                    reclaimed += len(torrent_data)
+                    del torrent_store[key]
 
-        self._logger.info("Erased %d torrents", deleted)
-        return deleted
+        self._logger.info(u"Erased %d torrents, reclaimed %d bytes", len(res_list), reclaimed)
+        return len(res_list)
 
     def searchNames(self, kws, local=True, keys=None, doSort=True):
         assert 'infohash' in keys
@@ -1021,67 +1239,46 @@ class TorrentDBHandler(BasicDBHandler):
 
         return results
 
-    def getAutoCompleteTerms(self, keyword, max_terms, limit=100):
-        sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? LIMIT ?"
-        result = self._db.fetchall(sql, (keyword + '*', limit))
-
-        all_terms = set()
-        for line, in result:
-            if len(all_terms) >= max_terms:
-                break
-            i1 = line.find(keyword)
-            i2 = line.find(' ', i1 + len(keyword))
-            all_terms.add(line[i1:i2] if i2 >= 0 else line[i1:])
+    def _get_suggestion_index(self):
+        # the index is built from the FullTextIndex on first use and kept up to date by _indexTorrent afterwards
+        if not self._suggestion_index.is_loaded:
+            self._suggestion_index.load(self._iter_swarmnames())
+        return self._suggestion_index
 
-        if keyword in all_terms:
-            all_terms.remove(keyword)
-        if '' in all_terms:
-            all_terms.remove('')
+    def _iter_swarmnames(self):
+        # a generator, so that the FullTextIndex is only read by the thread that actually loads the index
+        for swarmname, in self._db.fetchall(u"SELECT swarmname FROM FullTextIndex"):
+            if swarmname:
+                yield swarmname
 
-        return list(all_terms)
+    def getAutoCompleteTerms(self, keyword, max_terms, limit=100):
+        return self._get_suggestion_index().get_completions(keyword.lower(), max_terms, limit)
 
     def getSearchSuggestion(self, keywords, limit=1):
         match = [keyword.lower() for keyword in keywords if len(keyword) > 3]
+        if not match:
+            return []
 
-        def lev(a, b):
-            "Calculates the Levenshtein distance between a and b."
-            n, m = len(a), len(b)
-            if n > m:
-                # Make sure n <= m, to use O(min(n,m)) space
-                a, b = b, a
-                n, m = m, n
-
-            current = range(n + 1)
-            for i in range(1, m + 1):
-                previous, current = current, [i] + [0] * n
-                for j in range(1, n + 1):
-                    add, delete = previous[j] + 1, current[j - 1] + 1
-                    change = previous[j - 1]
-                    if a[j - 1] != b[i - 1]:
-                        change = change + 1
-                    current[j] = min(add, delete, change)
-
-            return current[n]
-
-        def levcollate(s1, s2):
-            l1 = sum(sorted([lev(a, b) for a in s1.split() for b in match])[:len(match)])
-            l2 = sum(sorted([lev(a, b) for a in s2.split() for b in match])[:len(match)])
-
-            # return -1 if s1<s2, +1 if s1>s2 else 0
-            if l1 < l2:
-                return -1
-            if l1 > l2:
-                return 1
-            return 0
+        suggestion_index = self._get_suggestion_index()
+
+        # find the terms in our vocabulary that are close to, or start with, the keywords
+        terms = set()
+        for keyword in match:
+            max_distance = max(1, len(keyword) / SUGGESTION_EDIT_RATIO)
+            similar_terms = suggestion_index.get_similar_terms(keyword, max_distance)
+            terms.update(term for _, term in similar_terms[:MAX_SUGGESTION_TERMS])
+            terms.update(suggestion_index.get_completions(keyword, MAX_SUGGESTION_TERMS))
+        if not terms:
+            return []
 
-        cursor = self._db.get_cursor()
-        connection = cursor.getconnection()
-        connection.createcollation("leven", levcollate)
+        sql = u"SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? LIMIT ?"
+        candidates = set(result[0] for result in self._db.fetchall(
+            sql, (u' OR '.join(terms), MAX_SUGGESTION_CANDIDATES + limit)))
 
-        sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? ORDER By swarmname collate leven ASC LIMIT ?"
-        results = self._db.fetchall(sql, (' OR '.join(['*%s*' % m for m in match]), limit))
-        connection.createcollation("leven", None)
-        return [result[0] for result in results]
+        def levscore(swarmname):
+            return sum(sorted([levenshtein(a, b) for a in swarmname.split() for b in match])[:len(match)])
+
+        return sorted(candidates, key=levscore)[:limit]
 
 
 class MyPreferenceDBHandler(BasicDBHandler):
@@ -1310,6 +1507,9 @@ class ChannelCastDBHandler(BasicDBHandler):
         self.votecast_db = None
         self.torrent_db = None
 
+        # channel_id -> ChannelTorrentSample, only for the channels that were previewed, least recently used first
+        self._channel_samples = OrderedDict()
+
     def initialize(self, *args, **kwargs):
         self._channel_id = self.getMyChannelId()
         self._logger.debug(u"Channels: my channel is %s", self._channel_id)
@@ -1335,6 +1535,7 @@ class ChannelCastDBHandler(BasicDBHandler):
 
         self.votecast_db = None
         self.torrent_db = None
+        self._channel_samples = OrderedDict()
 
     def get_metadata_torrents(self, is_collected=True, limit=20):
         stmt = u"""
@@ -1446,6 +1647,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
         insert_data = []
         updated_channels = {}
+        new_torrents = {}
 
         for i, torrent in enumerate(torrentlist):
             channel_id, dispersy_id, peer_id, infohash, timestamp, name, files, trackers = torrent
@@ -1453,20 +1655,32 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
             # if new or not yet collected
             if infohash in inserted:
-                self.torrent_db.addExternalTorrentNoDef(
-                    infohash, name, files, trackers, timestamp, {'dispersy_id': dispersy_id})
+                new_torrents[infohash] = (torrent_id, infohash, name, files, trackers, timestamp)
 
             insert_data.append((dispersy_id, torrent_id, channel_id, peer_id, name, timestamp))
             updated_channels[channel_id] = updated_channels.get(channel_id, 0) + 1
 
+            if channel_id in self._channel_samples and dispersy_id != -1:
+                self._channel_samples[channel_id].add(timestamp, infohash)
+
         if len(insert_data) > 0:
             sql_insert_torrent = "INSERT INTO _ChannelTorrents (dispersy_id, torrent_id, channel_id, peer_id, name, time_stamp) VALUES (?,?,?,?,?,?)"
             self._db.executemany(sql_insert_torrent, insert_data)
 
+        self.torrent_db.addExternalTorrentsNoDef(new_torrents.values())
+
+        # the ids of all channel torrents in one query, SQLite has no RETURNING clause
+        unique_torrent_ids = list(set(torrent_ids))
+        parameters = u"?," * len(unique_torrent_ids)
+        sql = u"SELECT id, torrent_id, channel_id FROM ChannelTorrents WHERE torrent_id IN (%s)" % parameters[:-1]
+        channel_torrent_ids = {}
+        for channel_torrent_id, torrent_id, channel_id in self._db.fetchall(sql, unique_torrent_ids):
+            channel_torrent_ids.setdefault((channel_id, torrent_id), channel_torrent_id)
+
         updated_channel_torrent_dict = defaultdict(list)
-        for torrent in torrentlist:
-            channel_id, dispersy_id, peer_id, infohash, timestamp, name, files, trackers = torrent
-            channel_torrent_id = self.get_channel_torrent_id(channel_id, infohash)
+        for i, torrent in enumerate(torrentlist):
+            channel_id, infohash = torrent[0], torrent[3]
+            channel_torrent_id = channel_torrent_ids.get((channel_id, torrent_ids[i]))
             updated_channel_torrent_dict[channel_id].append({u'info_hash': infohash,
                                                              u'channel_torrent_id': channel_torrent_id})
 
@@ -1489,6 +1703,8 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         else:
             deleted_at = long(time())
         self._db.execute_write(sql, (deleted_at, channel_id, dispersy_id))
+        # a sample cannot forget a single torrent, it is rebuilt when it is needed again
+        self._channel_samples.pop(channel_id, None)
 
         self.notifier.notify(NTFY_CHANNELCAST, NTFY_UPDATE, channel_id)
 
@@ -1710,12 +1926,47 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         else:
             deleted_at = long(time())
         self._db.execute_write(sql, (deleted_at, dispersy_id, channel_id))
+        self._invalidate_latest_metadata(dispersy_id)
+
+    def get_latest_metadata(self, channel_id, channeltorrent_id, playlist_id, modification_type):
+        """
+        Returns the dispersy_id, prev_global_time and global_time of the latest modification of type
+        MODIFICATION_TYPE of a channel, or of one of its torrents or playlists, or None when it is not known.
+
+        The latest modifications are stored when they are determined, as determining them requires the dispersy
+        messages of all modifications.
+        """
+        sql = u"SELECT dispersy_id, prev_global_time, global_time FROM LatestMetaData " \
+              u"WHERE channel_id = ? AND channeltorrent_id = ? AND playlist_id = ? AND type = ?"
+        return self._db.fetchone(sql, (channel_id, channeltorrent_id or 0, playlist_id or 0, modification_type))
+
+    def set_latest_metadata(self, channel_id, channeltorrent_id, playlist_id, modification_type, dispersy_id,
+                            prev_global_time, global_time):
+        sql = u"INSERT OR REPLACE INTO LatestMetaData (channel_id, channeltorrent_id, playlist_id, type, dispersy_id, " \
+              u"prev_global_time, global_time) VALUES (?, ?, ?, ?, ?, ?, ?)"
+        self._db.execute_write(sql, (channel_id, channeltorrent_id or 0, playlist_id or 0, modification_type,
+                                     dispersy_id, prev_global_time, global_time))
+
+    def _invalidate_latest_metadata(self, dispersy_id):
+        """
+        Forgets the latest modification of the channel, torrent or playlist that the modification DISPERSY_ID
+        modifies, as it has to be determined again when a modification is removed, restored or moderated.
+        """
+        sql = u"SELECT _ChannelMetaData.channel_id, IFNULL(channeltorrent_id, 0), IFNULL(playlist_id, 0), type " \
+              u"FROM _ChannelMetaData " \
+              u"LEFT JOIN MetaDataTorrent ON MetaDataTorrent.metadata_id = _ChannelMetaData.id " \
+              u"LEFT JOIN MetaDataPlaylist ON MetaDataPlaylist.metadata_id = _ChannelMetaData.id " \
+              u"WHERE dispersy_id = ?"
+        sql_delete = u"DELETE FROM LatestMetaData " \
+                     u"WHERE channel_id = ? AND channeltorrent_id = ? AND playlist_id = ? AND type = ?"
+        self._db.executemany(sql_delete, self._db.fetchall(sql, (dispersy_id,)))
 
     def on_moderation(self, channel_id, dispersy_id, peer_id, by_peer_id, cause, message, timestamp, severity):
         sql = """INSERT OR REPLACE INTO _Moderations
         (dispersy_id, channel_id, peer_id, by_peer_id, message, cause, time_stamp, severity)
         VALUES (?,?,?,?,?,?,?,?)"""
         self._db.execute_write(sql, (dispersy_id, channel_id, peer_id, by_peer_id, message, cause, timestamp, severity))
+        self._invalidate_latest_metadata(cause)
 
         self.notifier.notify(NTFY_MODERATIONS, NTFY_INSERT, channel_id)
 
@@ -1727,6 +1978,10 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             deleted_at = long(time())
         self._db.execute_write(sql, (deleted_at, dispersy_id, channel_id))
 
+        cause = self._db.fetchone(u"SELECT cause FROM _Moderations WHERE dispersy_id = ?", (dispersy_id,))
+        if cause:
+            self._invalidate_latest_metadata(cause)
+
     def on_mark_torrent(self, channel_id, dispersy_id, global_time, peer_id, infohash, type, timestamp):
         channeltorrent_id = self.addOrGetChannelTorrentID(channel_id, infohash)
 
@@ -1800,31 +2055,60 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         sql = "select count(DISTINCT id) from Channels LIMIT 1"
         return self._db.fetchone(sql)
 
+    def _get_channel_sample(self, channel_id):
+        sample = self._channel_samples.pop(channel_id, None)
+        if sample is None:
+            if len(self._channel_samples) >= MAX_CHANNEL_SAMPLES:
+                self._channel_samples.popitem(last=False)
+            sample = ChannelTorrentSample()
+            sql = """SELECT time_stamp, infohash FROM ChannelTorrents, Torrent
+            WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND ChannelTorrents.channel_id = ?
+            AND ChannelTorrents.dispersy_id <> -1"""
+            for time_stamp, infohash in self._db.fetchall(sql, (channel_id,)):
+                sample.add(time_stamp, str2bin(infohash))
+        self._channel_samples[channel_id] = sample
+        return sample
+
+    def _get_recent_and_random(self, channels, nr_recent, nr_random, torrent_dict):
+        """
+        Adds the nr_recent most recent torrents of the given channels to torrent_dict. If there are more torrents,
+        nr_random torrents are sampled from the older ones. The reservoir torrents are weighted by the number of older
+        torrents they stand for, so that every older torrent has about the same chance to be selected, like it had
+        with ORDER BY random() over all of them.
+        @param channels: list of (channel_id, dispersy_cid) tuples
+        @return: the number of recent torrents found
+        """
+        samples = [(self._get_channel_sample(channel_id), cid) for channel_id, cid in channels]
+        recent = []
+        for sample, cid in samples:
+            for time_stamp, infohash in sample.recent:
+                recent.append((time_stamp, infohash, cid))
+        recent = nlargest(nr_recent, recent)
+
+        for _, infohash, cid in recent:
+            torrent_dict.setdefault(str(cid), set()).add(infohash)
+
+        if recent and len(recent) == nr_recent and nr_random > 0:
+            least_recent = recent[-1][0]
+            older = [(weight, (infohash, cid)) for sample, cid in samples
+                     for weight, (_, infohash) in sample.get_older(least_recent)]
+            for infohash, cid in weighted_sample(older, nr_random):
+                torrent_dict.setdefault(str(cid), set()).add(infohash)
+        return len(recent)
+
     def getRecentAndRandomTorrents(self, NUM_OWN_RECENT_TORRENTS=15, NUM_OWN_RANDOM_TORRENTS=10,
                                    NUM_OTHERS_RECENT_TORRENTS=15, NUM_OTHERS_RANDOM_TORRENTS=10,
                                    NUM_OTHERS_DOWNLOADED=5):
+        """
+        Selects the torrents that are sent in a channelcast message. Instead of sorting the channel torrents with
+        ORDER BY random() every time, the torrents are taken from a ChannelTorrentSample of each channel, which
+        is kept up to date as torrents arrive.
+        """
         torrent_dict = {}
 
-        least_recent = -1
-        sql = """SELECT dispersy_cid, infohash, time_stamp from ChannelTorrents, Channels, Torrent
-        WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-        AND ChannelTorrents.channel_id==? and ChannelTorrents.dispersy_id <> -1 order by time_stamp desc limit ?"""
-        myrecenttorrents = self._db.fetchall(sql, (self._channel_id, NUM_OWN_RECENT_TORRENTS))
-        for cid, infohash, timestamp in myrecenttorrents:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
-            least_recent = timestamp
-
-        if len(myrecenttorrents) == NUM_OWN_RECENT_TORRENTS and least_recent != -1:
-            sql = """SELECT dispersy_cid, infohash from ChannelTorrents, Channels, Torrent
-            WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-            AND ChannelTorrents.channel_id==? AND time_stamp<?
-            AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
-            myrandomtorrents = self._db.fetchall(sql, (self._channel_id, least_recent, NUM_OWN_RANDOM_TORRENTS))
-            for cid, infohash, _ in myrecenttorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
-
-            for cid, infohash in myrandomtorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+        if self._channel_id is not None:
+            my_channel = self._db.fetchall("SELECT id, dispersy_cid FROM Channels WHERE id = ?", (self._channel_id,))
+            self._get_recent_and_random(my_channel, NUM_OWN_RECENT_TORRENTS, NUM_OWN_RANDOM_TORRENTS, torrent_dict)
 
         nr_records = sum(len(torrents) for torrents in torrent_dict.values())
         additionalSpace = (NUM_OWN_RECENT_TORRENTS + NUM_OWN_RANDOM_TORRENTS) - nr_records
@@ -1838,25 +2122,11 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             NUM_OWN_RECENT_TORRENTS -= additionalSpace / 2
             NUM_OWN_RANDOM_TORRENTS -= additionalSpace - (additionalSpace / 2)
 
-        least_recent = -1
-        sql = """SELECT dispersy_cid, infohash, time_stamp from ChannelTorrents, Channels, Torrent
-        WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-        AND ChannelTorrents.channel_id in (select channel_id from ChannelVotes
-        WHERE voter_id ISNULL AND vote=2) and ChannelTorrents.dispersy_id <> -1 ORDER BY time_stamp desc limit ?"""
-        othersrecenttorrents = self._db.fetchall(sql, (NUM_OTHERS_RECENT_TORRENTS,))
-        for cid, infohash, timestamp in othersrecenttorrents:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
-            least_recent = timestamp
-
-        if othersrecenttorrents and len(othersrecenttorrents) == NUM_OTHERS_RECENT_TORRENTS and least_recent != -1:
-            sql = """SELECT dispersy_cid, infohash FROM ChannelTorrents, Channels, Torrent
-            WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-            AND ChannelTorrents.channel_id in (select channel_id from ChannelVotes
-            WHERE voter_id ISNULL and vote=2) and time_stamp < ?
-            AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
-            othersrandomtorrents = self._db.fetchall(sql, (least_recent, NUM_OTHERS_RANDOM_TORRENTS))
-            for cid, infohash in othersrandomtorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+        sql = """SELECT id, dispersy_cid FROM Channels WHERE id in (SELECT channel_id FROM ChannelVotes
+        WHERE voter_id ISNULL AND vote=2)"""
+        favorite_channels = self._db.fetchall(sql)
+        self._get_recent_and_random(favorite_channels, NUM_OTHERS_RECENT_TORRENTS, NUM_OTHERS_RANDOM_TORRENTS,
+                                    torrent_dict)
 
         twomonthsago = long(time() - 5259487)
         nr_records = sum(len(torrents) for torrents in torrent_dict.values())
@@ -1864,14 +2134,10 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
                            NUM_OTHERS_RECENT_TORRENTS + NUM_OTHERS_RANDOM_TORRENTS) - nr_records
         NUM_OTHERS_DOWNLOADED += additionalSpace
 
-        sql = """SELECT dispersy_cid, infohash from ChannelTorrents, Channels, Torrent
-        WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
-        AND ChannelTorrents.channel_id in (select distinct channel_id from ChannelTorrents
-        WHERE torrent_id in (select torrent_id from MyPreference))
-        AND ChannelTorrents.dispersy_id <> -1 and Channels.modified > ? order by time_stamp desc limit ?"""
-        interesting_records = self._db.fetchall(sql, (twomonthsago, NUM_OTHERS_DOWNLOADED))
-        for cid, infohash in interesting_records:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+        sql = """SELECT id, dispersy_cid FROM Channels WHERE id in (SELECT DISTINCT channel_id FROM ChannelTorrents
+        WHERE torrent_id in (SELECT torrent_id FROM MyPreference)) AND modified > ?"""
+        interesting_channels = self._db.fetchall(sql, (twomonthsago,))
+        self._get_recent_and_random(interesting_channels, NUM_OTHERS_DOWNLOADED, 0, torrent_dict)
 
         return torrent_dict
 
@@ -1891,6 +2157,18 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
         return self.__fixTorrent(keys, result)
 
+    def getDispersyIdsFromChannelId(self, channel_id, infohashes):
+        """
+        Returns a dictionary with the dispersy ids of the torrents in the channel by infohash, infohashes that are not
+        in the channel are left out.
+        """
+        parameters = '?,' * len(infohashes)
+        sql = u"""SELECT infohash, ChannelTorrents.dispersy_id FROM Torrent, ChannelTorrents
+              WHERE Torrent.torrent_id = ChannelTorrents.torrent_id AND channel_id = ? AND infohash IN (%s)""" % \
+            parameters[:-1]
+        results = self._db.fetchall(sql, [channel_id] + [bin2str(infohash) for infohash in infohashes])
+        return dict((str2bin(infohash), dispersy_id) for infohash, dispersy_id in results)
+
     def getChannelTorrents(self, infohash, keys):
         sql = "SELECT " ", ".join(keys) + """ FROM Torrent, ChannelTorrents
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id AND infohash = ?"""
@@ -8,6 +8,7 @@
 # 26 is used by Tribler 6.5-git (with database upgrade scripts)
 # 27 is used by Tribler 6.5-git (TorrentStatus and Category tables are removed)
 # 28 is used by Tribler 6.5-git (cleanup Metadata stuff)
+# 29 is used by Tribler 6.5-git (LatestMetaData table)
 
 TRIBLER_59_DB_VERSION = 17
 TRIBLER_60_DB_VERSION = 17
@@ -25,9 +26,10 @@ TRIBLER_65PRE_DB_VERSION = 25
 TRIBLER_65PRE2_DB_VERSION = 26
 TRIBLER_65PRE3_DB_VERSION = 27
 TRIBLER_65PRE4_DB_VERSION = 28
+TRIBLER_65PRE5_DB_VERSION = 29
 
 # the lowest supported database version number
 LOWEST_SUPPORTED_DB_VERSION = TRIBLER_59_DB_VERSION
 
 # the latest database version number
-LATEST_DB_VERSION = TRIBLER_65PRE4_DB_VERSION
+LATEST_DB_VERSION = TRIBLER_65PRE5_DB_VERSION
@@ -3,43 +3,103 @@ import json
 import logging
 import os
 
+# the number of journaled keys after which save() rewrites the cache file and truncates the journal
+JOURNAL_COMPACT_THRESHOLD = 1000
+
 
 class SimpleCache(object):
     """
     This is a cache for recording the keys that we have seen before.
+
+    The keys are stored as a JSON list in the cache file. Keys added after the last compaction are appended to
+    a journal file, one JSON string per line, so saving the cache does not rewrite the whole file.
     """
     def __init__(self, file_path):
         self._logger = logging.getLogger(self.__class__.__name__)
         self._file_path = file_path
+        self._journal_path = file_path + u".journal"
 
-        self._cache_list = list()
-        self._initial_cache_size = 0
+        self._cache_set = set()
+        self._pending_keys = []
+        self._journal_size = 0
+        self._journal_corrupt = False
+
+    def __len__(self):
+        return len(self._cache_set)
 
     def add(self, key):
         if not self.has(key):
-            self._cache_list.append(key)
+            self._cache_set.add(key)
+            self._pending_keys.append(key)
 
     def has(self, key):
-        return key in self._cache_list
+        return key in self._cache_set
 
     def load(self):
+        self._cache_set = set()
+        self._pending_keys = []
+        self._journal_size = 0
+        self._journal_corrupt = False
+
         if os.path.exists(self._file_path):
             try:
                 with codecs.open(self._file_path, 'rb', encoding='utf-8') as f:
-                    self._cache_list = json.load(f)
+                    self._cache_set.update(json.load(f))
             except Exception as e:
                 self._logger.error(u"Failed to load cache file %s: %s", self._file_path, repr(e))
-        else:
-            self._cache_list = list()
-        self._initial_cache_size = len(self._cache_list)
+
+        if os.path.exists(self._journal_path):
+            try:
+                with codecs.open(self._journal_path, 'rb', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            self._cache_set.add(json.loads(line))
+                            self._journal_size += 1
+            except ValueError:
+                # the last line may have been cut off when Tribler was killed while saving
+                self._logger.warning(u"Ignoring the rest of corrupt journal %s", self._journal_path)
+                self._journal_corrupt = True
+            except Exception as e:
+                self._logger.error(u"Failed to load journal file %s: %s", self._journal_path, repr(e))
 
     def save(self):
-        if self._initial_cache_size == len(self._cache_list):
+        if not self._pending_keys and not self._journal_corrupt:
+            return
+
+        # appending to a corrupt journal would hide the new keys behind the corrupt line
+        if self._journal_corrupt or self._journal_size + len(self._pending_keys) >= JOURNAL_COMPACT_THRESHOLD:
+            self.compact()
+            return
+
+        try:
+            with codecs.open(self._journal_path, 'ab', encoding='utf-8') as f:
+                f.write(u''.join(json.dumps(key) + u'\n' for key in self._pending_keys))
+        except Exception as e:
+            self._logger.error(u"Failed to save journal file %s: %s", self._journal_path, repr(e))
             return
+
+        self._journal_size += len(self._pending_keys)
+        self._pending_keys = []
+
+    def compact(self):
+        """
+        Writes all keys to the cache file and removes the journal.
+        """
+        tmp_path = self._file_path + u".tmp"
         try:
-            with codecs.open(self._file_path, 'wb', encoding='utf-8') as f:
-                json.dump(self._cache_list, f)
-                self._initial_cache_size = len(self._cache_list)
+            with codecs.open(tmp_path, 'wb', encoding='utf-8') as f:
+                json.dump(list(self._cache_set), f)
+            if os.path.exists(self._file_path):
+                # os.rename does not replace existing files on Windows
+                os.remove(self._file_path)
+            os.rename(tmp_path, self._file_path)
+            if os.path.exists(self._journal_path):
+                os.remove(self._journal_path)
         except Exception as e:
             self._logger.error(u"Failed to save cache file %s: %s", self._file_path, repr(e))
             return
+
+        self._journal_size = 0
+        self._journal_corrupt = False
+        self._pending_keys = []
@@ -8,6 +8,7 @@ import os
 import re
 import feedparser
 
+from twisted.internet.defer import DeferredSemaphore
 from twisted.web.client import getPage
 
 from Tribler.dispersy.taskmanager import TaskManager
@@ -20,6 +21,7 @@ from Tribler.Core.Modules.channel.cache import SimpleCache
 from Tribler.Core.Utilities.twisted_thread import reactor
 
 DEFAULT_CHECK_INTERVAL = 1800  # half an hour
+MAX_CONCURRENT_FETCHES = 5
 
 
 class ChannelRssParser(TaskManager):
@@ -37,6 +39,10 @@ class ChannelRssParser(TaskManager):
         self._url_cache = None
 
         self._pending_metadata_requests = {}
+        self._pending_torrent_urls = set()
+
+        self._rss_parser = RSSFeedParser()
+        self._fetch_semaphore = DeferredSemaphore(MAX_CONCURRENT_FETCHES)
 
         self._to_stop = False
 
@@ -84,14 +90,19 @@ class ChannelRssParser(TaskManager):
         self.session = None
 
     def _task_scrape(self):
-        rss_parser = RSSFeedParser()
-
-        for rss_item in rss_parser.parse(self.rss_url, self._url_cache):
+        for rss_item in self._rss_parser.parse(self.rss_url, self._url_cache):
             if self._to_stop:
                 return
 
-            torrent_deferred = getPage(rss_item[u'torrent_url'].encode('utf-8'))
-            torrent_deferred.addCallback(lambda t, r=rss_item: self.on_got_torrent(t, rss_item=r))
+            # the item may still be downloading since the previous scrape
+            torrent_url = rss_item[u'torrent_url']
+            if torrent_url in self._pending_torrent_urls:
+                continue
+            self._pending_torrent_urls.add(torrent_url)
+
+            torrent_deferred = self._fetch(torrent_url)
+            torrent_deferred.addCallbacks(lambda t, r=rss_item: self.on_got_torrent(t, rss_item=r),
+                                          lambda f, r=rss_item: self.on_fetch_failed(f, rss_item=r))
 
         if not self._to_stop:
             # schedule the next scraping task
@@ -99,9 +110,24 @@ class ChannelRssParser(TaskManager):
             self.register_task(u'rss_scrape',
                                reactor.callLater(self.check_interval, self._task_scrape))
 
+    def _fetch(self, url):
+        """
+        Downloads the given url, at most MAX_CONCURRENT_FETCHES downloads run at the same time.
+        """
+        return self._fetch_semaphore.run(getPage, url.encode('utf-8'))
+
+    def on_fetch_failed(self, failure, rss_item=None):
+        if self._to_stop:
+            return
+        self._pending_torrent_urls.discard(rss_item[u'torrent_url'])
+        self._logger.warning(u"Failed to fetch %s: %s", rss_item[u'torrent_url'], failure.getErrorMessage())
+        # retry the item on the next scrape, even if the feed itself did not change
+        self._rss_parser.forget_validators(self.rss_url)
+
     def on_got_torrent(self, torrent_data, rss_item=None):
         if self._to_stop:
             return
+        self._pending_torrent_urls.discard(rss_item[u'torrent_url'])
 
         # save torrent
         tdef = TorrentDef.load_from_memory(torrent_data)
@@ -134,7 +160,7 @@ class ChannelRssParser(TaskManager):
                 rss_item[u'info_hash'] = data[u'info_hash']
                 rss_item[u'channel_torrent_id'] = data[u'channel_torrent_id']
 
-                metadata_deferred = getPage(rss_item[u'thumbnail_url'].encode('utf-8'))
+                metadata_deferred = self._fetch(rss_item[u'thumbnail_url'])
                 metadata_deferred.addCallback(lambda md, r=rss_item: self.on_got_metadata(md, rss_item=r))
 
     def on_got_metadata(self, metadata_data, rss_item=None):
@@ -152,6 +178,15 @@ class ChannelRssParser(TaskManager):
 
 class RSSFeedParser(object):
 
+    def __init__(self):
+        # url -> (etag, modified) of the last response, used to make conditional requests
+        self._feed_validators = {}
+
+    def forget_validators(self, url):
+        """Makes the next parse of url fetch the whole feed again.
+        """
+        self._feed_validators.pop(url, None)
+
     def _parse_html(self, content):
         """Parses an HTML content and find links.
         """
@@ -197,8 +232,13 @@ class RSSFeedParser(object):
 
     def parse(self, url, cache):
         """Parses a RSS feed. This methods supports RSS 2.0 and Media RSS.
+        Nothing is returned if the feed did not change since the previous call.
         """
-        feed = feedparser.parse(url)
+        etag, modified = self._feed_validators.get(url, (None, None))
+        feed = feedparser.parse(url, etag=etag, modified=modified)
+        if feed.get(u'status') == 304:
+            return
+        self._feed_validators[url] = (feed.get(u'etag'), feed.get(u'modified'))
 
         for item in feed.entries:
             # ignore the ones that we have seen before
@@ -16,6 +16,7 @@ from twisted.internet.task import LoopingCall
 
 from Tribler.Core.TFTP.handler import METADATA_PREFIX
 from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.Utilities.recently_requested import RecentlyRequested
 from Tribler.Core.simpledefs import INFOHASH_LENGTH, NTFY_TORRENTS
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import call_on_reactor_thread
@@ -48,6 +49,10 @@ class RemoteTorrentHandler(TaskManager):
         self.magnet_requesters = {}
         self.metadata_requester = None
 
+        # the torrents requested by the channel and search communities, shared to not request them twice
+        self.recently_requested = RecentlyRequested(session.get_recently_requested_size(),
+                                                    session.get_recently_requested_ttl())
+
         self.num_torrents = 0
 
         self.session = session
@@ -260,7 +265,10 @@ class RemoteTorrentHandler(TaskManager):
                        qname, pending_requests, success, failed, total_requests)
         return [(qstring, qtooltip) for qstring, qtooltip in [getQueueSuccess("TFTP", self.torrent_requesters),
                                                               getQueueSuccess("DHT", self.magnet_requesters),
-                                                              getQueueSuccess("Msg", self.torrent_message_requesters)] if qstring]
+                                                              getQueueSuccess("Msg", self.torrent_message_requesters)] if qstring] + \
+            [("Dup: %d" % self.recently_requested.nr_duplicates,
+              "Dup: skipped %d duplicate requests, %d torrents requested recently" % (
+                  self.recently_requested.nr_duplicates, len(self.recently_requested)))]
 
     def getBandwidthSpent(self):
         def getQueueBW(qname, requesters):
@@ -412,6 +412,28 @@ class SessionConfigInterface(object):
         @return A number of megabytes. """
         return self.sessconfig.get(u'torrent_collecting', u'stop_collecting_threshold')
 
+    def set_recently_requested_size(self, value):
+        """ Set the number of recently requested torrents that are not requested from other peers again.
+        @param value A number of torrents.
+        """
+        self.sessconfig.set(u'torrent_collecting', u'recently_requested_size', value)
+
+    def get_recently_requested_size(self):
+        """ Returns the number of recently requested torrents that are not requested again.
+        @return A number of torrents. """
+        return self.sessconfig.get(u'torrent_collecting', u'recently_requested_size')
+
+    def set_recently_requested_ttl(self, value):
+        """ Set how long a requested torrent is not requested from other peers again.
+        @param value A number of seconds.
+        """
+        self.sessconfig.set(u'torrent_collecting', u'recently_requested_ttl', value)
+
+    def get_recently_requested_ttl(self):
+        """ Returns how long a requested torrent is not requested again.
+        @return A number of seconds. """
+        return self.sessconfig.get(u'torrent_collecting', u'recently_requested_ttl')
+
     #
     # Tribler's social networking feature transmits a nickname and picture
     # to all Tribler peers it meets.
@@ -617,6 +639,19 @@ class SessionConfigInterface(object):
         """
         self.sessconfig.set(u'allchannel_community', u'enabled', mode)
 
+    def get_max_preview_communities(self):
+        """ Gets the number of preview channel communities that are loaded at once.
+        :return: A number of communities.
+        """
+        return self.sessconfig.get(u'allchannel_community', u'max_preview_communities')
+
+    def set_max_preview_communities(self, value):
+        """ Sets the number of preview channel communities that are loaded at once, the least recently used ones
+        are unloaded first.
+        :param value: A number of communities.
+        """
+        self.sessconfig.set(u'allchannel_community', u'max_preview_communities', value)
+
     def get_enable_metadata(self):
         """
         Gets if to enable metadata.
@@ -81,6 +81,10 @@ class DBUpgrader(object):
         if self.db.version == 27:
             self._upgrade_27_to_28()
 
+        # version 28 -> 29
+        if self.db.version == 28:
+            self._upgrade_28_to_29()
+
         # check if we managed to upgrade to the latest DB version.
         if self.db.version == LATEST_DB_VERSION:
             self.status_update_func(u"Database upgrade finished.")
@@ -517,6 +521,27 @@ DROP TABLE IF EXISTS MetaDataTypes;
         # update database version
         self.db.write_version(28)
 
+    def _upgrade_28_to_29(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (28, 29))
+
+        # the latest modifications are determined again when they are needed, so the table starts empty
+        self.db.execute(u"""
+CREATE TABLE IF NOT EXISTS LatestMetaData (
+  channel_id            integer         NOT NULL,
+  channeltorrent_id     integer         NOT NULL DEFAULT (0),
+  playlist_id           integer         NOT NULL DEFAULT (0),
+  type                  text            NOT NULL,
+  dispersy_id           integer         NOT NULL,
+  prev_global_time      integer,
+  global_time           integer,
+  PRIMARY KEY (channel_id, channeltorrent_id, playlist_id, type)
+);
+CREATE INDEX IF NOT EXISTS LaMeDispersyIndex ON LatestMetaData(dispersy_id);
+""")
+
+        # update database version
+        self.db.write_version(29)
+
     def reimport_torrents(self):
         """Import all torrent files in the collected torrent dir, all the files already in the database will be ignored.
         """
@@ -1,128 +1,15 @@
 import logging
+import re
+from itertools import chain
 
 logger = logging.getLogger(__name__)
 
-
-def _a_encode_int(value, mapping):
-    """
-    42 --> ('2', 'i', '42')
-    """
-    assert isinstance(value, int), "VALUE has invalid type: %s" % type(value)
-    value = str(value).encode("UTF-8")
-    return str(len(value)).encode("UTF-8"), "i", value
-
-
-def _a_encode_long(value, mapping):
-    """
-    42 --> ('2', 'J', '42')
-    """
-    assert isinstance(value, long), "VALUE has invalid type: %s" % type(value)
-    value = str(value).encode("UTF-8")
-    return str(len(value)).encode("UTF-8"), "J", value
-
-
-def _a_encode_float(value, mapping):
-    """
-    4.2 --> ('3', 'f', '4.2')
-    """
-    assert isinstance(value, float), "VALUE has invalid type: %s" % type(value)
-    value = str(value).encode("UTF-8")
-    return str(len(value)).encode("UTF-8"), "f", value
-
-
-def _a_encode_unicode(value, mapping):
-    """
-    'foo-bar' --> ('7', 's', 'foo-bar')
-    """
-    assert isinstance(value, unicode), "VALUE has invalid type: %s" % type(value)
-    value = value.encode("UTF-8")
-    return str(len(value)).encode("UTF-8"), "s", value
-
-
-def _a_encode_bytes(value, mapping):
-    """
-    'foo-bar' --> ('7', 'b', 'foo-bar')
-    """
-    assert isinstance(value, bytes), "VALUE has invalid type: %s" % type(value)
-    return str(len(value)).encode("UTF-8"), "b", value
-
-
-def _a_encode_list(values, mapping):
-    """
-    [1,2,3] --> ['3', 'l', '1', 'i', '1', '1', 'i', '2', '1', 'i', '3']
-    """
-    assert isinstance(values, list), "VALUE has invalid type: %s" % type(values)
-    encoded = [str(len(values)).encode("UTF-8"), "l"]
-    extend = encoded.extend
-    for value in values:
-        extend(mapping[type(value)](value, mapping))
-    return encoded
-
-
-def _a_encode_set(values, mapping):
-    """
-    [1,2,3] --> ['3', 'l', '1', 'i', '1', '1', 'i', '2', '1', 'i', '3']
-    """
-    assert isinstance(values, set), "VALUE has invalid type: %s" % type(values)
-    encoded = [str(len(values)).encode("UTF-8"), "L"]
-    extend = encoded.extend
-    for value in values:
-        extend(mapping[type(value)](value, mapping))
-    return encoded
-
-
-def _a_encode_tuple(values, mapping):
-    """
-    (1,2) --> ['2', 't', '1', 'i', '1', '1', 'i', '2']
-    """
-    assert isinstance(values, tuple), "VALUE has invalid type: %s" % type(values)
-    encoded = [str(len(values)).encode("UTF-8"), "t"]
-    extend = encoded.extend
-    for value in values:
-        extend(mapping[type(value)](value, mapping))
-    return encoded
-
-
-def _a_encode_dictionary(values, mapping):
-    """
-    {'foo':'bar', 'moo':'milk'} --> ['2', 'd', '3', 's', 'foo', '3', 's', 'bar', '3', 's', 'moo', '4', 's', 'milk']
-    """
-    assert isinstance(values, dict), "VALUE has invalid type: %s" % type(values)
-    encoded = [str(len(values)).encode("UTF-8"), "d"]
-    extend = encoded.extend
-    for key, value in sorted(values.items()):
-        assert type(key) in mapping, (key, values)
-        assert type(value) in mapping, (value, values)
-        extend(mapping[type(key)](key, mapping))
-        extend(mapping[type(value)](value, mapping))
-    return encoded
-
-
-def _a_encode_none(value, mapping):
-    """
-    None --> ['0', 'n']
-    """
-    return ['0n']
-
-
-def _a_encode_bool(value, mapping):
-    """
-    True  --> ['0', 'T']
-    False --> ['0', 'F']
-    """
-    return ['0T' if value else '0F']
-
-_a_encode_mapping = {int: _a_encode_int,
-                     long: _a_encode_long,
-                     float: _a_encode_float,
-                     unicode: _a_encode_unicode,
-                     str: _a_encode_bytes,
-                     list: _a_encode_list,
-                     set: _a_encode_set,
-                     tuple: _a_encode_tuple,
-                     dict: _a_encode_dictionary,
-                     type(None): _a_encode_none,
-                     bool: _a_encode_bool}
+# every value starts with its length, or number of items, in decimal followed by a character giving its type
+_a_header = re.compile("([0-9]+)(.)", re.DOTALL)
+# the headers with one or two digits, which are nearly all of them, looked up without the regular expression
+_a_short_headers = dict(("%d%s" % (count, kind), (count, kind, 2)) for count in xrange(10) for kind in "ilLtdbsJfnTF")
+_a_short_headers.update(("%02d%s" % (count, kind), (count, kind, 3))
+                        for count in xrange(100) for kind in "ilLtdbsJfnTF")
 
 
 def bytes_to_uint(stream, offset=0):
@@ -154,165 +41,80 @@ def encode(data, version="a"):
 
     The encoding process is done using version 'a' which is
     indicated by the first byte of the resulting binary stream.
-    """
-    assert isinstance(version, str)
-    if version == "a":
-        return "a" + "".join(_a_encode_mapping[type(data)](data, _a_encode_mapping))
-
-    raise ValueError("Unknown encode version")
-
 
-def _a_decode_int(stream, offset, count, _):
+    Containers are walked with a stack of iterators instead of recursion, and all parts are joined into the stream
+    once at the end:
+    42 --> 'a2i42'
+    [u'foo', None] --> 'a2l3sfoo0n'
+    {'foo': True} --> 'a1d3bfoo0T'
     """
-    'a2i42',3,2 --> 5,42
-    """
-    return offset + count, int(stream[offset:offset + count])
-
-
-def _a_decode_long(stream, offset, count, _):
-    """
-    'a2J42',3,2 --> 5,42
-    """
-    return offset + count, long(stream[offset:offset + count])
-
-
-def _a_decode_float(stream, offset, count, _):
-    """
-    'a3f4.2',3,3 --> 6,4.2
-    """
-    return offset + count, float(stream[offset:offset + count])
-
-
-def _a_decode_unicode(stream, offset, count, _):
-    """
-    'a3sbar',3,3 --> 6,u'bar'
-    """
-    if len(stream) >= offset + count:
-        return offset + count, stream[offset:offset + count].decode("UTF-8")
-    else:
-        raise ValueError("Invalid stream length", len(stream), offset + count)
-
-
-def _a_decode_bytes(stream, offset, count, _):
-    """
-    'a3bfoo',3,3 --> 6,'foo'
-    """
-    if len(stream) >= offset + count:
-        return offset + count, stream[offset:offset + count]
-    else:
-        raise ValueError("Invalid stream length", len(stream), offset + count)
-
-
-def _a_decode_list(stream, offset, count, mapping):
-    """
-    'a1l3i123',3,1 --> 8,[123]
-    'a2l1i41i2',3,1 --> 8,[4,2]
-    """
-    container = []
-    for _ in range(count):
-
-        index = offset
-        while 48 <= ord(stream[index]) <= 57:
-            index += 1
-        offset, value = mapping[stream[index]](stream, index + 1, int(stream[offset:index]), mapping)
-        container.append(value)
-
-    return offset, container
-
-
-def _a_decode_set(stream, offset, count, mapping):
-    """
-    'a1L3i123',3,1 --> 8,set(123)
-    'a2L1i41i2',3,1 --> 8,set(4,2)
-    """
-    container = set()
-    for _ in range(count):
-
-        index = offset
-        while 48 <= ord(stream[index]) <= 57:
-            index += 1
-        offset, value = mapping[stream[index]](stream, index + 1, int(stream[offset:index]), mapping)
-        container.add(value)
-
-    return offset, container
-
-
-def _a_decode_tuple(stream, offset, count, mapping):
-    """
-    'a1t3i123',3,1 --> 8,[123]
-    'a2t1i41i2',3,1 --> 8,[4,2]
-    """
-    container = []
-    for _ in range(count):
-
-        index = offset
-        while 48 <= ord(stream[index]) <= 57:
-            index += 1
-        offset, value = mapping[stream[index]](stream, index + 1, int(stream[offset:index]), mapping)
-        container.append(value)
-
-    return offset, tuple(container)
-
-
-def _a_decode_dictionary(stream, offset, count, mapping):
-    """
-    'a2d3sfoo3sbar3smoo4smilk',3,2 -> 24,{'foo':'bar', 'moo':'milk'}
-    """
-    container = {}
-    for _ in range(count):
-
-        index = offset
-        while 48 <= ord(stream[index]) <= 57:
-            index += 1
-        offset, key = mapping[stream[index]](stream, index + 1, int(stream[offset:index]), mapping)
-
-        index = offset
-        while 48 <= ord(stream[index]) <= 57:
-            index += 1
-        offset, value = mapping[stream[index]](stream, index + 1, int(stream[offset:index]), mapping)
-
-        container[key] = value
-
-    if len(container) < count:
+    assert isinstance(version, str)
+    if version != "a":
+        raise ValueError("Unknown encode version")
+
+    parts = ["a"]
+    append = parts.append
+    extend = parts.extend
+    stack = [iter((data,))]
+    while stack:
+        for value in stack[-1]:
+            value_type = type(value)
+            if value_type is str:
+                extend((str(len(value)), "b", value))
+            elif value_type is unicode:
+                value = value.encode("UTF-8")
+                extend((str(len(value)), "s", value))
+            elif value_type is int:
+                value = str(value)
+                extend((str(len(value)), "i", value))
+            elif value_type is long:
+                value = str(value)
+                extend((str(len(value)), "J", value))
+            elif value_type is float:
+                value = str(value)
+                extend((str(len(value)), "f", value))
+            elif value_type is bool:
+                append("0T" if value else "0F")
+            elif value is None:
+                append("0n")
+            elif value_type is tuple:
+                extend((str(len(value)), "t"))
+                stack.append(iter(value))
+                break
+            elif value_type is list:
+                extend((str(len(value)), "l"))
+                stack.append(iter(value))
+                break
+            elif value_type is dict:
+                extend((str(len(value)), "d"))
+                stack.append(chain.from_iterable(sorted(value.items())))
+                break
+            elif value_type is set:
+                extend((str(len(value)), "L"))
+                stack.append(iter(value))
+                break
+            else:
+                raise KeyError(value_type)
+        else:
+            stack.pop()
+
+    return "".join(parts)
+
+
+def _a_decode_container(kind, items):
+    """
+    Returns the set or dictionary of type KIND holding ITEMS, where the items of a dictionary alternate between keys
+    and values.
+    """
+    try:
+        if kind == "L":
+            return set(items)
+        container = dict(zip(items[::2], items[1::2]))
+    except TypeError:
+        raise ValueError("Unhashable item in container")
+    if len(container) * 2 < len(items):
         raise ValueError("Duplicate key in dictionary")
-    return offset, container
-
-
-def _a_decode_none(stream, offset, count, mapping):
-    """
-    'a0n',3,0 -> 3,None
-    """
-    assert count == 0
-    return offset, None
-
-
-def _a_decode_true(stream, offset, count, mapping):
-    """
-    'a0T',3,1 -> 3,True
-    """
-    assert count == 0
-    return offset, True
-
-
-def _a_decode_false(stream, offset, count, mapping):
-    """
-    'a0F',3,1 -> 3,False
-    """
-    assert count == 0
-    return offset, False
-
-_a_decode_mapping = {"i": _a_decode_int,
-                     "J": _a_decode_long,
-                     "f": _a_decode_float,
-                     "s": _a_decode_unicode,
-                     "b": _a_decode_bytes,
-                     "l": _a_decode_list,
-                     "L": _a_decode_set,
-                     "t": _a_decode_tuple,
-                     "d": _a_decode_dictionary,
-                     "n": _a_decode_none,
-                     "T": _a_decode_true,
-                     "F": _a_decode_false}
+    return container
 
 
 def decode(stream, offset=0):
@@ -324,13 +126,92 @@ def decode(stream, offset=0):
 
     Only version 'a' decoding is supported.  This version is
     indicated by the first byte in the binary STREAM.
+
+    Containers are decoded with a stack of the partially filled containers instead of recursion, and a malformed
+    STREAM always raises ValueError:
+    'a2i42' --> 5,42
+    'a2l1i41i2' --> 9,[4,2]
+    'a2d3sfoo3sbar3smoo4smilk' --> 24,{u'foo':u'bar', u'moo':u'milk'}
     """
     assert isinstance(stream, bytes), "STREAM has invalid type: %s" % type(stream)
     assert isinstance(offset, int), "OFFSET has invalid type: %s" % type(offset)
-    if stream[offset] == "a":
-        index = offset + 1
-        while 48 <= ord(stream[index]) <= 57:
-            index += 1
-        return _a_decode_mapping[stream[index]](stream, index + 1, int(stream[offset + 1:index]), _a_decode_mapping)
-
-    raise ValueError("Unknown version found")
+    if stream[offset:offset + 1] != "a":
+        raise ValueError("Unknown version found")
+
+    get_short_header = _a_short_headers.get
+    match_header = _a_header.match
+    length = len(stream)
+    offset += 1
+
+    # the container being decoded, its items and the number of items still to decode, the containers it is in are
+    # kept on the stack
+    kind_container = None
+    items = None
+    append = None
+    remaining = 0
+    stack = []
+    while True:
+        header = get_short_header(stream[offset:offset + 2]) or get_short_header(stream[offset:offset + 3])
+        if header:
+            count, kind, header_length = header
+            offset += header_length
+        else:
+            header = match_header(stream, offset)
+            if header is None:
+                raise ValueError("Invalid header", offset)
+            count, kind = header.groups()
+            count = int(count)
+            offset = header.end()
+
+        if kind == "b" or kind == "s":
+            end = offset + count
+            if end > length:
+                raise ValueError("Invalid stream length", length, end)
+            value = stream[offset:end]
+            if kind == "s":
+                value = value.decode("UTF-8")
+            offset = end
+
+        elif kind == "i":
+            end = offset + count
+            value = int(stream[offset:end])
+            offset = end
+
+        elif kind in "ltdL":
+            if count:
+                stack.append((kind_container, items, append, remaining))
+                kind_container = kind
+                items = []
+                append = items.append
+                remaining = count * 2 if kind == "d" else count
+                continue
+            value = [] if kind == "l" else () if kind == "t" else _a_decode_container(kind, [])
+
+        elif kind == "J" or kind == "f":
+            end = offset + count
+            value = (long if kind == "J" else float)(stream[offset:end])
+            offset = end
+
+        elif kind == "n" or kind == "T" or kind == "F":
+            if count:
+                raise ValueError("Invalid length for a constant", count)
+            value = None if kind == "n" else kind == "T"
+
+        else:
+            raise ValueError("Unknown type found", kind)
+
+        # add the value to its container, completing every container that is full
+        while True:
+            if items is None:
+                return offset, value
+            append(value)
+            remaining -= 1
+            if remaining:
+                break
+            if kind_container == "l":
+                value = items
+            elif kind_container == "t":
+                value = tuple(items)
+            else:
+                value = _a_decode_container(kind_container, items)
+            kind_container, items, append, remaining = stack.pop()
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from time import time
+
+
+class LRUCache(object):
+    """
+    A mapping that keeps at most max_size items and drops the least recently used item first. When a ttl is given, the
+    items that were not used for ttl seconds are dropped by expire as well. Putting or getting an item uses it, checking
+    whether it is in the cache or peeking at it does not.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        super(LRUCache, self).__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        # the value and the time it was last used at for every key, least recently used first
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def items(self):
+        """
+        Returns the (key, value) pairs, least recently used first.
+        """
+        return [(key, value) for key, (value, _) in self._items.iteritems()]
+
+    def peek(self, key, default=None):
+        """
+        Returns the value of KEY, or DEFAULT when it is not in the cache, without using it.
+        """
+        item = self._items.get(key)
+        return default if item is None else item[0]
+
+    def get(self, key, default=None):
+        """
+        Uses KEY and returns its value, or DEFAULT when it is not in the cache.
+        """
+        item = self._items.pop(key, None)
+        if item is None:
+            return default
+        self._items[key] = (item[0], self._now())
+        return item[0]
+
+    def put(self, key, value):
+        """
+        Stores VALUE as the most recently used value of KEY, and returns the (key, value) pairs that were dropped to
+        keep at most max_size items.
+        """
+        items = self._items
+        items.pop(key, None)
+        items[key] = (value, self._now())
+
+        dropped = []
+        while len(items) > self.max_size:
+            dropped_key, (dropped_value, _) = items.popitem(last=False)
+            dropped.append((dropped_key, dropped_value))
+        return dropped
+
+    def pop(self, key, default=None):
+        """
+        Removes KEY and returns its value, or DEFAULT when it is not in the cache.
+        """
+        item = self._items.pop(key, None)
+        return default if item is None else item[0]
+
+    def expire(self):
+        """
+        Removes the items that were not used for ttl seconds and returns them as (key, value) pairs.
+        """
+        assert self.ttl is not None, "expire needs a ttl"
+        items = self._items
+        expired_before = time() - self.ttl
+        expired = []
+        while items:
+            key = next(items.iterkeys())
+            value, last_used = items[key]
+            if last_used > expired_before:
+                break
+            del items[key]
+            expired.append((key, value))
+        return expired
+
+    def _now(self):
+        # the time of use is only needed to expire items
+        return time() if self.ttl is not None else None
@@ -0,0 +1,48 @@
+from Tribler.Core.Utilities.lru_cache import LRUCache
+
+RECENTLY_REQUESTED_SIZE = 1000
+RECENTLY_REQUESTED_TTL = 10 * 60
+
+
+class RecentlyRequested(object):
+    """
+    The infohashes of the torrents that were recently requested from other peers. An infohash is forgotten when it was
+    requested more than ttl seconds ago, or when more than max_size infohashes were requested after it. The infohashes
+    that are filtered out because they were requested already are counted as duplicates.
+
+    filter and add have to be called on the reactor thread.
+    """
+
+    def __init__(self, max_size=RECENTLY_REQUESTED_SIZE, ttl=RECENTLY_REQUESTED_TTL):
+        super(RecentlyRequested, self).__init__()
+        self.nr_duplicates = 0
+        # the infohashes, least recently requested first
+        self._requested = LRUCache(max_size, ttl)
+
+    # __len__ and __contains__ only read, as the GUI asks for the number of infohashes from the wx thread. Expired
+    # infohashes are only removed by filter and add, which are called on the reactor thread.
+    def __len__(self):
+        return len(self._requested)
+
+    def __contains__(self, infohash):
+        return infohash in self._requested
+
+    def filter(self, infohashes):
+        """
+        Returns the infohashes that were not requested recently.
+        """
+        requested = self._requested
+        requested.expire()
+        not_requested = []
+        for infohash in infohashes:
+            if infohash in requested:
+                self.nr_duplicates += 1
+            else:
+                not_requested.append(infohash)
+        return not_requested
+
+    def add(self, infohashes):
+        requested = self._requested
+        requested.expire()
+        for infohash in infohashes:
+            requested.put(infohash, True)
@@ -1,3 +1,4 @@
+from itertools import chain
 from math import sqrt
 
 
@@ -6,17 +7,34 @@ def sort_torrent_fulltext(data_set):
     :param data_set: The given list of data.
     """
     # TODO(lipu): This has to be decoupled from GuiTuple
-    norm_num_seeders = normalize_data_dict(data_set, 'num_seeders', 'infohash')
-    norm_neg_votes = normalize_data_dict(data_set, 'neg_votes', 'infohash')
-    norm_subscriptions = normalize_data_dict(data_set, 'subscriptions', 'infohash')
+    _score_torrent_fulltext(data_set, _get_fulltext_statistics(data_set))
+    data_set.sort(key=_get_relevance_score, reverse=True)
 
-    for data in data_set:
-        score = 0.8 * norm_num_seeders[data.get('infohash')]\
-            - 0.1 * norm_neg_votes[data.get('infohash')]\
-            + 0.1 * norm_subscriptions[data.get('infohash')]
-        data.get('relevance_score')[-1] = score
 
-    data_set.sort(key=lambda d: d.get('relevance_score'), reverse=True)
+def insert_torrent_fulltext(sorted_set, new_data):
+    """ inserts torrents into a list of torrents sorted by sort_torrent_fulltext, keeping it sorted.
+    The scores of the torrents in the list are kept, the new torrents are normalized against the statistics of both.
+    :param sorted_set: The list of data sorted by sort_torrent_fulltext.
+    :param new_data: The list of data to insert.
+    """
+    if not new_data:
+        return
+
+    _score_torrent_fulltext(new_data, _get_fulltext_statistics(chain(sorted_set, new_data)))
+
+    # equal scores are inserted after the ones already in the list, like a stable sort of the list extended with them
+    position = 0
+    for data in sorted(new_data, key=_get_relevance_score, reverse=True):
+        score = data.get('relevance_score')
+        high = len(sorted_set)
+        while position < high:
+            middle = (position + high) // 2
+            if sorted_set[middle].get('relevance_score') < score:
+                high = middle
+            else:
+                position = middle + 1
+        sorted_set.insert(position, data)
+        position += 1
 
 
 def normalize_data_dict(data_set, key_to_normalize, key_for_index):
@@ -58,4 +76,63 @@ def normalize_data_dict(data_set, key_to_normalize, key_for_index):
             return_dict[data.get(key_for_index)] = ((data.get(key_to_normalize, 0) or 0) - mean) / std_dev
         else:
             return_dict[data.get(key_for_index)] = 0
-    return return_dict
\ No newline at end of file
+    return return_dict
+
+
+def _get_relevance_score(data):
+    return data.get('relevance_score')
+
+
+def _get_fulltext_statistics(data_set):
+    """ Returns the mean and the standard deviation of the number of seeders, negative votes and subscriptions of the
+    given data, computed in a single pass from the sums and the sums of squares of all three fields.
+    The mean and the variance are divided as normalize_data_dict divides them, which truncates them for integer
+    counts. For integer counts the sum of squared deviations from the truncated mean m is exactly
+    sum(x * x) - 2 * m * sum(x) + count * m * m, so the scores are the ones normalize_data_dict gives.
+    """
+    count = 0
+    seeders_total = votes_total = subscriptions_total = 0
+    seeders_squares = votes_squares = subscriptions_squares = 0
+    for data in data_set:
+        get = data.get
+        count += 1
+
+        value = get('num_seeders', 0) or 0
+        seeders_total += value
+        seeders_squares += value * value
+
+        value = get('neg_votes', 0) or 0
+        votes_total += value
+        votes_squares += value * value
+
+        value = get('subscriptions', 0) or 0
+        subscriptions_total += value
+        subscriptions_squares += value * value
+
+    if count < 2:
+        return (0, 0), (0, 0), (0, 0)
+    return (_get_mean_std_dev(count, seeders_total, seeders_squares),
+            _get_mean_std_dev(count, votes_total, votes_squares),
+            _get_mean_std_dev(count, subscriptions_total, subscriptions_squares))
+
+
+def _get_mean_std_dev(count, total, squares):
+    mean = total / count
+    # rounding can make the sum of squared deviations of float counts slightly negative
+    deviations = max(squares - 2 * mean * total + count * mean * mean, 0)
+    return mean, sqrt(deviations / (count - 1))
+
+
+def _score_torrent_fulltext(data_set, statistics):
+    """ Sets the last item of the relevance score of the given data to its weighted, normalized popularity.
+    """
+    (seeders_mean, seeders_dev), (votes_mean, votes_dev), (subscriptions_mean, subscriptions_dev) = statistics
+
+    for data in data_set:
+        get = data.get
+        # a field that has the same value for all data does not contribute
+        get('relevance_score')[-1] = \
+            0.8 * (((get('num_seeders', 0) or 0) - seeders_mean) / seeders_dev if seeders_dev > 0 else 0)\
+            - 0.1 * (((get('neg_votes', 0) or 0) - votes_mean) / votes_dev if votes_dev > 0 else 0)\
+            + 0.1 * (((get('subscriptions', 0) or 0) - subscriptions_mean) / subscriptions_dev
+                     if subscriptions_dev > 0 else 0)
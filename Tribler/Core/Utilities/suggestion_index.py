@@ -0,0 +1,145 @@
+# see LICENSE.txt for license information
+"""
+In-memory keyword index used for search suggestions and autocompletion.
+
+The index keeps the vocabulary of the swarmname column of the FullTextIndex in two structures:
+ - a sorted list of terms, which answers prefix lookups with a binary search;
+ - a trigram index (trigram -> terms), which narrows fuzzy lookups down to the few terms that share enough
+   trigrams with the query before the (expensive) Levenshtein distance is computed.
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+from threading import RLock
+
+TRIGRAM_PADDING = u"$"
+
+
+def levenshtein(a, b):
+    """
+    Calculates the Levenshtein distance between a and b.
+    """
+    n, m = len(a), len(b)
+    if n > m:
+        # Make sure n <= m, to use O(min(n,m)) space
+        a, b = b, a
+        n, m = m, n
+
+    current = range(n + 1)
+    for i in range(1, m + 1):
+        previous, current = current, [i] + [0] * n
+        for j in range(1, n + 1):
+            add, delete = previous[j] + 1, current[j - 1] + 1
+            change = previous[j - 1]
+            if a[j - 1] != b[i - 1]:
+                change = change + 1
+            current[j] = min(add, delete, change)
+
+    return current[n]
+
+
+def get_trigrams(term):
+    """
+    Returns the set of trigrams of a term. The term is padded on both sides so that a term of length n
+    always results in n trigrams (counting duplicates).
+    """
+    padded = TRIGRAM_PADDING + term + TRIGRAM_PADDING
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+
+class SuggestionIndex(object):
+
+    def __init__(self):
+        super(SuggestionIndex, self).__init__()
+        self._lock = RLock()
+
+        self._frequency = {}
+        self._sorted_terms = []
+        self._trigrams = defaultdict(set)
+
+        self.is_loaded = False
+
+    def __len__(self):
+        return len(self._frequency)
+
+    def load(self, swarmnames):
+        """
+        Bulk loads the index from an iterable of space separated keyword strings. This is much cheaper than
+        calling add_swarmname for each of them as the term list is only sorted once. The index is only loaded once,
+        the iterable is not consumed when another thread loaded the index already.
+        """
+        with self._lock:
+            if self.is_loaded:
+                return
+
+            for swarmname in swarmnames:
+                for term in swarmname.split():
+                    self._add_term(term, keep_sorted=False)
+            self._sorted_terms = sorted(self._frequency.iterkeys())
+            self.is_loaded = True
+
+    def add_swarmname(self, swarmname):
+        """
+        Adds the keywords of a single swarmname (as stored in the FullTextIndex) to the index.
+        """
+        with self._lock:
+            for term in swarmname.split():
+                self._add_term(term, keep_sorted=True)
+
+    def _add_term(self, term, keep_sorted):
+        if term in self._frequency:
+            self._frequency[term] += 1
+            return
+
+        self._frequency[term] = 1
+        for trigram in get_trigrams(term):
+            self._trigrams[trigram].add(term)
+        if keep_sorted:
+            insort(self._sorted_terms, term)
+
+    def get_frequency(self, term):
+        return self._frequency.get(term, 0)
+
+    def get_completions(self, prefix, max_terms, limit=100):
+        """
+        Returns at most max_terms terms starting with prefix, the most frequent ones first.
+        Only the first limit terms (in alphabetical order) are considered.
+        """
+        with self._lock:
+            candidates = []
+            index = bisect_left(self._sorted_terms, prefix)
+            while index < len(self._sorted_terms) and len(candidates) < limit:
+                term = self._sorted_terms[index]
+                if not term.startswith(prefix):
+                    break
+                if term != prefix:
+                    candidates.append(term)
+                index += 1
+
+            candidates.sort(key=lambda term: self._frequency[term], reverse=True)
+            return candidates[:max_terms]
+
+    def get_similar_terms(self, term, max_distance):
+        """
+        Returns a list of (distance, term) tuples for all terms in the index that are at most max_distance
+        edits away from term, sorted by distance and then by frequency.
+        """
+        trigrams = get_trigrams(term)
+        # every edit operation destroys at most 3 (distinct) trigrams
+        min_shared = max(1, len(trigrams) - 3 * max_distance)
+
+        with self._lock:
+            shared = defaultdict(int)
+            for trigram in trigrams:
+                for candidate in self._trigrams.get(trigram, ()):
+                    shared[candidate] += 1
+
+            results = []
+            for candidate, count in shared.iteritems():
+                if count < min_shared or abs(len(candidate) - len(term)) > max_distance:
+                    continue
+                distance = levenshtein(term, candidate)
+                if distance <= max_distance:
+                    results.append((distance, -self._frequency[candidate], candidate))
+
+        results.sort()
+        return [(distance, candidate) for distance, _, candidate in results]
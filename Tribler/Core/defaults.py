@@ -62,6 +62,7 @@ sessdefaults['general']['live_aux_seeders'] = []
 # AllChannel community section
 sessdefaults['allchannel_community'] = OrderedDict()
 sessdefaults['allchannel_community']['enabled'] = True
+sessdefaults['allchannel_community']['max_preview_communities'] = 50
 
 # Search community section
 sessdefaults['search_community'] = OrderedDict()
@@ -102,6 +103,8 @@ sessdefaults['torrent_collecting']['dht_torrent_collecting'] = True
 sessdefaults['torrent_collecting']['torrent_collecting_max_torrents'] = 50000
 sessdefaults['torrent_collecting']['torrent_collecting_dir'] = None
 sessdefaults['torrent_collecting']['stop_collecting_threshold'] = 200
+sessdefaults['torrent_collecting']['recently_requested_size'] = 1000
+sessdefaults['torrent_collecting']['recently_requested_ttl'] = 10 * 60
 
 # Libtorrent settings
 sessdefaults['libtorrent'] = OrderedDict()
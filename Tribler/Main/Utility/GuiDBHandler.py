@@ -4,6 +4,7 @@
 import logging
 import os
 from collections import namedtuple
+from heapq import heappop, heappush
 from inspect import isgeneratorfunction
 from random import randint
 from threading import Event, Lock, RLock
@@ -22,9 +23,33 @@ from Tribler.Core.Utilities.twisted_utils import isInThreadPool
 GUI_PRI_DISPERSY = 99
 DEFAULT_PRI_DISPERSY = 0
 
+# the number of tasks of every workerType that are called at the same time, dbThread tasks are called on the reactor
+MAX_WORKERS = {"dbThread": 1, "ThreadPool": 4}
+# tasks that waited longer than this many seconds in the queue are logged
+SLOW_TASK_WAIT = 1.0
+
 logger = logging.getLogger(__name__)
 
 
+class GUIDBTask(object):
+    """
+    A task added to the GUIDBProducer queue of its workerType.
+    """
+
+    def __init__(self, name, uId, priority, sequence_number, delay, workerType):
+        self.name = name
+        self.uId = uId
+        self.priority = priority
+        self.sequence_number = sequence_number
+        self.delay = delay
+        self.workerType = workerType
+        self.call = None
+
+        self.added = time()
+        self.started = False
+        self.cancelled = False
+
+
 class GUIDBProducer(object):
     # Code to make this a singleton
     __single = None
@@ -46,13 +71,21 @@ class GUIDBProducer(object):
             Utility = namedtuple('Utility', ['abcquitting', ])
             self.utility = Utility(False)
 
-        self.uIds = set()
+        # the last task added for every uId, until it has been called
+        self.uIds = {}
         self.uIdsLock = Lock()
 
         self.nrCallbacks = {}
 
         self._auto_counter = 0
 
+        # per workerType a heap of (-priority, sequence number, task) and the number of running workers
+        self._queues = dict((workerType, []) for workerType in MAX_WORKERS)
+        self._nr_workers = dict((workerType, 0) for workerType in MAX_WORKERS)
+
+        # per task name the number of calls, the total and maximum time waited in the queue and the total duration
+        self.task_latencies = {}
+
     @classmethod
     def getInstance(cls, *args, **kw):
         with cls.__singleton_lock:
@@ -72,6 +105,9 @@ class GUIDBProducer(object):
     def Add(self, sender, workerFn, args=(), kwargs={}, name=None, delay=0.0, uId=None, retryOnBusy=False, priority=0, workerType="dbthread"):
         """The sender will send the return value of
         workerFn(*args, **kwargs) to the main thread.
+
+        Tasks wait in the queue of their workerType, the tasks with the highest priority are called first. A task
+        with the same uId as a task that has not been called yet supersedes that task.
         """
         if self.utility.abcquitting:
             self._logger.debug("GUIDBHandler: abcquitting ignoring Task(%s)", name)
@@ -80,21 +116,24 @@ class GUIDBProducer(object):
         assert uId is None or isinstance(uId, unicode), type(uId)
         assert name is None or isinstance(name, unicode), type(name)
 
-        if uId:
-            try:
-                self.uIdsLock.acquire()
-                if uId in self.uIds:
-                    self._logger.debug(
-                        "GUIDBHandler: Task(%s) already scheduled in queue, ignoring uId = %s", name, uId)
-                    return
-                else:
-                    self.uIds.add(uId)
-            finally:
-                self.uIdsLock.release()
+        if workerType not in MAX_WORKERS:
+            raise RuntimeError("Asked to schedule a task with unknown workerType: %s", workerType)
 
-            callbackId = uId
-        else:
-            callbackId = name
+        with self.uIdsLock:
+            self._auto_counter += 1
+            task = GUIDBTask(name, uId, priority, self._auto_counter, delay, workerType)
+
+            if uId:
+                old_task = self.uIds.get(uId)
+                if old_task and not old_task.started:
+                    self._logger.debug("GUIDBHandler: Task(%s) supersedes the scheduled task with uId = %s", name, uId)
+                    old_task.cancelled = True
+                    # take over the place of the superseded task, so a task that keeps being superseded still runs
+                    task.priority = max(priority, old_task.priority)
+                    task.sequence_number = old_task.sequence_number
+                self.uIds[uId] = task
+
+        callbackId = uId or name
 
         self._logger.debug("GUIDBHandler: adding Task(%s)", callbackId)
 
@@ -107,42 +146,38 @@ class GUIDBProducer(object):
 
             self.uIdsLock.release()
 
-        t1 = time()
-
         def wrapper():
             if __debug__:
                 self.uIdsLock.acquire()
                 self.nrCallbacks[callbackId] = self.nrCallbacks.get(callbackId, 0) - 1
                 self.uIdsLock.release()
 
+            with self.uIdsLock:
+                if task.cancelled:
+                    return
+                task.started = True
+
             # Call the actual function
             try:
                 t2 = time()
                 result = workerFn(*args, **kwargs)
 
             except (AbortedException, wx.PyDeadObjectError):
+                self._task_finished(task)
                 return
 
             except Exception as exc:
+                self._task_finished(task)
                 originalTb = format_exc()
                 sender.sendException(exc, originalTb)
                 return
 
             t3 = time()
-            self._logger.debug(
-                "GUIDBHandler: Task(%s) took to be called %.1f (expected %.1f), actual task took %.1f %s", name, t2 - t1, delay, t3 - t2, workerType)
-
-            if uId:
-                try:
-                    self.uIdsLock.acquire()
-                    if uId in self.uIds:
-                        self.uIds.discard(uId)
+            self._trace(task, t2 - task.added - delay, t3 - t2)
 
-                    # this callback has been removed during wrapper, cancel now
-                    else:
-                        return
-                finally:
-                    self.uIdsLock.release()
+            # this callback has been removed during wrapper, cancel now
+            if not self._task_finished(task):
+                return
 
             # if we get to this step, send result to callback
             try:
@@ -152,35 +187,111 @@ class GUIDBProducer(object):
                 self._logger.error("GUIDBHandler: Could not send result of Task(%s)", name)
 
         wrapper.__name__ = str(name)
+        task.call = wrapper
 
         # Have in mind that setting workerType to "ThreadPool" means that the
         # task wants to be executed OUT of the GUI thread, nothing more.
         if delay or not (isInIOThread() or isInThreadPool()):
-            if workerType == "dbThread":
-                # Schedule the task to be called later in the reactor thread.
-                self.utility.session.lm.threadpool.add_task(wrapper, delay)
-            elif workerType == "ThreadPool":
-                self.utility.session.lm.threadpool.add_task_in_thread(wrapper, delay)
-            else:
-                raise RuntimeError("Asked to schedule a task with unknown workerType: %s", workerType)
+            # Queue the task from the reactor thread once the delay has passed.
+            self.utility.session.lm.threadpool.add_task(lambda: self._enqueue(task), delay)
         elif workerType == "dbThread" and not isInIOThread():
-            reactor.callFromThread(wrapper)
+            reactor.callFromThread(self._enqueue, task)
         else:
             self._logger.debug("GUIDBHandler: Task(%s) scheduled to be called on non GUI thread from non GUI thread, "
                                "executing synchronously.", name)
             wrapper()
 
     def Remove(self, uId):
-        if uId in self.uIds:
-            self._logger.debug("GUIDBHandler: removing Task(%s)", uId)
-
-            with self.uIdsLock:
-                self.uIds.discard(uId)
+        with self.uIdsLock:
+            task = self.uIds.pop(uId, None)
+            if task:
+                task.cancelled = True
 
                 if __debug__:
                     self.nrCallbacks[uId] = self.nrCallbacks.get(uId, 0) - 1
 
-            self.utility.session.lm.threadpool.cancel_pending_task(uId)
+        if task:
+            self._logger.debug("GUIDBHandler: removing Task(%s)", uId)
+
+    def _task_finished(self, task):
+        """
+        Forgets the uId of the task and returns whether its result should still be sent.
+        """
+        with self.uIdsLock:
+            if task.uId and self.uIds.get(task.uId) is task:
+                del self.uIds[task.uId]
+            return not task.cancelled
+
+    def _trace(self, task, wait, duration):
+        with self.uIdsLock:
+            latencies = self.task_latencies.get(task.name)
+            if latencies is None:
+                latencies = self.task_latencies[task.name] = [0, 0.0, 0.0, 0.0]
+            latencies[0] += 1
+            latencies[1] += wait
+            latencies[2] = max(latencies[2], wait)
+            latencies[3] += duration
+
+        if wait > SLOW_TASK_WAIT:
+            self._logger.info("GUIDBHandler: Task(%s) with priority %d waited %.1f in the queue of %s",
+                              task.name, task.priority, wait, task.workerType)
+        self._logger.debug(
+            "GUIDBHandler: Task(%s) took to be called %.1f (expected %.1f), actual task took %.1f %s",
+            task.name, wait + task.delay, task.delay, duration, task.workerType)
+
+    def _queue_task(self, task):
+        """
+        Adds the task to its queue and returns whether a worker should be started for it.
+        """
+        with self.uIdsLock:
+            if task.cancelled:
+                return False
+
+            heappush(self._queues[task.workerType], (-task.priority, task.sequence_number, task))
+            if self._nr_workers[task.workerType] >= MAX_WORKERS[task.workerType]:
+                return False
+
+            self._nr_workers[task.workerType] += 1
+            return True
+
+    def _next_task(self, workerType):
+        """
+        Returns the queued task with the highest priority, or None when the worker asking for it should stop.
+        """
+        with self.uIdsLock:
+            queue = self._queues[workerType]
+            while queue:
+                task = heappop(queue)[2]
+                if not task.cancelled:
+                    return task
+
+            self._nr_workers[workerType] -= 1
+
+    def _enqueue(self, task):
+        # called on the reactor thread
+        if self._queue_task(task):
+            if task.workerType == "dbThread":
+                reactor.callLater(0, self._work_on_reactor)
+            else:
+                reactor.callInThread(self._work_in_thread)
+
+    def _work_on_reactor(self):
+        task = self._next_task("dbThread")
+        if task:
+            try:
+                task.call()
+            finally:
+                # handle the other reactor events before calling the next task
+                reactor.callLater(0, self._work_on_reactor)
+
+    def _work_in_thread(self):
+        task = self._next_task("ThreadPool")
+        while task:
+            try:
+                task.call()
+            except:
+                print_exc()
+            task = self._next_task("ThreadPool")
 
 # Wrapping Senders for new delayedResult impl
 
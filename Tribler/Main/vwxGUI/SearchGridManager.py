@@ -15,7 +15,7 @@ from Tribler.Core.Video.utils import videoextdefaults
 from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_MYPREFERENCES, NTFY_VOTECAST, NTFY_CHANNELCAST,
                                      DLSTATUS_METADATA, DLSTATUS_WAITING4HASHCHECK,
                                      SIGNAL_CHANNEL, SIGNAL_ON_SEARCH_RESULTS, SIGNAL_TORRENT)
-from Tribler.Core.Utilities.sort_utils import sort_torrent_fulltext
+from Tribler.Core.Utilities.sort_utils import insert_torrent_fulltext, sort_torrent_fulltext
 from Tribler.Main.Utility.GuiDBHandler import startWorker, GUI_PRI_DISPERSY
 from Tribler.Main.Utility.GuiDBTuples import (Torrent, ChannelTorrent, CollectedTorrent, RemoteTorrent,
                                               NotCollectedTorrent, LibraryTorrent, Comment, Modification, Channel,
@@ -44,6 +44,9 @@ class TorrentManager(object):
         # Contains all matches for keywords in DB, not filtered by category
         self.hits = []
         self.hitsLock = threading.Lock()
+        # The hits by infohash and the number of hits when they were last sorted as a whole
+        self.hitsByInfohash = {}
+        self.hitsSorted = 0
 
         # Remote results for current keywords
         self.remoteHits = []
@@ -218,15 +221,23 @@ class TorrentManager(object):
 
             self._logger.debug(
                 'TorrentSearchGridManager: getHitsInCat: found after remote search: %d items',
-                len(self.hits))
+                len(self.hits) + len(new_remote_hits))
 
             beginsort = time()
 
-            if new_local_hits or new_remote_hits:
+            # Remote hits are inserted into the sorted hits, until they have doubled since the hits were last sorted
+            # as a whole and the statistics used to score them have drifted too far
+            if new_local_hits or len(self.hits) + len(new_remote_hits) > 2 * self.hitsSorted:
+                self.hits.extend(new_remote_hits)
                 sort_torrent_fulltext(self.hits)
+                self.hitsSorted = len(self.hits)
 
                 self.hits = self.library_manager.addDownloadStates(self.hits)
 
+            elif new_remote_hits:
+                insert_torrent_fulltext(self.hits, self.library_manager.addDownloadStates(new_remote_hits))
+
+            if new_local_hits or new_remote_hits:
                 # boudewijn: now that we have sorted the search results we
                 # want to prefetch the top N torrents.
                 startWorker(None, self.prefetch_hits, delay=1, uId=u"PREFETCH_RESULTS", workerType="ThreadPool")
@@ -315,6 +326,8 @@ class TorrentManager(object):
                 self.filteredResults = 0
 
                 self.hits = []
+                self.hitsByInfohash = {}
+                self.hitsSorted = 0
                 self.remoteHits = []
                 self.gotRemoteHits = False
                 self.oldsearchkeywords = None
@@ -368,6 +381,9 @@ class TorrentManager(object):
 
             results = map(create_torrent, results)
         self.hits = results
+        self.hitsByInfohash = {}
+        for hit in reversed(results):
+            self.hitsByInfohash[hit.infohash] = hit
 
         self._logger.debug(
             'TorrentSearchGridManager: _doSearchLocalDatabase took: %s of which tuple creation took %s',
@@ -376,10 +392,15 @@ class TorrentManager(object):
         return True
 
     def addStoredRemoteResults(self):
-        """ Called by GetHitsInCategory() to add remote results to self.hits """
+        """
+        Called by GetHitsInCategory() to merge remote results with self.hits.
+        Returns the remote results that are new, which the caller adds to self.hits, and the infohashes of the hits
+        that were modified.
+        """
         begintime = time()
         try:
-            hitsUpdated = False
+            newHits = []
+            replacedHits = set()
             hitsModified = set()
 
             with self.remoteLock:
@@ -387,36 +408,31 @@ class TorrentManager(object):
                 self.remoteHits = []
 
             for remoteItem in hits:
-                known = False
-
-                for item in self.hits:
-                    if item.infohash == remoteItem.infohash:
-                        if item.query_candidates is None:
-                            item.query_candidates = set()
-                        item.query_candidates.update(remoteItem.query_candidates)
-
-                        if remoteItem.hasChannel():
-                            if isinstance(item, RemoteTorrent):
-                                self.hits.remove(item)  # Replace this item with a new result with a channel
-                                break
-
-                            # Maybe update channel?
-                            if isinstance(item, RemoteChannelTorrent):
-                                this_rating = remoteItem.channel.nr_favorites - remoteItem.channel.nr_spam
-
-                                if item.hasChannel():
-                                    current_rating = item.channel.nr_favorites - item.channel.nr_spam
-                                else:
-                                    current_rating = this_rating - 1
-
-                                if this_rating > current_rating:
-                                    item.updateChannel(remoteItem.channel)
-                                    hitsModified.add(item.infohash)
-
-                        known = True
-                        break
-
-                if not known:
+                item = self.hitsByInfohash.get(remoteItem.infohash)
+                if item is not None:
+                    if item.query_candidates is None:
+                        item.query_candidates = set()
+                    item.query_candidates.update(remoteItem.query_candidates)
+
+                    if remoteItem.hasChannel():
+                        if isinstance(item, RemoteTorrent):
+                            replacedHits.add(id(item))  # Replace this item with a new result with a channel
+                            item = None
+
+                        # Maybe update channel?
+                        elif isinstance(item, RemoteChannelTorrent):
+                            this_rating = remoteItem.channel.nr_favorites - remoteItem.channel.nr_spam
+
+                            if item.hasChannel():
+                                current_rating = item.channel.nr_favorites - item.channel.nr_spam
+                            else:
+                                current_rating = this_rating - 1
+
+                            if this_rating > current_rating:
+                                item.updateChannel(remoteItem.channel)
+                                hitsModified.add(item.infohash)
+
+                if item is None:
                     # Niels 26-10-2012: override category if name is xxx
                     if remoteItem.category.lower() != u'xxx':
                         local_category = self.category.calculateCategoryNonDict([], remoteItem.name, '', '')
@@ -424,20 +440,20 @@ class TorrentManager(object):
                             self._logger.debug('TorrentSearchGridManager: %s is xxx', remoteItem.name)
                             remoteItem.category = u'XXX'
 
-                    self.hits.append(remoteItem)
-                    hitsUpdated = True
+                    self.hitsByInfohash[remoteItem.infohash] = remoteItem
+                    newHits.append(remoteItem)
+
+            if replacedHits:
+                self.hits[:] = [hit for hit in self.hits if id(hit) not in replacedHits]
+                newHits = [hit for hit in newHits if id(hit) not in replacedHits]
 
-            return hitsUpdated, hitsModified
-        except:
-            raise
+            return newHits, hitsModified
 
         finally:
             self.remoteRefresh = False
 
             self._logger.debug("TorrentSearchGridManager: addStoredRemoteResults: %s", time() - begintime)
 
-        return False, []
-
     def gotDispersyRemoteHits(self, subject, changetype, objectID, search_results):
         refreshGrid = False
 
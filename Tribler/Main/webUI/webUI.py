@@ -2,9 +2,12 @@ import sys
 import os
 import logging
 import random
+import threading
 from binascii import hexlify, unhexlify
+from collections import OrderedDict
 import json
 from functools import wraps
+from time import sleep, time
 from traceback import print_exc
 import cherrypy
 from cherrypy import response
@@ -13,6 +16,15 @@ from cherrypy.lib.auth_basic import checkpassword_dict
 from Tribler.Core.simpledefs import DOWNLOAD, UPLOAD
 from Tribler.Main.globals import DefaultDownloadStartupConfig
 
+# the number of removed torrents remembered for clients that list with an older cache id, clients whose cache id
+# is older than the oldest remembered removal receive the complete list
+MAX_REMOVED_TORRENTS = 1000
+# every waiting events request holds a server thread, beyond this number of waiting clients requests return at once
+MAX_LONG_POLL_CLIENTS = 20
+LONG_POLL_TIMEOUT = 30
+# the refresh thread only rebuilds the torrent rows while a client listed within this many seconds, otherwise the
+# rows are rebuilt by the next list or events request
+CLIENT_IDLE_TIMEOUT = 2 * LONG_POLL_TIMEOUT
 
 def jsonify(func):
     """JSON decorator for CherryPy"""
@@ -39,7 +51,25 @@ class WebUI(object):
         self._logger = logging.getLogger(self.__class__.__name__)
 
         self.currentTokens = set()
-        self.currentTorrents = {}
+
+        # the torrent rows are rebuilt once for every download states callback and shared by all clients, the
+        # cache id a client lists with is the revision of the rows it has seen
+        self._torrents_condition = threading.Condition()
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
+        self._states_changed = threading.Event()
+        self._states_changed.set()
+        # revisions continue across restarts, so a cache id from a previous run is never mistaken for a current one
+        self._torrent_revision = self._oldest_revision = int(time())
+        self._torrent_rows = {}
+        # for every torrent the revision each field was last changed in, the hash field holds the revision the
+        # torrent was added in
+        self._field_revisions = {}
+        # infohash to the revision of the last change, least recently changed first
+        self._changed_torrents = OrderedDict()
+        self._removed_torrents = OrderedDict()
+        self._long_poll_clients = 0
+        self._last_request = 0
 
         self.library_manager = library_manager
         self.torrentsearch_manager = torrentsearch_manager
@@ -85,14 +115,40 @@ class WebUI(object):
             self.server = cherrypy._cpserver.Server()
             self.server.socket_port = self.port
             self.server._socket_host = '0.0.0.0'
-            self.server.thread_pool = 5
+            self.server.thread_pool = 5 + MAX_LONG_POLL_CLIENTS
             self.server.subscribe()
             self.server.start()
 
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, name="WebUI_refresh_torrents")
+            self._refresh_thread.setDaemon(True)
+            self._refresh_thread.start()
+            self.library_manager.add_download_state_callback(self.on_download_states)
+
     def stop(self):
         if self.started:
+            self.started = False
+            self.library_manager.remove_download_state_callback(self.on_download_states)
             self.server.stop()
 
+    def on_download_states(self, dslist, magnetlist):
+        """
+        Called on the GUI thread, the rows are rebuilt by the refresh thread.
+        """
+        self._states_changed.set()
+
+    def _refresh_loop(self):
+        while self.started:
+            if not self._has_active_clients():
+                sleep(1.0)
+            elif self._states_changed.wait(1.0):
+                try:
+                    self._refresh_torrents()
+                except:
+                    print_exc()
+
+    def _has_active_clients(self):
+        return self._long_poll_clients > 0 or time() - self._last_request < CLIENT_IDLE_TIMEOUT
+
     def clear_text(self, mypass):
         return mypass
 
@@ -127,120 +183,220 @@ class WebUI(object):
         self._logger.debug("webUI: new_token %s", new_token)
         return "<html><body><div id='token' style='display:none;'>%s</div></body></html>" % new_token
 
+    @cherrypy.expose
+    @jsonify
+    def events(self, **args):
+        """
+        Long-polling variant of list. Waits until the torrents changed after the revision in cid, or until timeout
+        seconds have passed. New torrents are returned in torrentp, for the other changed torrents only the changed
+        fields are returned in torrentd as [hash, {field index: value}]. Like list, the full list is returned in
+        torrents if the changes after cid are not known.
+        """
+        if str(args.get('token')) not in self.currentTokens:
+            raise cherrypy.HTTPError(403)
+
+        cache_id = int(args['cid']) if 'cid' in args else None
+        timeout = min(float(args.get('timeout', LONG_POLL_TIMEOUT)), LONG_POLL_TIMEOUT)
+
+        self._last_request = time()
+        self._refresh_torrents()
+        with self._torrents_condition:
+            if cache_id == self._torrent_revision and self._long_poll_clients < MAX_LONG_POLL_CLIENTS:
+                self._long_poll_clients += 1
+                try:
+                    deadline = time() + timeout
+                    while cache_id == self._torrent_revision and time() < deadline:
+                        self._torrents_condition.wait(deadline - time())
+                finally:
+                    self._long_poll_clients -= 1
+
+            return_dict = self._get_torrent_delta(cache_id, changed_fields=True)
+
+        return_dict['build'] = 1
+        return return_dict
+
     def doList(self, args):
-        _, torrents = self.library_manager.getHitsInCategory()
+        cache_id = int(args['cid']) if 'cid' in args else None
 
-        return_dict = {'label': []}
+        self._last_request = time()
+        self._refresh_torrents()
+        with self._torrents_condition:
+            return_dict = self._get_torrent_delta(cache_id)
 
-        new_torrent_list = []
-        for i, torrent in enumerate(torrents):
-            torrent_list = [hexlify(torrent.infohash)]
+        return_dict['label'] = []
+        return return_dict
 
-            state = 0
-            if 'checking' in torrent.state:
-                state += 2
+    def _get_torrent_delta(self, cache_id, changed_fields=False):
+        """
+        Returns the torrents that were added, changed or removed after revision cache_id, in the format of the
+        uTorrent list action. Should be called with the torrents condition held.
+        """
+        return_dict = {'torrentc': self._torrent_revision}
+
+        if cache_id is None or not self._oldest_revision <= cache_id <= self._torrent_revision:
+            # no cache id, or one we cannot compute the changes for as the torrents removed after it were forgotten.
+            # A full list in torrents, rather than in torrentp, makes the client replace its list instead of merging
+            # it, so that it drops the removed torrents as well.
+            return_dict['torrents'] = self._get_sorted_rows(self._torrent_rows.itervalues())
+            return return_dict
+
+        return_dict['torrentm'] = []
+        for key in reversed(self._removed_torrents):
+            if self._removed_torrents[key] <= cache_id:
+                break
+            return_dict['torrentm'].append(key)
+
+        changed_rows = []
+        changed_torrents = []
+        for key in reversed(self._changed_torrents):
+            if self._changed_torrents[key] <= cache_id:
+                break
+
+            field_revisions = self._field_revisions[key]
+            if not changed_fields or field_revisions[0] > cache_id:
+                changed_rows.append(self._torrent_rows[key])
             else:
-                state += 8
+                row = self._torrent_rows[key]
+                changed_torrents.append([key, dict((index, row[index])
+                                                   for index, revision in enumerate(field_revisions)
+                                                   if revision > cache_id)])
+
+        return_dict['torrentp'] = self._get_sorted_rows(changed_rows)
+        if changed_fields:
+            return_dict['torrentd'] = changed_torrents
+        return return_dict
 
-            if 'active' in torrent.state:
-                state += 1 + 64 + 128
+    @staticmethod
+    def _get_sorted_rows(rows):
+        # the queue order is the last but one field
+        return sorted(rows, key=lambda row: row[-2])
+
+    def _refresh_torrents(self):
+        """
+        Rebuilds the torrent rows if the download states changed since the last refresh, and records which fields
+        changed in the new revision.
+        """
+        with self._refresh_lock:
+            if not self._states_changed.is_set():
+                return
+            self._states_changed.clear()
+
+            _, torrents = self.library_manager.getHitsInCategory()
+            rows = [self._get_torrent_row(torrent, i + 1) for i, torrent in enumerate(torrents)]
+
+            with self._torrents_condition:
+                self._update_torrent_rows(rows)
+
+    def _update_torrent_rows(self, rows):
+        revision = self._torrent_revision + 1
+        changed = False
+
+        new_torrent_rows = {}
+        for row in rows:
+            key = row[0]
+            new_torrent_rows[key] = row
+
+            old_row = self._torrent_rows.get(key)
+            if old_row is None:
+                self._field_revisions[key] = [revision] * len(row)
+                self._removed_torrents.pop(key, None)
+            elif old_row != row:
+                field_revisions = self._field_revisions[key]
+                for index, value in enumerate(row):
+                    if value != old_row[index]:
+                        field_revisions[index] = revision
+            else:
+                continue
 
-            torrent_list.append(state)
+            self._changed_torrents.pop(key, None)
+            self._changed_torrents[key] = revision
+            changed = True
 
-            torrent_list.append(torrent.name.encode('utf8'))
-            torrent_list.append(torrent.length)
+        for key in self._torrent_rows:
+            if key not in new_torrent_rows:
+                del self._field_revisions[key]
+                del self._changed_torrents[key]
+                self._removed_torrents[key] = revision
+                changed = True
 
-            ds = torrent.ds
-            if ds:
-                progress = ds.get_progress()
+        while len(self._removed_torrents) > MAX_REMOVED_TORRENTS:
+            _, self._oldest_revision = self._removed_torrents.popitem(last=False)
 
-                stats = ds.get_seeding_statistics()
-                if stats:
-                    dl = stats['total_down']
-                    ul = stats['total_up']
-                else:
-                    dl = ds.get_total_transferred(DOWNLOAD)
-                    ul = ds.get_total_transferred(UPLOAD)
+        self._torrent_rows = new_torrent_rows
+        if changed:
+            self._torrent_revision = revision
+            self._torrents_condition.notify_all()
 
-                seeds, peers = ds.get_num_seeds_peers()
-                down_speed = ds.get_current_speed('down')
-                up_speed = ds.get_current_speed('up')
-                eta = ds.get_eta() or sys.maxsize
-            else:
-                progress = torrent.progress
-                dl = 0
-                ul = 0
+    def _get_torrent_row(self, torrent, queue_position):
+        torrent_list = [hexlify(torrent.infohash)]
 
-                seeds = peers = 0
-                down_speed = up_speed = 0
-                eta = sys.maxsize
+        state = 0
+        if 'checking' in torrent.state:
+            state += 2
+        else:
+            state += 8
 
-            torrent_list.append(int(progress * 1000))
-            dl = max(0, progress * torrent.length)
-            torrent_list.append(dl)
-            torrent_list.append(ul)
+        if 'active' in torrent.state:
+            state += 1 + 64 + 128
 
-            if dl == 0:
-                if ul != 0:
-                    ratio = sys.maxsize
-                else:
-                    ratio = 0
-            else:
-                ratio = 1.0 * ul / dl
+        torrent_list.append(state)
 
-            torrent_list.append(int(ratio * 1000))
-            torrent_list.append(up_speed)
-            torrent_list.append(down_speed)
-            torrent_list.append(eta)
-            torrent_list.append('')
-
-            torrent_list.append(peers)
-            torrent_list.append(peers)
-            torrent_list.append(seeds)
-            torrent_list.append(seeds)
-            torrent_list.append(1)
-            torrent_list.append(i + 1)
-            torrent_list.append(torrent.length - dl)
-
-            new_torrent_list.append(torrent_list)
-
-        if 'cid' in args:
-            cache_id = int(args['cid'])
-            old_torrent_list = self.currentTorrents.get(cache_id, [])
-            # step 1: create dict
-            new_torrent_dict = {}
-            for torrent in new_torrent_list:
-                new_torrent_dict[torrent[0]] = torrent
-
-            # step 2: create torrentp (changed torrents) and torrentm (removed torrents)
-            return_dict['torrentp'] = []
-            return_dict['torrentm'] = []
-            for torrent in old_torrent_list:
-                key = torrent[0]
-                if key not in new_torrent_dict:
-                    return_dict['torrentm'].append(key)
-                else:
-                    newtorrent = new_torrent_dict[key]
-                    if newtorrent != torrent:
-                        return_dict['torrentp'].append(newtorrent)
-                    del new_torrent_dict[key]
+        torrent_list.append(torrent.name.encode('utf8'))
+        torrent_list.append(torrent.length)
 
-            for torrent in new_torrent_dict.itervalues():
-                return_dict['torrentp'].append(torrent)
+        ds = torrent.ds
+        if ds:
+            progress = ds.get_progress()
 
+            stats = ds.get_seeding_statistics()
+            if stats:
+                dl = stats['total_down']
+                ul = stats['total_up']
+            else:
+                dl = ds.get_total_transferred(DOWNLOAD)
+                ul = ds.get_total_transferred(UPLOAD)
+
+            seeds, peers = ds.get_num_seeds_peers()
+            down_speed = ds.get_current_speed('down')
+            up_speed = ds.get_current_speed('up')
+            eta = ds.get_eta() or sys.maxsize
         else:
-            return_dict['torrents'] = new_torrent_list
-            cache_id = 0
+            progress = torrent.progress
+            dl = 0
+            ul = 0
+
+            seeds = peers = 0
+            down_speed = up_speed = 0
+            eta = sys.maxsize
+
+        torrent_list.append(int(progress * 1000))
+        dl = max(0, progress * torrent.length)
+        torrent_list.append(dl)
+        torrent_list.append(ul)
+
+        if dl == 0:
+            if ul != 0:
+                ratio = sys.maxsize
+            else:
+                ratio = 0
+        else:
+            ratio = 1.0 * ul / dl
 
-        cache_id += 1
-        self.currentTorrents[cache_id] = new_torrent_list
-        return_dict['torrentc'] = cache_id
+        torrent_list.append(int(ratio * 1000))
+        torrent_list.append(up_speed)
+        torrent_list.append(down_speed)
+        torrent_list.append(eta)
+        torrent_list.append('')
 
-        keys = self.currentTorrents.keys()[:-10]
-        for key in keys:
-            del self.currentTorrents[key]
+        torrent_list.append(peers)
+        torrent_list.append(peers)
+        torrent_list.append(seeds)
+        torrent_list.append(seeds)
+        torrent_list.append(1)
+        torrent_list.append(queue_position)
+        torrent_list.append(torrent.length - dl)
 
-        return return_dict
+        return torrent_list
 
     def doAction(self, args):
         action = args['action']
@@ -282,6 +438,8 @@ class WebUI(object):
                 elif action == 'removedata':
                     self.library_manager.deleteTorrent(torrent, removecontent=True)
 
+        # list the changes without waiting for the next download states callback
+        self._states_changed.set()
         return {}
 
     def doProps(self, args):
@@ -0,0 +1,23 @@
+'''
+The performance package contains benchmarks for Tribler components. They are not unit tests and are
+not picked up by the test runner; run them directly, e.g. python -m Tribler.Test.performance.<name>
+'''
+import time
+
+
+def measure(func, repeat=1):
+    """
+    Calls func repeat times and returns the average duration of a call in seconds.
+    """
+    start = time.time()
+    for _ in xrange(repeat):
+        func()
+    return (time.time() - start) / repeat
+
+
+def report(name, duration, baseline=None):
+    if baseline:
+        print "%-40s %10.3f ms (%.1fx faster than %.3f ms)" % (name, duration * 1000, baseline / max(duration, 1e-9),
+                                                               baseline * 1000)
+    else:
+        print "%-40s %10.3f ms" % (name, duration * 1000)
@@ -0,0 +1,65 @@
+"""
+Benchmarks the classification of torrents by Category and the XXXFilter.
+
+Synthetic torrents are built from a vocabulary of common words, category keywords, file extensions and a
+small fraction of terms from the family filter, and are classified with Category.calculateCategoryNonDict.
+"""
+import argparse
+import os
+import random
+import time
+
+from Tribler.Category.Category import Category
+
+WORDS = ["the", "movie", "season", "episode", "album", "live", "remastered", "collection", "hd", "1080p", "720p",
+         "dvdrip", "xvid", "divx", "x264", "complete", "edition", "vol", "part", "soundtrack", "ubuntu", "linux",
+         "documentary", "book", "ebook", "setup", "crack", "patch", "install", "readme", "cover", "sample"]
+EXTENSIONS = ["avi", "mkv", "mp4", "mp3", "flac", "pdf", "txt", "iso", "rar", "r01", "jpg", "nfo", "exe", "srt"]
+
+
+class FakeSession(object):
+
+    def get_install_dir(self):
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+
+def generate_torrents(nr_torrents, xxx_terms, xxx_ratio, seed=42):
+    rand = random.Random(seed)
+
+    def name(nr_words):
+        words = [rand.choice(WORDS) for _ in xrange(nr_words)]
+        if xxx_terms and rand.random() < xxx_ratio:
+            words[rand.randrange(nr_words)] = rand.choice(xxx_terms)
+        return " ".join(words)
+
+    torrents = []
+    for _ in xrange(nr_torrents):
+        files = [("%s.%s" % (name(rand.randint(2, 6)).replace(" ", "."), rand.choice(EXTENSIONS)),
+                  rand.expovariate(1 / 200.0)) for _ in xrange(rand.randint(1, 10))]
+        torrents.append((files, name(rand.randint(2, 8)), "http://tracker.example.org/announce", ""))
+    return torrents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the classification of torrents")
+    parser.add_argument("--torrents", type=int, default=100000, help="number of torrents to classify")
+    parser.add_argument("--xxx", type=float, default=0.05, help="fraction of names containing a filtered term")
+    args = parser.parse_args()
+
+    category = Category.getInstance(FakeSession())
+    torrents = generate_torrents(args.torrents, sorted(category.xxx_filter.xxx_terms), args.xxx)
+
+    counts = {}
+    start = time.time()
+    for files, display_name, tracker, comment in torrents:
+        result = category.calculateCategoryNonDict(files, display_name, tracker, comment)
+        counts[result] = counts.get(result, 0) + 1
+    duration = time.time() - start
+
+    print "classified %d torrents in %.2f s, %.0f torrents/s" % (args.torrents, duration, args.torrents / duration)
+    for name, count in sorted(counts.iteritems(), key=lambda item: item[1], reverse=True):
+        print "  %-12s %d" % (name, count)
+
+
+if __name__ == "__main__":
+    main()
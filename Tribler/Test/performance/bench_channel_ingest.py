@@ -0,0 +1,173 @@
+"""
+Benchmarks ChannelCastDBHandler.on_torrents_from_dispersy ingesting a large channel.
+
+The torrents of a single channel are stored in batches, as the channel community does when it receives them from
+other peers. The handler is compared against the per torrent loop it used before, which stored every new torrent
+with addExternalTorrentNoDef and looked up every channel torrent id with get_channel_torrent_id.
+"""
+import argparse
+import os
+import random
+import shutil
+from collections import defaultdict
+from hashlib import sha1
+from tempfile import mkdtemp
+from time import time
+
+from twisted.internet.threads import blockingCallFromThread
+
+from Tribler.Category.Category import Category
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import ChannelCastDBHandler, TorrentDBHandler
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, bin2str
+# the database is accessed from the reactor thread, importing twisted_thread starts it
+from Tribler.Core.Utilities.twisted_thread import reactor, stop_reactor
+from Tribler.Test.performance import measure, report
+
+WORDS = [u"%s%d" % (prefix, i) for prefix in (u"linux", u"album", u"movie", u"book", u"game") for i in xrange(200)]
+TRACKERS = ["http://tracker%d.example.org/announce" % i for i in xrange(20)]
+
+
+class FakeNotifier(object):
+
+    def notify(self, *args):
+        pass
+
+
+class FakeLaunchMany(object):
+
+    def __init__(self):
+        self.tracker_manager = None
+        self.torrent_store = None
+        self.rtorrent_handler = None
+
+
+class FakeSession(object):
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.notifier = FakeNotifier()
+        self.sqlite_db = None
+        self.lm = FakeLaunchMany()
+
+    def get_install_dir(self):
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+    def get_state_dir(self):
+        return self.state_dir
+
+    def get_torrent_store(self):
+        return False
+
+
+def create_torrents(nr_torrents, channel_id, seed=42):
+    """
+    Returns the torrents of a channel as the channel community passes them to on_torrents_from_dispersy.
+    """
+    rand = random.Random(seed)
+    now = long(time())
+    torrents = []
+    for dispersy_id in xrange(1, nr_torrents + 1):
+        name = u" ".join(rand.sample(WORDS, 4))
+        files = [(u"%s/file%d.avi" % (name, i), rand.randint(1, 2 ** 30)) for i in xrange(rand.randint(1, 5))]
+        torrents.append((channel_id, dispersy_id, None, sha1("torrent %d" % dispersy_id).digest(),
+                         now - rand.randint(0, 365 * 86400), name, files, rand.sample(TRACKERS, 2)))
+    return torrents
+
+
+def legacy_on_torrents_from_dispersy(handler, torrentlist):
+    """
+    Stores TORRENTLIST the way on_torrents_from_dispersy did before it was set based.
+    """
+    db = handler._db
+    torrent_db = handler.torrent_db
+    torrent_ids, inserted = torrent_db.addOrGetTorrentIDSReturn([torrent[3] for torrent in torrentlist])
+
+    insert_data = []
+    updated_channels = {}
+    for i, torrent in enumerate(torrentlist):
+        channel_id, dispersy_id, peer_id, infohash, timestamp, name, files, trackers = torrent
+        if infohash in inserted:
+            torrent_db.addExternalTorrentNoDef(infohash, name, files, trackers, timestamp, {'dispersy_id': dispersy_id})
+        insert_data.append((dispersy_id, torrent_ids[i], channel_id, peer_id, name, timestamp))
+        updated_channels[channel_id] = updated_channels.get(channel_id, 0) + 1
+
+    db.executemany(u"INSERT INTO _ChannelTorrents (dispersy_id, torrent_id, channel_id, peer_id, name, time_stamp) "
+                   u"VALUES (?,?,?,?,?,?)", insert_data)
+
+    updated_channel_torrent_dict = defaultdict(list)
+    for torrent in torrentlist:
+        channel_id, infohash = torrent[0], torrent[3]
+        updated_channel_torrent_dict[channel_id].append({u'info_hash': infohash,
+                                                         u'channel_torrent_id': handler.get_channel_torrent_id(
+                                                             channel_id, infohash)})
+
+    db.executemany(u"UPDATE _Channels SET modified = strftime('%s','now'), nr_torrents = nr_torrents+? WHERE id = ?",
+                   [(new_torrents, channel_id) for channel_id, new_torrents in updated_channels.iteritems()])
+
+
+def create_handler(working_directory, name):
+    session = FakeSession(os.path.join(working_directory, name))
+    os.makedirs(session.state_dir)
+    session.sqlite_db = SQLiteCacheDB(session)
+    session.sqlite_db.initialize(os.path.join(session.state_dir, u"tribler.sdb"))
+
+    torrent_db = TorrentDBHandler(session)
+    torrent_db.category = Category.getInstance(session)
+    handler = ChannelCastDBHandler(session)
+    handler.torrent_db = torrent_db
+    session.sqlite_db.execute_write(u"INSERT INTO _Channels (id, dispersy_cid, peer_id, name, modified) "
+                                    u"VALUES (?, ?, ?, ?, ?)", (1, bin2str(sha1(name).digest()), 1, u"channel",
+                                                                long(time())))
+    handler._channel_id = 1
+    return handler
+
+
+def get_contents(handler):
+    """
+    Returns what the ingestion stored, to check that both implementations store the same.
+    """
+    db = handler._db
+    return (db.fetchall(u"SELECT infohash, name, length, num_files, category FROM Torrent ORDER BY infohash"),
+            db.fetchone(u"SELECT COUNT(*) FROM FullTextIndex"),
+            db.fetchone(u"SELECT COUNT(*) FROM TorrentTrackerMapping"),
+            db.fetchone(u"SELECT COUNT(*) FROM TorrentFiles"),
+            db.fetchone(u"SELECT COUNT(*) FROM ChannelTorrents"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion of a large channel")
+    parser.add_argument("--torrents", type=int, default=50000, help="number of torrents in the channel")
+    parser.add_argument("--batch-size", type=int, default=100, help="number of torrents stored at once")
+    args = parser.parse_args()
+
+    working_directory = mkdtemp(suffix="_channel_ingest_benchmark")
+    try:
+        durations = []
+        contents = []
+        for name, ingest in [("legacy", legacy_on_torrents_from_dispersy),
+                             ("set based", ChannelCastDBHandler.on_torrents_from_dispersy)]:
+            handler = create_handler(working_directory, name)
+            torrents = create_torrents(args.torrents, handler._channel_id)
+            batches = [torrents[i:i + args.batch_size] for i in xrange(0, len(torrents), args.batch_size)]
+
+            def ingest_all():
+                for batch in batches:
+                    ingest(handler, batch)
+
+            # the channel community stores torrents on the reactor thread
+            durations.append(measure(lambda: blockingCallFromThread(reactor, ingest_all)))
+            contents.append(get_contents(handler))
+            handler._db.close()
+
+        assert contents[0] == contents[1], "both implementations must store the same"
+        report("per torrent loop, %d torrents" % args.torrents, durations[0])
+        report("set based, %d torrents" % args.torrents, durations[1], durations[0])
+        print "%.0f torrents/s instead of %.0f torrents/s" % (args.torrents / durations[1],
+                                                              args.torrents / durations[0])
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+        stop_reactor()
+
+
+if __name__ == "__main__":
+    main()
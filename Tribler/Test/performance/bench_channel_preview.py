@@ -0,0 +1,134 @@
+"""
+Benchmarks ChannelCastDBHandler.getRecentAndRandomTorrents on a database with many channels.
+
+The handler is compared against the ORDER BY random() queries it used before the channel torrent samples were
+introduced. Both are run with the arguments used by the AllChannelCommunity when creating a channelcast message.
+"""
+import argparse
+import os
+import random
+import shutil
+from hashlib import sha1
+from tempfile import mkdtemp
+from time import time
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import ChannelCastDBHandler
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, bin2str
+# the database is accessed from the reactor thread, importing twisted_thread starts it
+from Tribler.Core.Utilities.twisted_thread import stop_reactor
+from Tribler.Test.performance import measure, report
+
+LEGACY_QUERIES = [
+    """SELECT dispersy_cid, infohash, time_stamp from ChannelTorrents, Channels, Torrent
+    WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+    AND ChannelTorrents.channel_id==? and ChannelTorrents.dispersy_id <> -1 order by time_stamp desc limit ?""",
+    """SELECT dispersy_cid, infohash from ChannelTorrents, Channels, Torrent
+    WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+    AND ChannelTorrents.channel_id==? AND time_stamp<?
+    AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?""",
+    """SELECT dispersy_cid, infohash, time_stamp from ChannelTorrents, Channels, Torrent
+    WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+    AND ChannelTorrents.channel_id in (select channel_id from ChannelVotes
+    WHERE voter_id ISNULL AND vote=2) and ChannelTorrents.dispersy_id <> -1 ORDER BY time_stamp desc limit ?""",
+    """SELECT dispersy_cid, infohash FROM ChannelTorrents, Channels, Torrent
+    WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+    AND ChannelTorrents.channel_id in (select channel_id from ChannelVotes
+    WHERE voter_id ISNULL and vote=2) and time_stamp < ?
+    AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?""",
+    """SELECT dispersy_cid, infohash from ChannelTorrents, Channels, Torrent
+    WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+    AND ChannelTorrents.channel_id in (select distinct channel_id from ChannelTorrents
+    WHERE torrent_id in (select torrent_id from MyPreference))
+    AND ChannelTorrents.dispersy_id <> -1 and Channels.modified > ? order by time_stamp desc limit ?"""]
+
+
+class FakeSession(object):
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.notifier = None
+        self.sqlite_db = None
+
+    def get_install_dir(self):
+        return os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+    def get_state_dir(self):
+        return self.state_dir
+
+
+def populate(db, nr_channels, torrents_per_channel, nr_favorites, nr_preferences):
+    now = long(time())
+    db.executemany(u"INSERT INTO _Channels (id, dispersy_cid, peer_id, name, modified) VALUES (?, ?, ?, ?, ?)",
+                   [(channel_id, bin2str(sha1("channel %d" % channel_id).digest()), channel_id,
+                     u"channel %d" % channel_id, now) for channel_id in xrange(1, nr_channels + 1)])
+
+    nr_torrents = nr_channels * torrents_per_channel
+    db.executemany(u"INSERT INTO Torrent (torrent_id, infohash, name) VALUES (?, ?, ?)",
+                   [(torrent_id, bin2str(sha1(str(torrent_id)).digest()), u"torrent %d" % torrent_id)
+                    for torrent_id in xrange(1, nr_torrents + 1)])
+    db.executemany(u"INSERT INTO _ChannelTorrents (dispersy_id, torrent_id, channel_id, name, time_stamp) "
+                   u"VALUES (?, ?, ?, ?, ?)",
+                   [(torrent_id, torrent_id, (torrent_id - 1) % nr_channels + 1, u"torrent %d" % torrent_id,
+                     now - random.randint(0, 365 * 24 * 3600)) for torrent_id in xrange(1, nr_torrents + 1)])
+
+    db.executemany(u"INSERT INTO _ChannelVotes (channel_id, voter_id, vote, time_stamp) VALUES (?, NULL, 2, ?)",
+                   [(channel_id, now) for channel_id in random.sample(xrange(2, nr_channels + 1), nr_favorites)])
+    db.executemany(u"INSERT INTO MyPreference (torrent_id, destination_path, creation_time) VALUES (?, ?, ?)",
+                   [(torrent_id, u"/tmp", now) for torrent_id in random.sample(xrange(1, nr_torrents + 1),
+                                                                                nr_preferences)])
+
+
+def legacy_get_recent_and_random(db, channel_id):
+    """
+    Runs the queries of the previous implementation, with the default arguments.
+    """
+    recent = db.fetchall(LEGACY_QUERIES[0], (channel_id, 15))
+    if len(recent) == 15:
+        db.fetchall(LEGACY_QUERIES[1], (channel_id, recent[-1][2], 10))
+    recent = db.fetchall(LEGACY_QUERIES[2], (15,))
+    if len(recent) == 15:
+        db.fetchall(LEGACY_QUERIES[3], (recent[-1][2], 10))
+    db.fetchall(LEGACY_QUERIES[4], (long(time() - 5259487), 5))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the selection of channelcast torrents")
+    parser.add_argument("--channels", type=int, default=10000, help="number of channels")
+    parser.add_argument("--torrents", type=int, default=20, help="number of torrents per channel")
+    parser.add_argument("--favorites", type=int, default=25, help="number of favorite channels")
+    parser.add_argument("--preferences", type=int, default=50, help="number of downloaded torrents")
+    parser.add_argument("--rounds", type=int, default=20, help="number of channelcast rounds to average over")
+    args = parser.parse_args()
+
+    working_directory = mkdtemp(suffix="_channel_preview_benchmark")
+    try:
+        session = FakeSession(working_directory)
+        db = session.sqlite_db = SQLiteCacheDB(session)
+        db.initialize(os.path.join(working_directory, u"tribler.sdb"))
+
+        print "Inserting %d channels with %d torrents each..." % (args.channels, args.torrents)
+        populate(db, args.channels, args.torrents, args.favorites, args.preferences)
+
+        handler = ChannelCastDBHandler(session)
+        handler._channel_id = 1
+
+        legacy = measure(lambda: legacy_get_recent_and_random(db, 1), args.rounds)
+        report("ORDER BY random() queries", legacy)
+        report("getRecentAndRandomTorrents (cold)", measure(handler.getRecentAndRandomTorrents), legacy)
+        report("getRecentAndRandomTorrents", measure(handler.getRecentAndRandomTorrents, args.rounds), legacy)
+
+        # new torrents arriving in a favorite channel only touch its sample
+        channel_id = db.fetchone(u"SELECT channel_id FROM ChannelVotes LIMIT 1")
+        start = time()
+        for i in xrange(1000):
+            handler._channel_samples[channel_id].add(long(start) + i, os.urandom(20))
+        report("1000 sample updates", time() - start)
+
+        db.close()
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+        stop_reactor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Microbenchmark of the "a" wire encoding, comparing Tribler.Core.Utilities.encoding with the recursive
+implementation it replaced.
+
+The payloads mimic the messages that go through the codec most: the torrent message of the channel community, a
+search response of the search community and a channelcast message of the allchannel community.
+"""
+import argparse
+import random
+from hashlib import sha1
+from struct import pack
+
+from Tribler.Core.Utilities.encoding import decode, encode
+from Tribler.Test import legacy_encoding
+from Tribler.Test.performance import measure, report
+
+
+def random_name(rand):
+    return u" ".join(rand.choice([u"linux", u"album", u"live", u"1080p", u"season", u"episode", u"ubuntu"])
+                     for _ in xrange(rand.randint(2, 8)))
+
+
+def torrent_payload(rand):
+    files = tuple((random_name(rand) + u".avi", rand.randint(1, 2 ** 40)) for _ in xrange(rand.randint(1, 50)))
+    trackers = tuple("http://tracker%d.example.org/announce" % i for i in xrange(rand.randint(1, 10)))
+    return pack('!20sQ', sha1(str(rand.random())).digest(), 1234567890), random_name(rand), files, trackers
+
+
+def search_response_payload(rand):
+    results = [(sha1(str(rand.random())).digest(), random_name(rand), rand.randint(1, 2 ** 40), rand.randint(1, 50),
+                (u"Video",), rand.randint(0, 2 ** 31), rand.randint(0, 1000), rand.randint(0, 1000),
+                sha1(str(rand.random())).digest() if rand.random() < 0.5 else None) for _ in xrange(25)]
+    return pack('!H', rand.randint(0, 2 ** 16 - 1)), results
+
+
+def channelcast_payload(rand):
+    return dict((sha1(str(rand.random())).digest(), set(sha1(str(rand.random())).digest() for _ in xrange(10)))
+                for _ in xrange(10))
+
+
+PAYLOADS = [("torrent", torrent_payload), ("search response", search_response_payload),
+            ("channelcast", channelcast_payload)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=1000, help="number of messages of every kind")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times every measurement is repeated")
+    args = parser.parse_args()
+
+    rand = random.Random(42)
+    for name, create_payload in PAYLOADS:
+        payloads = [create_payload(rand) for _ in xrange(args.messages)]
+        streams = [encode(payload) for payload in payloads]
+        assert streams == [legacy_encoding.encode(payload) for payload in payloads]
+        print "%s: %d messages of %.0f bytes on average" % (name, len(streams),
+                                                             sum(len(stream) for stream in streams) / len(streams))
+
+        def encode_all(encode=encode):
+            for payload in payloads:
+                encode(payload)
+
+        def decode_all(decode=decode):
+            for stream in streams:
+                decode(stream)
+
+        baseline = measure(lambda: encode_all(legacy_encoding.encode), args.repeat)
+        report("  encode", measure(encode_all, args.repeat), baseline)
+        baseline = measure(lambda: decode_all(legacy_encoding.decode), args.repeat)
+        report("  decode", measure(decode_all, args.repeat), baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+End-to-end benchmark of a Session against local fake services, so it runs offline and gives the same workload on
+every run.
+
+A fake HTTP and UDP tracker, a Session seeding over the loopback interface and a publisher of synthetic channels
+are started next to the Session under test. Every scenario records its throughput, the lag of the reactor and the
+memory use of the process while it runs, and the results are written as JSON so runs of different revisions can
+be compared, e.g.:
+
+    python -m Tribler.Test.performance.bench_end_to_end --label baseline --output baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+from time import sleep, time
+
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import blockingCallFromThread
+
+from Tribler.Core.DownloadConfig import DownloadStartupConfig
+from Tribler.Core.Session import Session
+from Tribler.Core.SessionConfig import SessionStartupConfig
+from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.Utilities.network_utils import get_random_port
+from Tribler.Core.Utilities.twisted_thread import reactor
+from Tribler.Core.simpledefs import NTFY_TORRENTS
+from Tribler.Test.performance.fake_services import ChannelPublisher, FakeTracker, LoopbackSeeder
+
+SCENARIOS = ["ingest", "search", "collect", "health", "download"]
+SEARCH_KEYS = ['infohash', 'T.name', 'T.length', 'T.num_files', 'T.category', 'T.creation_date', 'T.num_seeders',
+               'T.num_leechers']
+
+
+def get_memory_usage():
+    """
+    Returns the resident set size of this process in bytes.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    # the peak on platforms without /proc, in kilobytes on Linux and in bytes on OS X
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if platform.system() == "Darwin" else usage * 1024
+
+
+class ReactorMonitor(object):
+    """
+    Measures how late the reactor runs a call scheduled every interval seconds, and samples the memory use.
+    """
+
+    def __init__(self, interval=0.05):
+        super(ReactorMonitor, self).__init__()
+        self.interval = interval
+        self.lags = []
+        self.memory = []
+        self._last_call = None
+        self._looping_call = LoopingCall(self._tick)
+
+    def _tick(self):
+        now = time()
+        if self._last_call is not None:
+            self.lags.append(max(0.0, now - self._last_call - self.interval))
+        self._last_call = now
+        self.memory.append(get_memory_usage())
+
+    def start(self):
+        self.lags = []
+        self.memory = []
+        self._last_call = None
+        self._looping_call.start(self.interval)
+
+    def stop(self):
+        self._looping_call.stop()
+
+    def get_statistics(self):
+        lags = sorted(self.lags) or [0.0]
+        return {'reactor_lag_mean': sum(lags) / len(lags),
+                'reactor_lag_p99': lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+                'reactor_lag_max': lags[-1],
+                'memory_peak': max(self.memory or [0])}
+
+
+class EndToEndBenchmark(object):
+
+    def __init__(self, options):
+        super(EndToEndBenchmark, self).__init__()
+        self.options = options
+        self.state_dir = tempfile.mkdtemp(prefix=u"tribler_bench_")
+
+        self.tracker = FakeTracker()
+        self.monitor = ReactorMonitor()
+        self.seeder = None
+        self.session = None
+        self.publisher = None
+
+    def get_config(self, name):
+        config = SessionStartupConfig()
+        config.set_state_dir(os.path.join(self.state_dir, name))
+        config.set_torrent_checking(False)
+        config.set_multicast_local_peer_discovery(False)
+        config.set_megacache(False)
+        config.set_dispersy(False)
+        config.set_mainline_dht(False)
+        config.set_torrent_store(False)
+        config.set_enable_torrent_search(False)
+        config.set_enable_channel_search(False)
+        config.set_torrent_collecting(False)
+        config.set_libtorrent(False)
+        config.set_dht_torrent_collecting(False)
+        config.set_videoplayer(False)
+        config.set_enable_metadata(False)
+        config.set_listen_port(get_random_port())
+        config.set_dispersy_port(get_random_port())
+        return config
+
+    def start(self):
+        blockingCallFromThread(reactor, self.tracker.start)
+
+        config = self.get_config(u"session")
+        config.set_megacache(True)
+        config.set_torrent_store(True)
+        config.set_torrent_checking(True)
+        config.set_libtorrent(True)
+        config.set_dispersy(True)
+        config.set_torrent_collecting(True)
+
+        self.session = Session(config, ignore_singleton=True, autoload_discovery=False)
+        upgrader = self.session.prestart()
+        while not upgrader.is_done:
+            sleep(0.1)
+        self.session.start()
+
+        self.publisher = ChannelPublisher(self.session, [self.tracker.http_announce_url,
+                                                         self.tracker.udp_announce_url])
+
+    def stop(self):
+        if self.seeder:
+            self.seeder.stop()
+        if self.session:
+            self.session.shutdown()
+            while not self.session.has_shutdown():
+                sleep(0.1)
+        blockingCallFromThread(reactor, self.tracker.stop)
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def run_scenario(self, name):
+        blockingCallFromThread(reactor, self.monitor.start)
+        memory_before = get_memory_usage()
+
+        start = time()
+        operations, unit = getattr(self, "scenario_%s" % name)()
+        duration = time() - start
+
+        blockingCallFromThread(reactor, self.monitor.stop)
+        result = {'duration': duration,
+                  'operations': operations,
+                  'throughput': operations / max(duration, 1e-9),
+                  'unit': unit,
+                  'memory_before': memory_before,
+                  'memory_after': get_memory_usage()}
+        result.update(self.monitor.get_statistics())
+        print "%-10s %10.1f %-12s in %8.2f s, reactor lag max %6.1f ms" % (
+            name, result['throughput'], unit, duration, result['reactor_lag_max'] * 1000)
+        return result
+
+    def scenario_ingest(self):
+        """
+        Stores the torrents of synthetic channels, as received from other peers.
+        """
+        blockingCallFromThread(reactor, self.publisher.create_channels, self.options.channels)
+        nr_torrents = blockingCallFromThread(reactor, self.publisher.publish,
+                                             self.options.torrents // self.options.channels)
+        return nr_torrents, "torrents/s"
+
+    def scenario_search(self):
+        """
+        Searches the local database for the words the synthetic torrents are named after.
+        """
+        torrent_db = self.session.open_dbhandler(NTFY_TORRENTS)
+        queries = self.publisher.words[:100]
+        for query in queries:
+            blockingCallFromThread(reactor, torrent_db.searchNames, [query], local=False, keys=SEARCH_KEYS)
+        return len(queries), "queries/s"
+
+    def scenario_collect(self):
+        """
+        Saves complete torrent files into the torrent store, as when they are collected from other peers.
+        """
+        nr_torrents = min(self.options.torrents, 1000)
+        for i in xrange(nr_torrents):
+            tdef = TorrentDef()
+            tdef.add_content(self.payload_path, u"payload %d" % i)
+            tdef.set_tracker(self.tracker.http_announce_url)
+            tdef.set_comment(u"torrent %d" % i)
+            tdef.finalize()
+            # save_torrent only queues the work when called from another thread, wait for it to be stored
+            blockingCallFromThread(reactor, self.session.lm.rtorrent_handler.save_torrent, tdef)
+        return nr_torrents, "torrents/s"
+
+    def scenario_health(self):
+        """
+        Checks the health of the published torrents at the fake trackers.
+        """
+        infohashes = self.publisher.infohashes[:min(len(self.publisher.infohashes), 500)]
+        for i, infohash in enumerate(infohashes):
+            self.tracker.set_swarm(infohash, i % 50, i % 7)
+            self.session.lm.torrent_checker.add_gui_request(infohash)
+
+        torrent_db = self.session.open_dbhandler(NTFY_TORRENTS)
+        deadline = time() + 120
+        nr_checked = 0
+        while time() < deadline:
+            nr_checked = blockingCallFromThread(reactor, torrent_db._db.fetchone,
+                                                u"SELECT COUNT(*) FROM Torrent WHERE last_tracker_check > 0")
+            if nr_checked >= len(infohashes):
+                break
+            sleep(0.1)
+        return nr_checked, "checks/s"
+
+    def scenario_download(self):
+        """
+        Downloads the payload from the loopback seeder.
+        """
+        self.seeder = LoopbackSeeder(os.path.join(self.state_dir, u"seeder"), self.tracker.http_announce_url,
+                                     self.options.download_size)
+        tdef = self.seeder.start(self.get_config(u"seeder"))
+
+        dscfg = DownloadStartupConfig()
+        dscfg.set_dest_dir(os.path.join(self.state_dir, u"downloads"))
+        download = self.session.start_download(tdef, dscfg)
+
+        deadline = time() + 300
+        while download.get_progress() < 1.0 and time() < deadline:
+            sleep(0.1)
+        return int(download.get_progress() * self.options.download_size), "bytes/s"
+
+    def run(self, scenarios):
+        # the collect scenario creates its torrents from a small file
+        self.payload_path = os.path.join(self.state_dir, u"payload.bin")
+        with open(self.payload_path, 'wb') as f:
+            f.write(os.urandom(64 * 1024))
+
+        results = {}
+        self.start()
+        try:
+            for name in scenarios:
+                results[name] = self.run_scenario(name)
+            results['tracker'] = {'announces': self.tracker.nr_announces, 'scrapes': self.tracker.nr_scrapes}
+            results['startup_timings'] = getattr(self.session.lm, 'startup_timings', None)
+        finally:
+            self.stop()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="file to write the results to as JSON, printed when omitted")
+    parser.add_argument("--label", default="", help="name of this run in the results, e.g. a revision")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated scenarios to run, from %s" % ", ".join(SCENARIOS))
+    parser.add_argument("--torrents", type=int, default=10000, help="number of torrents to publish")
+    parser.add_argument("--channels", type=int, default=20, help="number of channels to publish them in")
+    parser.add_argument("--download-size", type=int, default=64 * 1024 * 1024, help="size of the download in bytes")
+    options = parser.parse_args()
+
+    scenarios = [name for name in options.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error("unknown scenarios: %s" % ", ".join(sorted(unknown)))
+    if "ingest" not in scenarios and set(scenarios) & {"search", "health"}:
+        parser.error("the search and health scenarios need the torrents of the ingest scenario")
+
+    results = {'label': options.label,
+               'timestamp': time(),
+               'platform': platform.platform(),
+               'python': platform.python_version(),
+               'options': vars(options),
+               'scenarios': EndToEndBenchmark(options).run(scenarios)}
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output)
+    else:
+        print output
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmarks the chain head lookups of the MultiChainDB on a large chain.
+
+Compares the indexed and cached lookups against the UNION scans that were used before database version 2.
+"""
+import argparse
+import os
+import random
+import shutil
+from hashlib import sha1
+from tempfile import mkdtemp
+
+from Tribler.Test.performance import measure, report
+from Tribler.community.multichain.database import MultiChainDB, DATABASE_DIRECTORY, index_schema
+
+LEGACY_TOTAL_QUERY = u"SELECT total_up, total_down, MAX(sequence_number) FROM (" \
+                     u"SELECT total_up_requester AS total_up, total_down_requester AS total_down, " \
+                     u"sequence_number_requester AS sequence_number FROM multi_chain " \
+                     u"WHERE mid_requester == ? UNION " \
+                     u"SELECT total_up_responder AS total_up, total_down_responder AS total_down, " \
+                     u"sequence_number_responder AS sequence_number FROM multi_chain WHERE mid_responder = ? )" \
+                     u"LIMIT 1"
+
+
+def generate_blocks(nr_blocks, nr_members):
+    mids = [sha1(str(i)).digest() for i in xrange(nr_members)]
+    sequence_numbers = [0] * nr_members
+    totals = [[0, 0] for _ in xrange(nr_members)]
+    previous_hashes = [sha1("genesis").digest()] * nr_members
+
+    for block_nr in xrange(nr_blocks):
+        requester, responder = random.sample(xrange(nr_members), 2)
+        up, down = random.randint(0, 1024), random.randint(0, 1024)
+        block_hash = sha1(str(block_nr)).digest()
+
+        totals[requester][0] += up
+        totals[requester][1] += down
+        totals[responder][0] += down
+        totals[responder][1] += up
+        sequence_numbers[requester] += 1
+        sequence_numbers[responder] += 1
+
+        yield (buffer(block_hash), up, down,
+               totals[requester][0], totals[requester][1], sequence_numbers[requester],
+               buffer(previous_hashes[requester]),
+               totals[responder][0], totals[responder][1], sequence_numbers[responder],
+               buffer(previous_hashes[responder]),
+               buffer(mids[requester]), buffer(""), buffer(mids[responder]), buffer(""))
+
+        previous_hashes[requester] = previous_hashes[responder] = block_hash
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MultiChain database")
+    parser.add_argument("--blocks", type=int, default=1000000, help="number of blocks in the chain")
+    parser.add_argument("--members", type=int, default=1000, help="number of members in the chain")
+    parser.add_argument("--lookups", type=int, default=100, help="number of lookups to average over")
+    args = parser.parse_args()
+
+    working_directory = mkdtemp(suffix="_multichain_benchmark")
+    try:
+        os.makedirs(os.path.join(working_directory, DATABASE_DIRECTORY))
+        db = MultiChainDB(None, working_directory)
+
+        print "Inserting %d blocks for %d members..." % (args.blocks, args.members)
+        insert_time = measure(lambda: db.executemany(
+            u"INSERT INTO multi_chain (block_hash, up, down, "
+            u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester,"
+            u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder,"
+            u"mid_requester, signature_requester, mid_responder, signature_responder) "
+            u"VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", generate_blocks(args.blocks, args.members)))
+        db.commit()
+        report("insert", insert_time)
+
+        # measure the version 1 schema, without the member indexes
+        db.executescript(u"DROP INDEX multi_chain_requester_idx; DROP INDEX multi_chain_responder_idx;")
+
+        mids = [sha1(str(i)).digest() for i in random.sample(xrange(args.members), args.lookups)]
+        mid_iter = iter(mids * 2)
+
+        def legacy_lookup():
+            mid = buffer(next(mid_iter))
+            db.execute(LEGACY_TOTAL_QUERY, (mid, mid)).fetchone()
+
+        legacy = measure(legacy_lookup, args.lookups)
+        report("get_total (UNION scan)", legacy)
+
+        report("upgrade to version 2 (create indexes)", measure(lambda: db.executescript(index_schema)))
+
+        mid_iter = iter(mids * 2)
+        report("get_total (indexed, cold cache)", measure(lambda: db.get_total(next(mid_iter)), args.lookups), legacy)
+        mid_iter = iter(mids * 2)
+        report("get_total (cached)", measure(lambda: db.get_total(next(mid_iter)), args.lookups), legacy)
+        db.close()
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
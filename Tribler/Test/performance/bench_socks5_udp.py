@@ -0,0 +1,156 @@
+"""
+Benchmarks the UDP associate path of the SOCKS5 server on loopback.
+
+A client socket sends SOCKS5 UDP datagrams to a SocksUDPConnection, which hands them to a fake circuit that
+only counts the bytes it is asked to tunnel. The reverse direction (data coming out of the tunnel) is measured
+by calling Socks5Connection.on_incoming_from_tunnel directly.
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+
+from twisted.internet import reactor
+
+from Tribler.Test.performance import measure, report
+from Tribler.community.tunnel import CIRCUIT_STATE_READY
+from Tribler.community.tunnel.Socks5 import conversion
+from Tribler.community.tunnel.Socks5.server import Socks5Connection, SocksUDPConnection
+
+
+class CountingCircuit(object):
+
+    def __init__(self, circuit_id):
+        self.circuit_id = circuit_id
+        self.state = CIRCUIT_STATE_READY
+        self.bytes_tunneled = self.packets_tunneled = 0
+
+    def tunnel_data(self, destination, payload):
+        self.bytes_tunneled += len(payload)
+        self.packets_tunneled += 1
+
+
+class FixedSelectionStrategy(object):
+
+    def __init__(self, circuit):
+        self.circuit = circuit
+
+    def select(self, destination, hops):
+        return self.circuit
+
+
+class LegacySocksUDPConnection(SocksUDPConnection):
+
+    """
+    Decodes every datagram with conversion.decode_udp_packet, like the UDP associate did before.
+    """
+
+    def datagramReceived(self, data, source):
+        if self.remote_udp_address is None:
+            self.remote_udp_address = source
+
+        if self.remote_udp_address == source:
+            request = conversion.decode_udp_packet(data)
+            if request.frag == 0:
+                circuit = self.socksconnection.select(request.destination)
+                if circuit and circuit.state == CIRCUIT_STATE_READY:
+                    circuit.tunnel_data(request.destination, request.payload)
+
+
+class NullUDPSocket(object):
+
+    def __init__(self):
+        self.bytes_sent = 0
+
+    def sendDatagram(self, data):
+        self.bytes_sent += len(data)
+
+
+def send_datagrams(port, datagrams):
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for datagram in datagrams:
+        client.sendto(datagram, ("127.0.0.1", port))
+        # do not overrun the receive buffer of the association
+        time.sleep(0)
+    client.close()
+
+
+def run_upstream(udp_class, datagrams, timeout):
+    circuit = CountingCircuit(1)
+    connection = Socks5Connection(None, FixedSelectionStrategy(circuit), 1)
+    udp_connection = udp_class(connection, ("0.0.0.0", 0))
+    expected_packets = len(datagrams)
+
+    result = {}
+
+    def check():
+        if circuit.packets_tunneled >= expected_packets or time.time() - result["start"] > timeout:
+            result["duration"] = time.time() - result["start"]
+            reactor.stop()
+        else:
+            reactor.callLater(0.01, check)
+
+    def start():
+        result["start"] = time.time()
+        sender = threading.Thread(target=send_datagrams, args=(udp_connection.get_listen_port(), datagrams))
+        sender.daemon = True
+        sender.start()
+        check()
+
+    reactor.callWhenRunning(start)
+    reactor.run(installSignalHandlers=False)
+    udp_connection.close()
+    return result["duration"], circuit.packets_tunneled, circuit.bytes_tunneled
+
+
+def legacy_on_incoming_from_tunnel(connection, circuit, origin, data):
+    if circuit in connection.destinations.values():
+        connection.destinations[origin] = circuit
+        connection._udp_socket.sendDatagram(conversion.encode_udp_packet(
+            0, 0, conversion.ADDRESS_TYPE_IPV4, origin[0], origin[1], data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SOCKS5 UDP associate on loopback")
+    parser.add_argument("--packets", type=int, default=50000, help="number of datagrams to send")
+    parser.add_argument("--size", type=int, default=1400, help="payload size of a datagram")
+    parser.add_argument("--peers", type=int, default=200, help="number of distinct destinations")
+    parser.add_argument("--timeout", type=float, default=30.0, help="maximum duration of a run in seconds")
+    parser.add_argument("--legacy", action="store_true", help="measure the upstream path of the previous decoder")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size)
+    peers = [("10.0.%d.%d" % (i // 250, i % 250 + 1), 6881 + i) for i in xrange(args.peers)]
+    datagrams = [conversion.encode_udp_packet(0, 0, conversion.ADDRESS_TYPE_IPV4, peer[0], peer[1], payload)
+                 for peer in (peers[i % len(peers)] for i in xrange(args.packets))]
+
+    # the reactor can only be run once, so a single upstream implementation is measured per invocation
+    udp_class = LegacySocksUDPConnection if args.legacy else SocksUDPConnection
+    duration, packets, received = run_upstream(udp_class, datagrams, args.timeout)
+    print "upstream %-8s %8.0f datagrams/s, %7.2f MB/s, %d/%d datagrams tunneled" % (
+        "legacy" if args.legacy else "current", packets / duration, received / duration / 1024 / 1024, packets,
+        args.packets)
+
+    # downstream, data coming out of the circuits towards libtorrent
+    circuits = [CountingCircuit(i) for i in xrange(10)]
+    connection = Socks5Connection(None, None, 1)
+    connection._udp_socket = NullUDPSocket()
+    for i, peer in enumerate(peers):
+        connection.set_destination(peer, circuits[i % len(circuits)])
+
+    def downstream(func):
+        def run():
+            for i in xrange(args.packets):
+                func(circuits[i % len(circuits)], peers[i % len(peers)])
+        return run
+
+    legacy = measure(downstream(lambda circuit, origin: legacy_on_incoming_from_tunnel(
+        connection, circuit, origin, payload)))
+    current = measure(downstream(lambda circuit, origin: connection.on_incoming_from_tunnel(
+        None, circuit, origin, payload)))
+    report("downstream %d datagrams" % args.packets, current, legacy)
+
+
+if __name__ == "__main__":
+    main()
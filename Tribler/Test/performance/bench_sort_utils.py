@@ -0,0 +1,65 @@
+"""
+Benchmarks sort_torrent_fulltext ranking the search results shown by the GUI.
+
+The hits are GUI Torrent tuples, as the search grid manager sorts them. Computing the statistics of all fields at once
+is compared with the implementation it replaced, which normalized every field with normalize_data_dict.
+"""
+import argparse
+import random
+from hashlib import sha1
+
+from Tribler.Core.Utilities.sort_utils import normalize_data_dict, sort_torrent_fulltext
+from Tribler.Main.Utility.GuiDBTuples import Torrent
+from Tribler.Test.performance import measure, report
+
+
+def create_hits(nr_hits, seed=42):
+    rand = random.Random(seed)
+    hits = []
+    for i in xrange(nr_hits):
+        hit = Torrent(i, sha1(str(i)).digest(), u"torrent %d" % i, rand.randint(1, 2 ** 32), u"Video", u"good",
+                      int(rand.paretovariate(1)), rand.randint(0, 100), False)
+        hit.relevance_score = [rand.randint(1, 3), -rand.randint(0, 5), rand.randint(0, 2), 0, 0]
+        hits.append(hit)
+    return hits
+
+
+def legacy_sort_torrent_fulltext(data_set):
+    """
+    Sorts DATA_SET the way sort_torrent_fulltext did before it computed the statistics of all fields at once.
+    """
+    norm_num_seeders = normalize_data_dict(data_set, 'num_seeders', 'infohash')
+    norm_neg_votes = normalize_data_dict(data_set, 'neg_votes', 'infohash')
+    norm_subscriptions = normalize_data_dict(data_set, 'subscriptions', 'infohash')
+
+    for data in data_set:
+        score = 0.8 * norm_num_seeders[data.get('infohash')]\
+            - 0.1 * norm_neg_votes[data.get('infohash')]\
+            + 0.1 * norm_subscriptions[data.get('infohash')]
+        data.get('relevance_score')[-1] = score
+
+    data_set.sort(key=lambda d: d.get('relevance_score'), reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hits", type=int, default=10000, help="number of search results")
+    parser.add_argument("--repeat", type=int, default=20, help="number of times every measurement is repeated")
+    args = parser.parse_args()
+
+    hits = create_hits(args.hits)
+    sorted_hits = list(hits)
+    sort_torrent_fulltext(sorted_hits)
+    legacy_sorted_hits = list(hits)
+    legacy_sort_torrent_fulltext(legacy_sorted_hits)
+    assert sorted_hits == legacy_sorted_hits
+
+    # every measurement sorts the hits in their original order
+    baseline = measure(lambda: legacy_sort_torrent_fulltext(list(hits)), args.repeat)
+    report("normalize_data_dict, %d hits" % args.hits, baseline)
+    report("all fields at once, %d hits" % args.hits,
+           measure(lambda: sort_torrent_fulltext(list(hits)), args.repeat), baseline)
+
+
+if __name__ == "__main__":
+    main()
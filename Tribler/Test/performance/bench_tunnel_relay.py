@@ -0,0 +1,141 @@
+"""
+Benchmarks the relay path of the TunnelCommunity on loopback.
+
+A relay is set up between two local UDP sockets and data packets are pushed through
+TunnelCommunity.relay_packet as fast as possible, once through the relay fast path and once through
+the previous implementation (swap_circuit_id with inline byte accounting).
+"""
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from Tribler.Test.performance import report
+from Tribler.community.tunnel import ORIGINATOR
+from Tribler.community.tunnel.conversion import TunnelConversion
+from Tribler.community.tunnel.crypto.tunnelcrypto import CryptoException, NoTunnelCrypto, TunnelCrypto
+from Tribler.community.tunnel.routing import RelayRoute
+from Tribler.community.tunnel.tunnel_community import TunnelCommunity, TunnelSettings
+from Tribler.dispersy.candidate import Candidate
+
+INCOMING_CIRCUIT_ID = 1
+OUTGOING_CIRCUIT_ID = 2
+
+
+class LoopbackRelay(TunnelCommunity):
+
+    """
+    A TunnelCommunity that only relays, it sends its packets straight to a UDP socket instead of through Dispersy.
+    """
+
+    def __init__(self, crypto, previous_hop, next_hop):
+        self.tunnel_logger = logging.getLogger('TunnelLogger')
+        self.settings = TunnelSettings()
+        self.settings.crypto = crypto
+        self.stats = defaultdict(int)
+        self.multichain_scheduler = None
+        self.relay_bytes_pending = defaultdict(int)
+        self.waiting_for = set()
+
+        self.relay_from_to = {INCOMING_CIRCUIT_ID: RelayRoute(OUTGOING_CIRCUIT_ID, next_hop),
+                              OUTGOING_CIRCUIT_ID: RelayRoute(INCOMING_CIRCUIT_ID, previous_hop)}
+        self.directions = {INCOMING_CIRCUIT_ID: ORIGINATOR}
+        self.relay_session_keys = {INCOMING_CIRCUIT_ID: list(crypto.generate_session_keys(os.urandom(32)))}
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send_packet(self, candidates, message_type, packet):
+        for candidate in candidates:
+            self.socket.sendto(packet, candidate.sock_addr)
+        return len(packet)
+
+    def legacy_relay_packet(self, circuit_id, message_type, packet):
+        if self.is_relay(circuit_id):
+            next_relay = self.relay_from_to[circuit_id]
+            this_relay = self.relay_from_to.get(next_relay.circuit_id, None)
+
+            if this_relay:
+                this_relay.last_incoming = time.time()
+                self.increase_bytes_received(this_relay, len(packet))
+
+            plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, message_type)
+            try:
+                encrypted = self.crypto_relay(circuit_id, encrypted)
+            except CryptoException:
+                return False
+            packet = plaintext + encrypted
+
+            packet = TunnelConversion.swap_circuit_id(packet, message_type, circuit_id, next_relay.circuit_id)
+            self.increase_bytes_sent(next_relay, self.send_packet(
+                [Candidate(next_relay.sock_addr, False)], message_type, packet))
+            return True
+        return False
+
+
+class Receiver(threading.Thread):
+
+    def __init__(self):
+        super(Receiver, self).__init__(name="RelayBenchmarkReceiver")
+        self.daemon = True
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.settimeout(0.5)
+        self.received_bytes = self.received_packets = 0
+
+    @property
+    def address(self):
+        return self.socket.getsockname()
+
+    def run(self):
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except socket.timeout:
+                continue
+            self.received_packets += 1
+            self.received_bytes += len(data)
+
+
+def run(relay_func, relay, receiver, nr_packets, packet_size):
+    packet = TunnelConversion.encode_data(INCOMING_CIRCUIT_ID, ("127.0.0.1", 1), ("127.0.0.1", 2),
+                                          os.urandom(packet_size))
+    received_before = receiver.received_bytes
+
+    start = time.time()
+    for _ in xrange(nr_packets):
+        relay_func(INCOMING_CIRCUIT_ID, u"data", packet)
+    relay.flush_relay_accounting()
+    duration = time.time() - start
+
+    # give the receiver some time to drain its buffer
+    time.sleep(0.5)
+    return duration, receiver.received_bytes - received_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tunnel relay path on loopback")
+    parser.add_argument("--packets", type=int, default=100000, help="number of packets to relay")
+    parser.add_argument("--size", type=int, default=1400, help="payload size of a packet")
+    parser.add_argument("--crypto", action="store_true", help="use AES-GCM instead of the no-op crypto")
+    args = parser.parse_args()
+
+    receiver = Receiver()
+    receiver.start()
+    relay = LoopbackRelay(TunnelCrypto() if args.crypto else NoTunnelCrypto(), ("127.0.0.1", 1), receiver.address)
+
+    results = {}
+    for name, relay_func in (("legacy", relay.legacy_relay_packet), ("fast path", relay.relay_packet)):
+        duration, received = run(relay_func, relay, receiver, args.packets, args.size)
+        results[name] = duration
+        print "%-10s %8.0f packets/s, %7.2f MB/s relayed, %d bytes received" % (
+            name, args.packets / duration, args.packets * args.size / duration / 1024 / 1024, received)
+
+    report("relay %d packets" % args.packets, results["fast path"], results["legacy"])
+
+
+if __name__ == "__main__":
+    main()
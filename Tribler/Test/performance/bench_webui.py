@@ -0,0 +1,177 @@
+"""
+Load test for the download list of the WebUI, with many downloads and many remote clients.
+
+Every round a fraction of the downloads changes, after which every client asks for the changes since the last list
+it received. The previous implementation, which rebuilt and compared the complete list for every request, is
+compared against the shared revisioned rows with the list action and the long-polling events endpoint.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+from time import sleep, time
+
+from Tribler.Main.webUI.webUI import MAX_LONG_POLL_CLIENTS, WebUI
+from Tribler.Test.performance import measure, report
+
+
+class FakeDownloadState(object):
+
+    def __init__(self):
+        self.progress = random.random()
+        self.speed = random.randint(0, 1024 * 1024)
+
+    def get_progress(self):
+        return self.progress
+
+    def get_seeding_statistics(self):
+        return None
+
+    def get_total_transferred(self, direction):
+        return 0
+
+    def get_num_seeds_peers(self):
+        return 10, 20
+
+    def get_current_speed(self, direction):
+        return self.speed
+
+    def get_eta(self):
+        return int((1 - self.progress) * 1000)
+
+
+class FakeTorrent(object):
+
+    def __init__(self, i):
+        self.infohash = os.urandom(20)
+        self.name = u"torrent %d" % i
+        self.length = random.randint(1, 10 ** 10)
+        self.state = {'active'}
+        self.progress = 0
+        self.ds = FakeDownloadState()
+
+    def update(self):
+        self.ds.progress = min(1.0, self.ds.progress + 0.001)
+        self.ds.speed = random.randint(0, 1024 * 1024)
+
+
+class FakeLibraryManager(object):
+
+    def __init__(self, nr_downloads):
+        self.guiUtility = None
+        self.torrents = [FakeTorrent(i) for i in xrange(nr_downloads)]
+
+    def getHitsInCategory(self):
+        return len(self.torrents), self.torrents
+
+
+def legacy_list(webui, torrents, old_torrent_list):
+    """
+    The previous doList with a cache id: builds every row and compares them with the previous list of the client.
+    """
+    new_torrent_list = [webui._get_torrent_row(torrent, i + 1) for i, torrent in enumerate(torrents)]
+    new_torrent_dict = dict((torrent[0], torrent) for torrent in new_torrent_list)
+    torrentp = []
+    torrentm = []
+    for torrent in old_torrent_list:
+        newtorrent = new_torrent_dict.pop(torrent[0], None)
+        if newtorrent is None:
+            torrentm.append(torrent[0])
+        elif newtorrent != torrent:
+            torrentp.append(newtorrent)
+    torrentp.extend(new_torrent_dict.itervalues())
+    return new_torrent_list, json.dumps({'torrentp': torrentp, 'torrentm': torrentm})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the WebUI download list")
+    parser.add_argument("--downloads", type=int, default=5000, help="number of downloads")
+    parser.add_argument("--clients", type=int, default=20, help="number of remote clients")
+    parser.add_argument("--changed", type=float, default=0.05, help="fraction of downloads changing every round")
+    parser.add_argument("--rounds", type=int, default=10, help="number of download states callbacks")
+    args = parser.parse_args()
+
+    library_manager = FakeLibraryManager(args.downloads)
+    webui = WebUI(library_manager, None, 0)
+    token = "token"
+    webui.currentTokens.add(token)
+
+    def update_downloads():
+        for torrent in random.sample(library_manager.torrents, int(args.downloads * args.changed)):
+            torrent.update()
+        webui.on_download_states([], {})
+        webui._refresh_torrents()
+
+    initial = webui.doList({})
+    legacy_lists = [initial['torrents']] * args.clients
+    cache_ids = [initial['torrentc']] * args.clients
+    sizes = {'legacy': 0, 'list': 0, 'events': 0}
+
+    def legacy_round():
+        update_downloads()
+        for client in xrange(args.clients):
+            legacy_lists[client], payload = legacy_list(webui, library_manager.torrents, legacy_lists[client])
+            sizes['legacy'] += len(payload)
+
+    def reset_cache_ids():
+        cache_ids[:] = [webui._torrent_revision] * args.clients
+
+    def list_round():
+        update_downloads()
+        for client in xrange(args.clients):
+            return_dict = webui.doList({'cid': cache_ids[client]})
+            cache_ids[client] = return_dict['torrentc']
+            sizes['list'] += len(json.dumps(return_dict))
+
+    def events_round():
+        update_downloads()
+        for client in xrange(args.clients):
+            payload = webui.events(token=token, cid=cache_ids[client], timeout=0)
+            cache_ids[client] = json.loads(payload)['torrentc']
+            sizes['events'] += len(payload)
+
+    print "%d downloads, %d clients, %d%% of the downloads changing every round" % (
+        args.downloads, args.clients, args.changed * 100)
+    legacy = measure(legacy_round, args.rounds)
+    report("full list for every client", legacy)
+    reset_cache_ids()
+    report("list with cache id", measure(list_round, args.rounds), legacy)
+    reset_cache_ids()
+    report("events", measure(events_round, args.rounds), legacy)
+    for name in ('legacy', 'list', 'events'):
+        print "  %-8s %8.1f KiB per client per round" % (name, sizes[name] / 1024.0 / args.clients / args.rounds)
+
+    # long-polling clients, each waiting for the next revision
+    nr_waiting = min(args.clients, MAX_LONG_POLL_CLIENTS)
+    delays = []
+    ready = threading.Semaphore(0)
+    lock = threading.Lock()
+    update_time = [0]
+
+    def client(cache_id):
+        for _ in xrange(args.rounds):
+            ready.release()
+            cache_id = json.loads(webui.events(token=token, cid=cache_id, timeout=10))['torrentc']
+            with lock:
+                delays.append(time() - update_time[0])
+
+    threads = [threading.Thread(target=client, args=(webui._torrent_revision,)) for _ in xrange(nr_waiting)]
+    for thread in threads:
+        thread.start()
+    for _ in xrange(args.rounds):
+        for _ in xrange(nr_waiting):
+            ready.acquire()
+        while webui._long_poll_clients < nr_waiting:
+            sleep(0.001)
+        update_time[0] = time()
+        update_downloads()
+    for thread in threads:
+        thread.join()
+    # the delay includes rebuilding the rows after the download states callback
+    report("long-poll delivery delay (average)", sum(delays) / len(delays))
+    report("long-poll delivery delay (max)", max(delays))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Local stand-ins for the services a Session talks to, so benchmarks can run the whole pipeline offline.
+
+All services listen on the loopback interface. The tracker and the channel publisher are used on the reactor thread,
+the seeder runs its own Session and is started and stopped from another thread.
+"""
+import logging
+import os
+import random
+import socket
+import struct
+from collections import defaultdict
+from hashlib import sha1
+from time import sleep, time
+
+from libtorrent import bencode
+from twisted.internet import reactor
+from twisted.internet.protocol import DatagramProtocol
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from Tribler.Core.DownloadConfig import DownloadStartupConfig
+from Tribler.Core.Session import Session
+from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.simpledefs import NTFY_CHANNELCAST
+
+ANNOUNCE_INTERVAL = 60
+
+UDP_ACTION_CONNECT = 0
+UDP_ACTION_ANNOUNCE = 1
+UDP_ACTION_SCRAPE = 2
+
+
+def compact_peers(peers):
+    return ''.join(socket.inet_aton(ip) + struct.pack('!H', port) for ip, port in peers)
+
+
+class FakeTracker(object):
+    """
+    A BitTorrent tracker with an HTTP and a UDP front, both serving the same swarms.
+
+    Swarms can be given synthetic seeders and leechers with set_swarm, so the health checks of torrents without
+    real peers return results.
+    """
+
+    def __init__(self):
+        super(FakeTracker, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        # infohash to {(ip, port): bytes left}
+        self.peers = defaultdict(dict)
+        # infohash to (seeders, leechers) reported besides the peers that announced
+        self.synthetic = {}
+
+        self.nr_announces = 0
+        self.nr_scrapes = 0
+
+        self._http_port = None
+        self._udp_port = None
+
+    @property
+    def http_announce_url(self):
+        return "http://127.0.0.1:%d/announce" % self._http_port.getHost().port
+
+    @property
+    def udp_announce_url(self):
+        return "udp://127.0.0.1:%d/announce" % self._udp_port.getHost().port
+
+    def start(self):
+        root = Resource()
+        root.putChild("announce", HttpTrackerResource(self, self.announce_response))
+        root.putChild("scrape", HttpTrackerResource(self, self.scrape_response))
+        self._http_port = reactor.listenTCP(0, Site(root), interface="127.0.0.1")
+        self._udp_port = reactor.listenUDP(0, UdpTrackerProtocol(self), interface="127.0.0.1")
+
+    def stop(self):
+        self._http_port.stopListening()
+        self._udp_port.stopListening()
+
+    def set_swarm(self, infohash, seeders, leechers):
+        self.synthetic[infohash] = (seeders, leechers)
+
+    def announce(self, infohash, address, left, event):
+        self.nr_announces += 1
+        if event == 'stopped':
+            self.peers[infohash].pop(address, None)
+        else:
+            self.peers[infohash][address] = left
+
+    def get_swarm(self, infohash):
+        """
+        Returns the number of seeders and leechers of the swarm.
+        """
+        seeders, leechers = self.synthetic.get(infohash, (0, 0))
+        for left in self.peers.get(infohash, {}).itervalues():
+            if left:
+                leechers += 1
+            else:
+                seeders += 1
+        return seeders, leechers
+
+    def get_peers(self, infohash, address, num_want=50):
+        return [peer for peer in self.peers.get(infohash, {}) if peer != address][:num_want]
+
+    def announce_response(self, args, client_ip):
+        infohash = args['info_hash'][0]
+        address = (args.get('ip', [client_ip])[0], int(args['port'][0]))
+        self.announce(infohash, address, int(args.get('left', ['0'])[0]), args.get('event', [''])[0])
+
+        seeders, leechers = self.get_swarm(infohash)
+        return {'interval': ANNOUNCE_INTERVAL, 'complete': seeders, 'incomplete': leechers,
+                'peers': compact_peers(self.get_peers(infohash, address))}
+
+    def scrape_response(self, args, client_ip):
+        files = {}
+        for infohash in args.get('info_hash', []):
+            self.nr_scrapes += 1
+            seeders, leechers = self.get_swarm(infohash)
+            files[infohash] = {'complete': seeders, 'downloaded': seeders, 'incomplete': leechers}
+        return {'files': files}
+
+
+class HttpTrackerResource(Resource):
+
+    isLeaf = True
+
+    def __init__(self, tracker, respond):
+        Resource.__init__(self)
+        self.tracker = tracker
+        self.respond = respond
+
+    def render_GET(self, request):
+        try:
+            response = self.respond(request.args, request.getClientIP())
+        except (KeyError, ValueError) as e:
+            response = {'failure reason': 'invalid request: %s' % e}
+        request.setHeader('Content-Type', 'text/plain')
+        return bencode(response)
+
+
+class UdpTrackerProtocol(DatagramProtocol):
+    """
+    The UDP tracker protocol of BEP 15.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.connection_ids = set()
+
+    def datagramReceived(self, data, address):
+        if len(data) < 16:
+            return
+
+        connection_id, action, transaction_id = struct.unpack_from('!qii', data)
+        if action == UDP_ACTION_CONNECT:
+            connection_id = random.getrandbits(63)
+            self.connection_ids.add(connection_id)
+            self.transport.write(struct.pack('!iiq', action, transaction_id, connection_id), address)
+
+        elif connection_id not in self.connection_ids:
+            self.transport.write(struct.pack('!ii', 3, transaction_id) + 'unknown connection id', address)
+
+        elif action == UDP_ACTION_ANNOUNCE and len(data) >= 98:
+            infohash, _, _, left, _, event, ip, _, num_want, port = struct.unpack_from('!20s20sqqqiIIiH', data, 16)
+            ip = socket.inet_ntoa(struct.pack('!I', ip)) if ip else address[0]
+            self.tracker.announce(infohash, (ip, port), left, {3: 'stopped'}.get(event, ''))
+
+            seeders, leechers = self.tracker.get_swarm(infohash)
+            peers = self.tracker.get_peers(infohash, (ip, port), num_want if num_want > 0 else 50)
+            self.transport.write(struct.pack('!iiiii', action, transaction_id, ANNOUNCE_INTERVAL, leechers, seeders) +
+                                 compact_peers(peers), address)
+
+        elif action == UDP_ACTION_SCRAPE:
+            response = [struct.pack('!ii', action, transaction_id)]
+            for offset in xrange(16, len(data) - 19, 20):
+                self.tracker.nr_scrapes += 1
+                seeders, leechers = self.tracker.get_swarm(data[offset:offset + 20])
+                response.append(struct.pack('!iii', seeders, seeders, leechers))
+            self.transport.write(''.join(response), address)
+
+
+class ChannelPublisher(object):
+    """
+    Publishes synthetic channels and torrents into the database of a Session, the way the channel communities do
+    when they receive them from other peers. Call the methods on the reactor thread.
+    """
+
+    def __init__(self, session, trackers, seed=42):
+        super(ChannelPublisher, self).__init__()
+        self.channelcast_db = session.open_dbhandler(NTFY_CHANNELCAST)
+        self.trackers = trackers
+        self.random = random.Random(seed)
+        self.words = [u"%s%d" % (prefix, i) for prefix in (u"linux", u"album", u"movie", u"book", u"game")
+                      for i in xrange(200)]
+
+        self.channel_ids = []
+        self.infohashes = []
+        self._dispersy_id = 0
+
+    def create_channels(self, nr_channels):
+        for i in xrange(nr_channels):
+            dispersy_cid = sha1("channel %d %d" % (i, len(self.channel_ids))).digest()
+            self.channel_ids.append(self.channelcast_db.on_channel_from_dispersy(
+                dispersy_cid, None, u"channel %d" % i, u"a synthetic channel"))
+        return self.channel_ids
+
+    def create_torrents(self, channel_id, nr_torrents):
+        torrents = []
+        now = long(time())
+        for _ in xrange(nr_torrents):
+            self._dispersy_id += 1
+            infohash = sha1("torrent %d" % self._dispersy_id).digest()
+            name = u" ".join(self.random.sample(self.words, 4))
+            files = [(u"%s/file%d.avi" % (name, i), self.random.randint(1, 2 ** 30))
+                     for i in xrange(self.random.randint(1, 5))]
+            torrents.append((channel_id, self._dispersy_id, None, infohash, now - self.random.randint(0, 365 * 86400),
+                             name, files, self.trackers))
+            self.infohashes.append(infohash)
+        return torrents
+
+    def publish(self, torrents_per_channel, batch_size=50):
+        """
+        Adds torrents_per_channel torrents to every channel, in batches of batch_size as the channel community
+        stores them. Returns the number of torrents published.
+        """
+        nr_published = 0
+        for channel_id in self.channel_ids:
+            for offset in xrange(0, torrents_per_channel, batch_size):
+                torrents = self.create_torrents(channel_id, min(batch_size, torrents_per_channel - offset))
+                self.channelcast_db.on_torrents_from_dispersy(torrents)
+                nr_published += len(torrents)
+        return nr_published
+
+
+class LoopbackSeeder(object):
+    """
+    A Session with only libtorrent enabled, seeding a file of random data on the loopback interface. Call the methods
+    from a thread other than the reactor thread.
+    """
+
+    def __init__(self, state_dir, tracker_url, size):
+        super(LoopbackSeeder, self).__init__()
+        self.state_dir = state_dir
+        self.tracker_url = tracker_url
+        self.size = size
+        self.session = None
+        self.tdef = None
+
+    def start(self, config):
+        config.set_state_dir(self.state_dir)
+        config.set_libtorrent(True)
+        self.session = Session(config, ignore_singleton=True, autoload_discovery=False)
+        upgrader = self.session.prestart()
+        while not upgrader.is_done:
+            sleep(0.1)
+        self.session.start()
+
+        content_dir = os.path.join(self.state_dir, u"content")
+        os.makedirs(content_dir)
+        file_path = os.path.join(content_dir, u"payload.bin")
+        with open(file_path, 'wb') as f:
+            for _ in xrange(0, self.size, 1024 * 1024):
+                f.write(os.urandom(min(1024 * 1024, self.size - f.tell())))
+
+        self.tdef = TorrentDef()
+        self.tdef.add_content(file_path)
+        self.tdef.set_tracker(self.tracker_url)
+        # only find peers through the tracker
+        self.tdef.set_private()
+        self.tdef.finalize()
+
+        dscfg = DownloadStartupConfig()
+        dscfg.set_dest_dir(content_dir)
+        self.session.start_download(self.tdef, dscfg)
+        return self.tdef
+
+    def stop(self):
+        if self.session:
+            self.session.shutdown()
+            while not self.session.has_shutdown():
+                sleep(0.1)
+            self.session = None
@@ -1,6 +1,7 @@
 from Tribler.Test.test_as_server import AbstractServer
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
-from Tribler.community.bartercast4.statistics import BarterStatistics, BartercastStatisticTypes
+from Tribler.community.bartercast4.statistics import (BarterStatistics, BartercastStatisticTypes,
+                                                      MAX_PENDING_INCREMENTS)
 from Tribler.dispersy.dispersy import Dispersy
 from Tribler.dispersy.endpoint import ManualEnpoint
 
@@ -32,6 +33,17 @@ class TestBarterStatistics(AbstractServer):
         assert len(self.stats.bartercast[BartercastStatisticTypes.TUNNELS_EXIT_BYTES_SENT]) == 1
         assert self.stats.bartercast[BartercastStatisticTypes.TUNNELS_EXIT_BYTES_SENT][self._peer1] == 1
 
+    def test_dict_inc_bartercast_pending(self):
+        for _ in xrange(MAX_PENDING_INCREMENTS - 1):
+            self.stats.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_BYTES_SENT, self._peer1, 2)
+        assert len(self.stats._pending) == MAX_PENDING_INCREMENTS - 1
+        self.stats.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_BYTES_SENT, self._peer2, 2)
+        assert len(self.stats._pending) == 0
+        assert self.stats.bartercast[BartercastStatisticTypes.TUNNELS_BYTES_SENT][self._peer1] == \
+            2 * (MAX_PENDING_INCREMENTS - 1)
+        assert self.stats._dirty == {(BartercastStatisticTypes.TUNNELS_BYTES_SENT, self._peer1),
+                                     (BartercastStatisticTypes.TUNNELS_BYTES_SENT, self._peer2)}
+
     def test_get_top_n_bartercast_statistics(self):
         self.stats.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, self._peer1, 5)
         self.stats.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, self._peer2, 5)
@@ -74,6 +86,40 @@ class TestBarterStatistics(AbstractServer):
         self.stats.load_statistics(self.dispersy)
         assert len(self.stats.bartercast[BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED]) == 5
 
+    @blocking_call_on_reactor_thread
+    def test_persist_dirty(self):
+        self.stats.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, self._peer1, 5)
+        self.stats.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, self._peer2, 5)
+        self.stats.persist(self.dispersy, 1)
+        assert not self.stats._dirty
+        self.stats.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, self._peer1, 5)
+        self.stats.merge_pending()
+        assert self.stats._dirty == {(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, self._peer1)}
+        self.stats.persist(self.dispersy, 1)
+        records = self.stats.db.execute(u"SELECT peer, value FROM statistic ORDER BY peer").fetchall()
+        assert records == [(self._peer1, 10), (self._peer2, 5)]
+
+    @blocking_call_on_reactor_thread
+    def test_persist_failed(self):
+        self.stats.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, self._peer1, 5)
+        self.stats.persist(self.dispersy, 1)
+        self.stats.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, self._peer2, 5)
+        self.stats.merge_pending()
+
+        executemany = self.stats.db.executemany
+
+        def failing_executemany(statement, sequenceofbindings):
+            raise IOError("disk full")
+        self.stats.db.executemany = failing_executemany
+        self.assertRaises(IOError, self.stats.persist, self.dispersy, 1)
+
+        # the update that failed to be written is written by the next call
+        assert self.stats._dirty == {(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, self._peer2)}
+        self.stats.db.executemany = executemany
+        self.stats.persist(self.dispersy, 1)
+        records = self.stats.db.execute(u"SELECT peer, value FROM statistic ORDER BY peer").fetchall()
+        assert records == [(self._peer1, 5), (self._peer2, 5)]
+
     @blocking_call_on_reactor_thread
     def test_log_interaction(self):
         self.stats.log_interaction(self.dispersy, BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED,
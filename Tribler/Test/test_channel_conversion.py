@@ -0,0 +1,64 @@
+import zlib
+from struct import pack
+
+from Tribler.Core.Utilities.encoding import decode, encode
+from Tribler.Test.test_as_server import BaseTestCase
+from Tribler.community.channel.conversion import TorrentPacker
+
+
+class FakeTorrentPayload(object):
+
+    def __init__(self, nr_files, nr_trackers):
+        self.infohash = "\x01" * 20
+        self.timestamp = 1234567890
+        self.name = u"torrent"
+        self.files = tuple((u"directory %d/file %d.avi" % (i % 7, i), i * 1024 * 1024) for i in xrange(nr_files))
+        self.trackers = tuple("http://tracker%d.example.org/announce" % i for i in xrange(nr_trackers))
+
+
+class TestTorrentPacker(BaseTestCase):
+
+    def setUp(self):
+        self.packer = TorrentPacker(cache_size=2)
+
+    def unpack(self, packed):
+        return decode(zlib.decompress(packed))[1]
+
+    def test_pack_fits(self):
+        payload = FakeTorrentPayload(10, 20)
+        packed = self.packer.pack(payload, 1500)
+        self.assertEqual(zlib.decompress(packed), encode((pack('!20sQ', payload.infohash, payload.timestamp),
+                                                          payload.name, payload.files, payload.trackers)))
+
+    def test_pack_trackers(self):
+        payload = FakeTorrentPayload(10, 1000)
+        _, _, files, trackers = self.unpack(self.packer.pack(payload, 1500))
+        self.assertEqual(files, payload.files)
+        self.assertEqual(trackers, payload.trackers[:10])
+
+    def test_pack_files(self):
+        payload = FakeTorrentPayload(5000, 1000)
+        packed = self.packer.pack(payload, 1500)
+        self.assertLessEqual(len(packed), 1500)
+
+        _, name, files, trackers = self.unpack(packed)
+        self.assertEqual(name, payload.name)
+        self.assertTrue(files)
+        self.assertTrue(set(files) < set(payload.files))
+        self.assertEqual(trackers, payload.trackers[:10])
+
+    def test_cache(self):
+        payloads = [FakeTorrentPayload(5000, 1) for _ in xrange(3)]
+        payloads[1].infohash = "\x02" * 20
+        payloads[2].infohash = "\x03" * 20
+
+        packed = self.packer.pack(payloads[0], 1500)
+        self.assertIs(self.packer.pack(payloads[0], 1500), packed)
+        self.packer.pack(payloads[1], 1500)
+        self.packer.pack(payloads[0], 1500)
+        self.packer.pack(payloads[2], 1500)
+
+        # the least recently used torrent was evicted
+        self.assertIs(self.packer.pack(payloads[0], 1500), packed)
+        self.assertEqual(len(self.packer._packed), 2)
+        self.assertNotIn((payloads[1].infohash, payloads[1].timestamp, payloads[1].name, 1500), self.packer._packed)
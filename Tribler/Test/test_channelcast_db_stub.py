@@ -0,0 +1,73 @@
+from Tribler.Test.test_as_server import BaseTestCase
+from Tribler.community.allchannel import community
+from Tribler.community.allchannel.community import ChannelCastDBStub
+
+
+class FakeObject(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeDatabase(object):
+
+    def __init__(self, packets):
+        self.packets = packets
+        self.queries = 0
+
+    def execute(self, sql, bindings):
+        self.queries += 1
+        last_id, limit = bindings
+        return [(packet, packet_id) for packet_id, packet in sorted(self.packets.iteritems()) if packet_id > last_id][:limit]
+
+
+class FakeDispersy(object):
+
+    def __init__(self, packets):
+        self.database = FakeDatabase(packets)
+
+    def convert_packets_to_messages(self, packets, verify=True):
+        assert not verify
+        return [create_message(int(packet)) for packet in packets]
+
+
+def create_message(global_time):
+    return FakeObject(community=FakeObject(cid="cid"), payload=FakeObject(infohash="%020d" % global_time),
+                      distribution=FakeObject(global_time=global_time))
+
+
+class TestChannelCastDBStub(BaseTestCase):
+
+    def setUp(self):
+        self.batch_size = community.TORRENT_INDEX_BATCH_SIZE
+        community.TORRENT_INDEX_BATCH_SIZE = 7
+        self.dispersy = FakeDispersy(dict((packet_id, str(packet_id * 10)) for packet_id in xrange(1, 101)))
+        self.stub = ChannelCastDBStub(self.dispersy)
+        self.stub.setChannelId(1, False)
+
+    def tearDown(self):
+        community.TORRENT_INDEX_BATCH_SIZE = self.batch_size
+
+    def test_index(self):
+        self.assertEqual(self.stub.hasTorrents(1, ["%020d" % 10, "%020d" % 15, "%020d" % 1000]), [True, False, True])
+        self.assertEqual(self.stub.getTorrentFromChannelId(1, "%020d" % 20, None), 2)
+        self.assertIsNone(self.stub.getTorrentFromChannelId(1, "%020d" % 15, None))
+        # the packets are decoded in batches
+        self.assertEqual(self.dispersy.database.queries, 15)
+
+    def test_new_torrent(self):
+        for global_time in xrange(2000, 1000, -1):
+            message = create_message(global_time)
+            message.packet_id = global_time
+            self.stub.newTorrent(message)
+        self.stub.newTorrent(message)
+
+        self.assertEqual(len(self.stub.recentTorrents), community.RECENT_TORRENTS_SIZE)
+        self.assertEqual(len(self.stub.cachedInfohashes), 1100)
+        self.assertEqual(self.stub.getCountMaxFromChannelId(1)[0], 1100)
+        self.assertEqual(self.stub.getTorrentFromChannelId(1, "%020d" % 1500, None), 1500)
+
+        # the random torrents may include some of the recent ones
+        torrents = self.stub.getRecentAndRandomTorrents(15, 10, 15, 10)[1]
+        self.assertTrue(15 <= len(torrents) <= 25)
+        self.assertTrue(set("%020d" % global_time for global_time in xrange(2000, 1985, -1)) < torrents)
@@ -0,0 +1,114 @@
+import random
+
+from Tribler.Core.Utilities.encoding import decode, encode
+from Tribler.Test import legacy_encoding
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+def random_value(rand, depth=0):
+    kind = rand.randint(0, 12 if depth < 4 else 7)
+    if kind == 0:
+        return rand.randint(-2 ** 31, 2 ** 31)
+    if kind == 1:
+        return long(rand.randint(-2 ** 80, 2 ** 80))
+    if kind == 2:
+        return rand.uniform(-1e6, 1e6)
+    if kind == 3:
+        return "".join(chr(rand.randint(0, 255)) for _ in xrange(rand.randint(0, 30)))
+    if kind == 4:
+        return u"".join(unichr(rand.choice([rand.randint(32, 127), rand.randint(128, 0xd7ff)]))
+                        for _ in xrange(rand.randint(0, 10)))
+    if kind == 5:
+        return None
+    if kind == 6:
+        return rand.random() < 0.5
+    if kind == 7:
+        return rand.randint(0, 9)
+    if kind == 8:
+        return set(random_key(rand) for _ in xrange(rand.randint(0, 5)))
+    if kind == 9:
+        return dict((random_key(rand), random_value(rand, depth + 1)) for _ in xrange(rand.randint(0, 5)))
+    if kind == 10:
+        return tuple(random_value(rand, depth + 1) for _ in xrange(rand.randint(0, 5)))
+    return [random_value(rand, depth + 1) for _ in xrange(rand.randint(0, 5))]
+
+
+def random_key(rand):
+    # str and unicode keys can not be sorted together when the str is not ASCII
+    return rand.choice([rand.randint(0, 9), 2 ** 70, 0.5, None, True, "key %d" % rand.randint(0, 9),
+                        u"key %d" % rand.randint(0, 9)])
+
+
+def typed(value):
+    """
+    Returns VALUE with the type of every item, as 1 == 1L == 1.0 == True, and sets and dictionaries in sorted order.
+    """
+    if isinstance(value, (list, tuple)):
+        return type(value), [typed(item) for item in value]
+    if isinstance(value, set):
+        return set, sorted(typed(item) for item in value)
+    if isinstance(value, dict):
+        return dict, sorted((typed(key), typed(item)) for key, item in value.iteritems())
+    return type(value), value
+
+
+class TestEncoding(BaseTestCase):
+
+    def assert_same_decoding(self, stream, offset=0):
+        try:
+            expected = legacy_encoding.decode(stream, offset)
+        except Exception:
+            self.assertRaises(ValueError, decode, stream, offset)
+        else:
+            offset, value = decode(stream, offset)
+            self.assertEqual((offset, typed(value)), (expected[0], typed(expected[1])))
+
+    def test_examples(self):
+        self.assertEqual(encode(42), "a2i42")
+        self.assertEqual(encode([u"foo", None]), "a2l3sfoo0n")
+        self.assertEqual(encode({"foo": True, "bar": (1L, 4.2)}), "a2d3bbar2t1J13f4.23bfoo0T")
+        self.assertEqual(decode("xa2l1i41i2", 1), (10, [4, 2]))
+        self.assertEqual(decode("a2d3sfoo3sbar3smoo4smilk"), (24, {u"foo": u"bar", u"moo": u"milk"}))
+
+    def test_deep_nesting(self):
+        value = []
+        for _ in xrange(10000):
+            value = [value]
+        stream = encode(value)
+        self.assertEqual(stream, "a" + "1l" * 10000 + "0l")
+
+        offset, value = decode(stream)
+        self.assertEqual(offset, len(stream))
+        for _ in xrange(10000):
+            value, = value
+        self.assertEqual(value, [])
+
+    def test_malformed(self):
+        for stream in ["", "b", "a", "a2", "ai42", "a2x42", "a5b42", "a2l1i4", "a2d1i41i4",
+                       "a1L0l", "a1d0l0n", "a1n", "a2s\xff\xfe"]:
+            self.assertRaises(ValueError, decode, stream)
+
+    def test_fuzz_encode(self):
+        rand = random.Random(42)
+        for _ in xrange(2000):
+            value = random_value(rand)
+            stream = legacy_encoding.encode(value)
+            self.assertEqual(encode(value), stream)
+            self.assert_same_decoding(stream)
+
+    def test_fuzz_decode_mutations(self):
+        rand = random.Random(43)
+        for _ in xrange(2000):
+            stream = list(legacy_encoding.encode(random_value(rand)))
+            for _ in xrange(rand.randint(1, 3)):
+                position = rand.randrange(1, len(stream)) if len(stream) > 1 else len(stream)
+                action = rand.randint(0, 2)
+                if action == 0 and position < len(stream):
+                    stream[position] = rand.choice("0123456789ilLtdbsJfnTF\x00\xff")
+                elif action == 1:
+                    del stream[position:]
+                else:
+                    stream.insert(position, rand.choice("0123456789ltd"))
+            stream = "".join(stream)
+            self.assert_same_decoding(stream)
+            self.assert_same_decoding("xx" + stream, 2)
@@ -0,0 +1,45 @@
+import os
+
+from Tribler.Category.FamilyFilter import XXXFilter
+from Tribler.Test.test_as_server import BaseTestCase, TESTS_DIR
+
+
+class TestFamilyFilter(BaseTestCase):
+
+    def setUp(self):
+        self.xxx_filter = XXXFilter(os.path.join(TESTS_DIR, u"..", u".."))
+        self.xxx_filter.xxx_terms = {"dirty", "babe", "bad words"}
+        self.xxx_filter.xxx_words = XXXFilter.get_term_variants(self.xxx_filter.xxx_terms)
+        self.xxx_filter.xxx_searchterms_regexp = XXXFilter.compile_searchterms({"xyz", "filth"})
+
+    def test_get_term_variants(self):
+        self.assertEqual(XXXFilter.get_term_variants({"dirty", "babe"}),
+                         {"dirty", "dirtys", "dirtyes", "dirtyn", "babe", "babees", "baben"})
+
+    def test_is_xxx_term(self):
+        self.assertTrue(self.xxx_filter.isXXXTerm("Dirty"))
+        self.assertTrue(self.xxx_filter.isXXXTerm("dirtyes"))
+        self.assertTrue(self.xxx_filter.isXXXTerm("baben"))
+        self.assertFalse(self.xxx_filter.isXXXTerm("babes"))
+        self.assertFalse(self.xxx_filter.isXXXTerm("clean"))
+
+    def test_found_xxx_term(self):
+        self.assertTrue(self.xxx_filter.foundXXXTerm("somefilthyname"))
+        self.assertFalse(self.xxx_filter.foundXXXTerm("clean name"))
+        self.assertFalse(XXXFilter.compile_searchterms(set()))
+
+    def test_is_xxx(self):
+        self.assertTrue(self.xxx_filter.isXXX("a dirty movie.avi"))
+        self.assertTrue(self.xxx_filter.isXXX("some bad words.avi"))
+        self.assertTrue(self.xxx_filter.isXXX("xyzmovie.avi"))
+        self.assertFalse(self.xxx_filter.isXXX("a clean movie.avi"))
+
+    def test_is_xxx_audio(self):
+        self.assertFalse(self.xxx_filter.isXXX("dirty song.mp3"))
+        self.assertFalse(self.xxx_filter.isXXX("xyz song.mp3"))
+        self.assertTrue(self.xxx_filter.isXXX("dirty dirty dirty song.mp3"))
+        self.assertTrue(self.xxx_filter.isXXX("dirty song.mp3", False))
+
+    def test_is_xxx_torrent(self):
+        self.assertTrue(self.xxx_filter.isXXXTorrent([("clean.avi", 100)], "clean", "http://dirty.org/announce"))
+        self.assertFalse(self.xxx_filter.isXXXTorrent([("clean.avi", 100)], "clean", None))
@@ -0,0 +1,91 @@
+from Tribler.Main.Utility.GuiDBHandler import GUIDBProducer, GUIDBTask
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class FakeThreadPool(object):
+
+    def __init__(self):
+        self.tasks = []
+
+    def add_task(self, wrapper, delay=0, task_name=None):
+        self.tasks.append(wrapper)
+
+
+class FakeUtility(object):
+
+    def __init__(self):
+        self.abcquitting = False
+        self.session = self
+        self.lm = self
+        self.threadpool = FakeThreadPool()
+
+
+class FakeSender(object):
+
+    def __init__(self):
+        self.results = []
+
+    def sendResult(self, result):
+        self.results.append(result)
+
+    def sendException(self, exception, originalTb):
+        self.results.append(exception)
+
+
+class TestGUIDBProducer(BaseTestCase):
+
+    def setUp(self):
+        self.producer = GUIDBProducer.getInstance()
+        self.producer.utility = FakeUtility()
+
+    def tearDown(self):
+        GUIDBProducer.delInstance()
+
+    def test_priority_order(self):
+        tasks = [GUIDBTask(u"task %d" % i, None, priority, i, 0, "dbThread")
+                 for i, priority in enumerate([0, 99, 0, 99])]
+        self.assertTrue(self.producer._queue_task(tasks[0]))
+        for task in tasks[1:]:
+            self.assertFalse(self.producer._queue_task(task))
+
+        order = [self.producer._next_task("dbThread") for _ in tasks]
+        self.assertEqual(order, [tasks[1], tasks[3], tasks[0], tasks[2]])
+        self.assertIsNone(self.producer._next_task("dbThread"))
+        self.assertEqual(self.producer._nr_workers["dbThread"], 0)
+
+    def test_supersede(self):
+        sender = FakeSender()
+        self.producer.Add(sender, lambda: 1, name=u"first", uId=u"uid", priority=99, workerType="dbThread")
+        first = self.producer.uIds[u"uid"]
+        self.producer.Add(sender, lambda: 2, name=u"second", uId=u"uid", workerType="dbThread")
+        second = self.producer.uIds[u"uid"]
+
+        self.assertTrue(first.cancelled)
+        self.assertEqual(second.priority, 99)
+        self.assertEqual(second.sequence_number, first.sequence_number)
+
+        first.call()
+        second.call()
+        self.assertEqual(sender.results, [2])
+        self.assertNotIn(u"uid", self.producer.uIds)
+
+    def test_remove(self):
+        sender = FakeSender()
+        self.producer.Add(sender, lambda: 1, name=u"task", uId=u"uid", workerType="ThreadPool")
+        task = self.producer.uIds[u"uid"]
+        self.producer.Remove(u"uid")
+
+        self.assertFalse(self.producer._queue_task(task))
+        task.call()
+        self.assertEqual(sender.results, [])
+
+    def test_latency_tracing(self):
+        sender = FakeSender()
+        for _ in xrange(2):
+            self.producer.Add(sender, lambda: 1, name=u"task", uId=u"uid", workerType="ThreadPool")
+            self.producer.uIds[u"uid"].call()
+
+        nr_calls, total_wait, max_wait, total_duration = self.producer.task_latencies[u"task"]
+        self.assertEqual(nr_calls, 2)
+        self.assertLessEqual(max_wait, total_wait)
+        self.assertEqual(sender.results, [1, 1])
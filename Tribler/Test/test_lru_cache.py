@@ -0,0 +1,67 @@
+from Tribler.Core.Utilities import lru_cache
+from Tribler.Core.Utilities.lru_cache import LRUCache
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class FakeTimeTestCase(BaseTestCase):
+    """
+    Makes self.now the current time of the LRU caches, so tests can let time pass.
+    """
+
+    def setUp(self):
+        super(FakeTimeTestCase, self).setUp()
+        self.now = 1000.0
+        self.time = lru_cache.time
+        lru_cache.time = lambda: self.now
+
+    def tearDown(self):
+        lru_cache.time = self.time
+        super(FakeTimeTestCase, self).tearDown()
+
+
+class TestLRUCache(FakeTimeTestCase):
+
+    def test_put(self):
+        cache = LRUCache(3)
+        self.assertEqual([cache.put(key, key.upper()) for key in "abc"], [[], [], []])
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.get("x", "X"), "X")
+
+        # the least recently used item is dropped first
+        self.assertEqual(cache.put("d", "D"), [("b", "B")])
+        self.assertEqual(cache.items(), [("c", "C"), ("a", "A"), ("d", "D")])
+
+        cache.max_size = 1
+        self.assertEqual(cache.put("a", "AA"), [("c", "C"), ("d", "D")])
+        self.assertEqual(cache.items(), [("a", "AA")])
+
+    def test_peek(self):
+        cache = LRUCache(2)
+        cache.put("a", "A")
+        cache.put("b", "B")
+
+        # peeking at an item or checking whether it is cached does not use it
+        self.assertEqual(cache.peek("a"), "A")
+        self.assertIn("a", cache)
+        self.assertIsNone(cache.peek("x"))
+        self.assertEqual(cache.put("c", "C"), [("a", "A")])
+
+    def test_pop(self):
+        cache = LRUCache(2)
+        cache.put("a", "A")
+        self.assertEqual(cache.pop("a"), "A")
+        self.assertIsNone(cache.pop("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_expire(self):
+        cache = LRUCache(3, ttl=60)
+        cache.put("a", "A")
+        cache.put("b", "B")
+        self.now += 30
+        cache.get("a")
+        self.now += 30
+        self.assertEqual(cache.expire(), [("b", "B")])
+        self.assertEqual(cache.expire(), [])
+        self.now += 30
+        self.assertEqual(cache.expire(), [("a", "A")])
+        self.assertEqual(len(cache), 0)
@@ -291,6 +291,38 @@ class TestDatabase(MultiChainTestCase):
         self.assertEqual(block2.total_up_requester, result_up)
         self.assertEqual(block2.total_down_requester, result_down)
 
+    def test_get_total_cached(self):
+        """
+        Adding a block for a member that was looked up before should update the cached totals.
+        """  # Arrange
+        dispersy = self.MockDispersy()
+        db = MultiChainDB(dispersy, self.getStateDir())
+        block1 = self.getNewAddedBlock(db, dispersy)
+        self.assertEqual((block1.total_up_requester, block1.total_down_requester), db.get_total(block1.mid_requester))
+        block2 = TestBlock()
+        block2.mid_requester = block1.mid_requester
+        block2.sequence_number_requester = block1.sequence_number_requester + 1
+        # Act
+        db.add_block(block2)
+        # Assert
+        self.assertEqual((block2.total_up_requester, block2.total_down_requester), db.get_total(block1.mid_requester))
+        self.assertEqual(block2.sequence_number_requester, db.get_latest_sequence_number(block1.mid_requester))
+        self.assertEqual(block2.id, db.get_previous_id(block1.mid_requester))
+
+    def test_get_latest_sequence_number_reopen(self):
+        """
+        The latest block of a member should survive a restart, when the cache is empty.
+        """  # Arrange
+        dispersy = self.MockDispersy()
+        db = MultiChainDB(dispersy, self.getStateDir())
+        block1 = self.getNewAddedBlock(db, dispersy)
+        db.close()
+        # Act
+        db = MultiChainDB(dispersy, self.getStateDir())
+        # Assert
+        self.assertEqual(block1.sequence_number_responder, db.get_latest_sequence_number(block1.mid_responder))
+        self.assertEqual(block1.id, db.get_previous_id(block1.mid_responder))
+
     def test_save_large_upload_download_block(self):
         """
         Test if the block can save very large numbers.
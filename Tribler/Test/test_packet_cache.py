@@ -0,0 +1,57 @@
+import sqlite3
+
+from Tribler.Test.test_as_server import BaseTestCase
+from Tribler.community.channel.packet_cache import PacketCache
+
+
+class FakeDatabase(object):
+
+    def __init__(self):
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.execute(u"CREATE TABLE community (id INTEGER PRIMARY KEY)")
+        self.connection.execute(u"CREATE TABLE sync (id INTEGER PRIMARY KEY, community INTEGER, packet BLOB)")
+        self.connection.execute(u"INSERT INTO community (id) VALUES (1)")
+        self.connection.executemany(u"INSERT INTO sync (id, community, packet) VALUES (?, 1, ?)",
+                                    [(i, buffer("packet %d" % i)) for i in xrange(1, 11)])
+        self.statements = []
+
+    def execute(self, statement, bindings=()):
+        self.statements.append(bindings)
+        return self.connection.execute(statement, bindings)
+
+
+class TestPacketCache(BaseTestCase):
+
+    def setUp(self):
+        self.database = FakeDatabase()
+        self.cache = PacketCache(self.database, cache_size=3)
+
+    def test_get_packets(self):
+        self.assertEqual(self.cache.get_packets([3, 42, 1, 3]), ["packet 3", "packet 1", "packet 3"])
+        self.assertEqual(len(self.database.statements), 1)
+        self.assertEqual(sorted(self.database.statements[0]), [1, 3, 42])
+
+        # cached packets are not loaded again, only checked to still be in the sync table
+        self.assertEqual(self.cache.get_packets([1, 3]), ["packet 1", "packet 3"])
+        self.assertEqual(len(self.database.statements), 2)
+        self.assertEqual(sorted(self.database.statements[1]), [1, 3])
+        self.assertEqual(self.cache.get_packets([]), [])
+        self.assertEqual(len(self.database.statements), 2)
+
+    def test_removed_packets(self):
+        self.cache.get_packets([1, 2])
+        self.database.connection.execute(u"DELETE FROM sync WHERE id = 2")
+
+        # a packet removed from the sync table is no longer served from the cache
+        self.assertEqual(self.cache.get_packets([2, 1]), ["packet 1"])
+        self.assertEqual([dispersy_id for dispersy_id, _ in self.cache._packets.items()], [1])
+
+    def test_eviction(self):
+        self.cache.get_packets([1, 2, 3])
+        self.cache.get_packets([1])
+        self.cache.get_packets([4])
+
+        # the least recently served packet was evicted
+        self.assertEqual([dispersy_id for dispersy_id, _ in self.cache._packets.items()], [3, 1, 4])
+        self.cache.get_packets([2])
+        self.assertEqual(self.database.statements[-1], (2,))
@@ -0,0 +1,72 @@
+from Tribler.Test.test_lru_cache import FakeTimeTestCase
+from Tribler.community.channel import preview_tracker
+from Tribler.community.channel.preview_tracker import PreviewTracker
+
+
+class FakeDispersy(object):
+
+    def __init__(self):
+        self._communities = {}
+
+
+class FakeCommunity(object):
+
+    def __init__(self, dispersy, cid):
+        self.dispersy = dispersy
+        self.cid = cid
+        self.candidates = {"candidate": 1}
+        dispersy._communities[cid] = self
+
+    def unload_community(self):
+        del self.dispersy._communities[self.cid]
+
+
+class TestPreviewTracker(FakeTimeTestCase):
+
+    def setUp(self):
+        super(TestPreviewTracker, self).setUp()
+        self.dispersy = FakeDispersy()
+        self.previews = PreviewTracker(max_size=3, ttl=60)
+
+    def create_previews(self, cids):
+        communities = [FakeCommunity(self.dispersy, cid) for cid in cids]
+        for community in communities:
+            self.previews.touch(community)
+        return communities
+
+    def test_max_size(self):
+        a, b, c = self.create_previews("abc")
+        self.previews.touch(a)
+        d, = self.create_previews("d")
+
+        # the least recently used preview community is unloaded first
+        self.assertEqual(len(self.previews), 3)
+        self.assertNotIn(b, self.previews)
+        self.assertEqual(sorted(self.dispersy._communities), ["a", "c", "d"])
+
+    def test_unload_expired(self):
+        a, b = self.create_previews("ab")
+        self.now += 30
+        self.previews.touch(a)
+        self.now += 30
+        self.assertEqual(self.previews.unload_expired(), 1)
+        self.assertEqual(sorted(self.dispersy._communities), ["a"])
+        self.now += 30
+        self.assertEqual(self.previews.unload_expired(), 1)
+        self.assertEqual(self.dispersy._communities, {})
+
+    def test_reclassified(self):
+        self.create_previews("ab")
+        # a community that replaced a preview community is left alone
+        replacement = FakeCommunity(self.dispersy, "a")
+        self.now += 60
+        self.assertEqual(self.previews.unload_expired(), 2)
+        self.assertEqual(self.dispersy._communities, {"a": replacement})
+
+    def test_memory_estimates(self):
+        a, b = self.create_previews("ab")
+        b.unload_community()
+
+        estimates = self.previews.get_memory_estimates()
+        self.assertEqual(estimates.keys(), ["a"])
+        self.assertGreater(estimates["a"], preview_tracker.sys.getsizeof(a.candidates))
@@ -0,0 +1,38 @@
+from Tribler.Core.Utilities.recently_requested import RecentlyRequested
+from Tribler.Test.test_lru_cache import FakeTimeTestCase
+
+
+class TestRecentlyRequested(FakeTimeTestCase):
+
+    def setUp(self):
+        super(TestRecentlyRequested, self).setUp()
+        self.requested = RecentlyRequested(max_size=3, ttl=60)
+
+    def test_filter(self):
+        self.requested.add(["a", "b"])
+        self.assertEqual(self.requested.filter(["a", "c", "b", "d"]), ["c", "d"])
+        self.assertEqual(self.requested.nr_duplicates, 2)
+        self.assertIn("a", self.requested)
+        self.assertNotIn("c", self.requested)
+
+    def test_max_size(self):
+        self.requested.add(["a", "b", "c"])
+        self.requested.add(["a"])
+        self.requested.add(["d"])
+
+        # the least recently requested infohash is forgotten first
+        self.assertEqual(len(self.requested), 3)
+        self.assertEqual(self.requested.filter(["a", "b", "c", "d"]), ["b"])
+
+    def test_ttl(self):
+        self.requested.add(["a"])
+        self.now += 30
+        self.requested.add(["b"])
+        self.now += 30
+        self.assertEqual(self.requested.filter(["a", "b"]), ["a"])
+        self.now += 30
+        # reading does not forget expired infohashes, filtering and adding does
+        self.assertEqual(len(self.requested), 1)
+        self.assertIn("b", self.requested)
+        self.assertEqual(self.requested.filter([]), [])
+        self.assertEqual(len(self.requested), 0)
@@ -0,0 +1,71 @@
+import json
+import os
+
+from Tribler.Core.Modules.channel import cache
+from Tribler.Core.Modules.channel.cache import SimpleCache
+from Tribler.Test.test_as_server import AbstractServer
+
+
+class TestSimpleCache(AbstractServer):
+
+    def setUp(self):
+        super(TestSimpleCache, self).setUp(annotate=False)
+        self.file_path = os.path.join(self.getStateDir(), u"rss_cache.txt")
+        self.cache = SimpleCache(self.file_path)
+        self.cache.load()
+
+    def tearDown(self):
+        super(TestSimpleCache, self).tearDown(annotate=False)
+
+    def reload(self):
+        self.cache = SimpleCache(self.file_path)
+        self.cache.load()
+
+    def test_add_has(self):
+        self.cache.add(u"http://a")
+        self.cache.add(u"http://a")
+        self.assertTrue(self.cache.has(u"http://a"))
+        self.assertFalse(self.cache.has(u"http://b"))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_save_journal(self):
+        self.cache.add(u"http://a")
+        self.cache.save()
+        self.cache.add(u"http://b")
+        self.cache.save()
+        self.assertFalse(os.path.exists(self.file_path))
+
+        self.reload()
+        self.assertTrue(self.cache.has(u"http://a"))
+        self.assertTrue(self.cache.has(u"http://b"))
+
+    def test_compact(self):
+        for i in xrange(cache.JOURNAL_COMPACT_THRESHOLD):
+            self.cache.add(u"http://%d" % i)
+        self.cache.save()
+        self.assertFalse(os.path.exists(self.file_path + u".journal"))
+
+        self.reload()
+        self.assertEqual(len(self.cache), cache.JOURNAL_COMPACT_THRESHOLD)
+
+    def test_load_legacy_file(self):
+        with open(self.file_path, 'wb') as f:
+            json.dump([u"http://a", u"http://b"], f)
+
+        self.reload()
+        self.assertEqual(len(self.cache), 2)
+
+    def test_load_corrupt_journal(self):
+        self.cache.add(u"http://a")
+        self.cache.save()
+        with open(self.file_path + u".journal", 'ab') as f:
+            f.write('"http://b')
+
+        self.reload()
+        self.assertTrue(self.cache.has(u"http://a"))
+        self.cache.add(u"http://c")
+        self.cache.save()
+
+        self.reload()
+        self.assertTrue(self.cache.has(u"http://a"))
+        self.assertTrue(self.cache.has(u"http://c"))
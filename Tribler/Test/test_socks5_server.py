@@ -0,0 +1,190 @@
+import socket
+import struct
+
+from Tribler.Test.test_as_server import BaseTestCase
+from Tribler.community.tunnel.Socks5 import conversion, server
+from Tribler.community.tunnel.Socks5.server import ConnectionState, Socks5Connection, SocksUDPConnection
+
+
+class FakeTransport(object):
+
+    def __init__(self):
+        self.written = []
+        self.connected = True
+
+    def write(self, data):
+        self.written.append(data)
+
+    def loseConnection(self):
+        self.connected = False
+
+
+class FakeSelectionStrategy(object):
+
+    def has_options(self, hops):
+        return False
+
+
+class FakeUDPSocket(object):
+
+    def __init__(self):
+        self.datagrams = []
+
+    def sendDatagram(self, data):
+        self.datagrams.append(data)
+
+
+class FakePort(object):
+
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def stopListening(self):
+        self.socket.close()
+
+
+class FakeReactor(object):
+
+    def listenUDP(self, port, protocol):
+        return FakePort()
+
+
+def create_connection():
+    connection = Socks5Connection(None, FakeSelectionStrategy(), 1)
+    connection.transport = FakeTransport()
+    return connection
+
+
+class TestSocks5Connection(BaseTestCase):
+
+    HANDSHAKE = struct.pack("!BBBB", conversion.SOCKS_VERSION, 2, 0x02, 0x00)
+    CONNECT_IPV4 = struct.pack("!BBBB", conversion.SOCKS_VERSION, conversion.REQ_CMD_CONNECT, 0,
+                               conversion.ADDRESS_TYPE_IPV4) + socket.inet_aton("1.2.3.4") + struct.pack("!H", 80)
+    BIND_DOMAIN = struct.pack("!BBBBB", conversion.SOCKS_VERSION, conversion.REQ_CMD_BIND, 0,
+                              conversion.ADDRESS_TYPE_DOMAIN_NAME, 11) + "example.com" + struct.pack("!H", 80)
+
+    def setUp(self):
+        self.max_cached_addresses = server.MAX_CACHED_ADDRESSES
+
+    def tearDown(self):
+        server.MAX_CACHED_ADDRESSES = self.max_cached_addresses
+
+    def assert_split_like_whole(self, data):
+        expected = create_connection()
+        expected.dataReceived(data)
+
+        for split in xrange(len(data) + 1):
+            connection = create_connection()
+            connection.dataReceived(data[:split])
+            connection.dataReceived(data[split:])
+            self.assertEqual(connection.transport.written, expected.transport.written)
+            self.assertEqual(connection.state, expected.state)
+            self.assertEqual(len(connection.buffer), 0)
+
+        connection = create_connection()
+        for byte in data:
+            connection.dataReceived(byte)
+        self.assertEqual(connection.transport.written, expected.transport.written)
+        return expected
+
+    def test_handshake(self):
+        connection = self.assert_split_like_whole(self.HANDSHAKE)
+        self.assertEqual(connection.state, ConnectionState.CONNECTED)
+        self.assertEqual(connection.transport.written, [struct.pack("!BB", conversion.SOCKS_VERSION, 0x00)])
+
+    def test_connect_request(self):
+        connection = self.assert_split_like_whole(self.HANDSHAKE + self.CONNECT_IPV4)
+        reply = connection.transport.written[1]
+        self.assertEqual(ord(reply[1]), conversion.REP_HOST_UNREACHABLE)
+
+    def test_bind_request(self):
+        connection = self.assert_split_like_whole(self.HANDSHAKE + self.BIND_DOMAIN)
+        self.assertEqual(connection.state, ConnectionState.PROXY_REQUEST_ACCEPTED)
+        self.assertEqual(ord(connection.transport.written[1][1]), conversion.REP_SUCCEEDED)
+
+    def test_truncated(self):
+        for data in [self.HANDSHAKE[:-1], self.HANDSHAKE + self.CONNECT_IPV4[:-1],
+                     self.HANDSHAKE + self.BIND_DOMAIN[:-3]]:
+            connection = create_connection()
+            connection.dataReceived(data)
+
+            # the connection waits for the rest of the message
+            self.assertTrue(connection.transport.connected)
+            self.assertEqual(len(connection.transport.written), 1 if len(data) > len(self.HANDSHAKE) else 0)
+            self.assertEqual(len(connection.buffer), len(data) - len(connection.transport.written) *
+                             len(self.HANDSHAKE))
+
+    def test_garbage_handshake(self):
+        connection = create_connection()
+        connection.dataReceived("GET / HTTP/1.1\r\n\r\n")
+        self.assertFalse(connection.transport.connected)
+        self.assertEqual(connection.transport.written, [])
+        self.assertEqual(len(connection.buffer), 0)
+
+    def test_no_acceptable_method(self):
+        connection = create_connection()
+        connection.dataReceived(struct.pack("!BBB", conversion.SOCKS_VERSION, 1, 0x02))
+        self.assertFalse(connection.transport.connected)
+        self.assertEqual(connection.transport.written, [])
+
+    def test_garbage_request(self):
+        for request in ["\x04\x01\x00\x01" + "\x00" * 6, "\x05\x01\x00\x07" + "\x00" * 6,
+                        "\x05\x01\x00\x04" + "\x00" * 18]:
+            connection = create_connection()
+            connection.dataReceived(self.HANDSHAKE + request)
+            self.assertFalse(connection.transport.connected)
+            self.assertEqual(len(connection.transport.written), 1)
+            self.assertEqual(len(connection.buffer), 0)
+
+    def test_udp_header_cache(self):
+        server.MAX_CACHED_ADDRESSES = 2
+        connection = create_connection()
+        connection._udp_socket = FakeUDPSocket()
+        circuit = object()
+
+        for origin in [("1.2.3.4", 80), ("1.2.3.4", 80), ("5.6.7.8", 81), ("9.9.9.9", 82)]:
+            self.assertTrue(connection.on_incoming_from_tunnel(None, circuit, origin, "data", force=True))
+            request = conversion.decode_udp_packet(connection._udp_socket.datagrams[-1])
+            self.assertEqual(request.destination, origin)
+            self.assertEqual(request.payload, "data")
+
+        # the cache was cleared when the third origin arrived
+        self.assertEqual(connection._udp_headers.keys(), [("9.9.9.9", 82)])
+        self.assertFalse(connection.on_incoming_from_tunnel(None, object(), ("1.2.3.4", 80), "data"))
+
+
+class TestSocksUDPConnection(BaseTestCase):
+
+    def setUp(self):
+        self.max_cached_addresses = server.MAX_CACHED_ADDRESSES
+        # decode_datagram does not need a listening port
+        self.reactor = server.reactor
+        server.reactor = FakeReactor()
+        self.udp_connection = SocksUDPConnection(None, ("0.0.0.0", 0))
+
+    def tearDown(self):
+        self.udp_connection.close()
+        server.reactor = self.reactor
+        server.MAX_CACHED_ADDRESSES = self.max_cached_addresses
+
+    def test_decode_datagram(self):
+        server.MAX_CACHED_ADDRESSES = 2
+        for destination in [("1.2.3.4", 80), ("1.2.3.4", 80), ("5.6.7.8", 81), ("9.9.9.9", 82)]:
+            datagram = conversion.encode_udp_packet(0, 0, conversion.ADDRESS_TYPE_IPV4, destination[0],
+                                                    destination[1], "payload")
+            self.assertEqual(self.udp_connection.decode_datagram(datagram), (0, destination, "payload"))
+        self.assertEqual(self.udp_connection._addresses.values(), [("9.9.9.9", 82)])
+
+    def test_decode_datagram_domain(self):
+        datagram = conversion.encode_udp_packet(0, 0, conversion.ADDRESS_TYPE_DOMAIN_NAME, "example.com", 80, "x")
+        self.assertEqual(self.udp_connection.decode_datagram(datagram), (0, ("example.com", 80), "x"))
+        self.assertEqual(self.udp_connection._addresses, {})
+
+    def test_decode_udp_packet_ipv4_header(self):
+        datagram = conversion.encode_udp_packet(0, 1, conversion.ADDRESS_TYPE_IPV4, "1.2.3.4", 80, "payload")
+        frag, address, payload = conversion.decode_udp_packet_ipv4_header(datagram)
+        self.assertEqual((frag, payload), (1, "payload"))
+        self.assertEqual(conversion.decode_packed_ipv4_address(address), ("1.2.3.4", 80))
+
+        self.assertIsNone(conversion.decode_udp_packet_ipv4_header(datagram[:conversion.UDP_IPV4_HEADER_LENGTH - 1]))
+        self.assertIsNone(conversion.decode_udp_packet_ipv4_header("\x00\x00\x00\x03" + "\x00" * 10))
@@ -0,0 +1,98 @@
+import random
+from copy import copy
+
+from Tribler.Core.Utilities.sort_utils import insert_torrent_fulltext, normalize_data_dict, sort_torrent_fulltext
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class FakeTorrent(object):
+
+    def __init__(self, rand, infohash):
+        self.infohash = infohash
+        self.num_seeders = rand.randint(0, 100)
+        self.neg_votes = rand.randint(0, 3)
+        self.subscriptions = rand.randint(0, 10)
+        self.relevance_score = [rand.randint(0, 2), -rand.randint(0, 3), 0, 0, 0]
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class TestSortUtils(BaseTestCase):
+
+    def setUp(self):
+        self.rand = random.Random(42)
+
+    def create_torrents(self, nr_torrents, offset=0):
+        return [FakeTorrent(self.rand, "%020d" % (offset + i)) for i in xrange(nr_torrents)]
+
+    def test_sort_torrent_fulltext(self):
+        torrents = self.create_torrents(500)
+        # the mean of negative counts is truncated towards minus infinity, as normalize_data_dict truncates it
+        for torrent in torrents[::7]:
+            torrent.num_seeders = -1
+        norm_num_seeders = normalize_data_dict(torrents, 'num_seeders', 'infohash')
+        norm_neg_votes = normalize_data_dict(torrents, 'neg_votes', 'infohash')
+        norm_subscriptions = normalize_data_dict(torrents, 'subscriptions', 'infohash')
+
+        # the integer counts are normalized with the truncated mean and variance, as normalize_data_dict does
+        sort_torrent_fulltext(torrents)
+        self.assertEqual(torrents, sorted(torrents, key=lambda torrent: torrent.relevance_score, reverse=True))
+        for torrent in torrents:
+            self.assertEqual(torrent.relevance_score[-1], 0.8 * norm_num_seeders[torrent.infohash] -
+                             0.1 * norm_neg_votes[torrent.infohash] + 0.1 * norm_subscriptions[torrent.infohash])
+
+    def test_sort_torrent_fulltext_float(self):
+        torrents = self.create_torrents(100)
+        for torrent in torrents:
+            torrent.num_seeders = torrent.num_seeders / 3.0
+        norm_num_seeders = normalize_data_dict(torrents, 'num_seeders', 'infohash')
+        norm_neg_votes = normalize_data_dict(torrents, 'neg_votes', 'infohash')
+        norm_subscriptions = normalize_data_dict(torrents, 'subscriptions', 'infohash')
+
+        sort_torrent_fulltext(torrents)
+        for torrent in torrents:
+            self.assertAlmostEqual(torrent.relevance_score[-1], 0.8 * norm_num_seeders[torrent.infohash] -
+                                   0.1 * norm_neg_votes[torrent.infohash] + 0.1 * norm_subscriptions[torrent.infohash])
+
+    def test_sort_torrent_fulltext_same_values(self):
+        torrents = self.create_torrents(10)
+        for torrent in torrents:
+            torrent.num_seeders = torrent.neg_votes = torrent.subscriptions = 5
+        sort_torrent_fulltext(torrents)
+        self.assertEqual([torrent.relevance_score[-1] for torrent in torrents], [0] * 10)
+
+        torrents = self.create_torrents(1)
+        sort_torrent_fulltext(torrents)
+        self.assertEqual(torrents[0].relevance_score[-1], 0)
+
+    def test_insert_torrent_fulltext(self):
+        torrents = self.create_torrents(200)
+        sort_torrent_fulltext(torrents)
+        scores = dict((torrent.infohash, torrent.relevance_score[-1]) for torrent in torrents)
+
+        new_torrents = self.create_torrents(50, 200)
+        insert_torrent_fulltext(torrents, new_torrents)
+
+        self.assertEqual(len(torrents), 250)
+        self.assertEqual(torrents, sorted(torrents, key=lambda torrent: torrent.relevance_score, reverse=True))
+        # the new torrents are scored as sorting all torrents would, the others keep their score
+        all_torrents = [copy(torrent) for torrent in torrents]
+        for torrent in all_torrents:
+            torrent.relevance_score = list(torrent.relevance_score)
+        sort_torrent_fulltext(all_torrents)
+        expected = dict((torrent.infohash, torrent.relevance_score[-1]) for torrent in all_torrents)
+        for torrent in torrents:
+            self.assertAlmostEqual(torrent.relevance_score[-1], scores.get(torrent.infohash, expected[torrent.infohash]))
+
+    def test_insert_torrent_fulltext_stable(self):
+        torrents = self.create_torrents(20)
+        for torrent in torrents:
+            torrent.num_seeders = torrent.neg_votes = torrent.subscriptions = 0
+            torrent.relevance_score = [1, 0, 0, 0, 0]
+        new_torrents = [FakeTorrent(self.rand, "new")]
+        new_torrents[0].num_seeders = new_torrents[0].neg_votes = new_torrents[0].subscriptions = 0
+        new_torrents[0].relevance_score = [1, 0, 0, 0, 0]
+
+        insert_torrent_fulltext(torrents, new_torrents)
+        self.assertEqual(torrents[-1].infohash, "new")
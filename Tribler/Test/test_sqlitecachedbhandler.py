@@ -1,6 +1,6 @@
 import os
-import unittest
 from binascii import unhexlify
+from collections import defaultdict
 from shutil import copy as copyFile
 from time import time
 from unittest.case import skip
@@ -8,14 +8,18 @@ from unittest.case import skip
 from twisted.internet import reactor
 
 from Tribler.Category.Category import Category
+from Tribler.Core.CacheDB import SqliteCacheDBHandler
 from Tribler.Core.CacheDB.SqliteCacheDBHandler import (TorrentDBHandler, MyPreferenceDBHandler, BasicDBHandler,
-                                                       PeerDBHandler)
+                                                       PeerDBHandler, ChannelTorrentSample, ChannelCastDBHandler,
+                                                       weighted_sample)
+from Tribler.Core.CacheDB.db_versions import LATEST_DB_VERSION
 from Tribler.Core.CacheDB.sqlitecachedb import str2bin, SQLiteCacheDB
 from Tribler.Core.Session import Session
 from Tribler.Core.SessionConfig import SessionStartupConfig
 from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.Upgrade.db_upgrader import DBUpgrader
 from Tribler.Test.bak_tribler_sdb import TESTS_DATA_DIR, init_bak_tribler_sdb
-from Tribler.Test.test_as_server import AbstractServer
+from Tribler.Test.test_as_server import AbstractServer, BaseTestCase
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
 
@@ -192,6 +196,16 @@ class TestTorrentDBHandler(AbstractDB):
         fake_infoahsh = 'fake_infohash_100000'
         assert self.tdb.hasTorrent(fake_infoahsh) == False
 
+    @blocking_call_on_reactor_thread
+    def test_get_dispersy_ids_from_infohashes(self):
+        torrents = self.tdb._db.fetchall(u"SELECT torrent_id, infohash FROM Torrent LIMIT 2")
+        self.tdb._db.execute_write(u"UPDATE Torrent SET dispersy_id = 100 WHERE torrent_id = ?", (torrents[0][0],))
+        self.tdb._db.execute_write(u"UPDATE Torrent SET dispersy_id = NULL WHERE torrent_id = ?", (torrents[1][0],))
+        infohashes = [str2bin(infohash) for _, infohash in torrents] + ['fake_infohash_100000']
+
+        self.assertEqual(self.tdb.getDispersyIdsFromInfohashes(infohashes), {infohashes[0]: 100, infohashes[1]: None})
+        self.assertEqual(self.tdb.getDispersyIdsFromInfohashes([]), {})
+
     @blocking_call_on_reactor_thread
     def test_add_update_Torrent(self):
         self.addTorrent()
@@ -291,7 +305,6 @@ class TestTorrentDBHandler(AbstractDB):
         res = self.tdb.getNumberCollectedTorrents()
         assert res == 4848, res
 
-    @unittest.skip("TODO, the database thingie shouldn't be deleting files from the FS.")
     @blocking_call_on_reactor_thread
     def test_freeSpace(self):
         old_res = self.tdb.getNumberCollectedTorrents()
@@ -299,6 +312,49 @@ class TestTorrentDBHandler(AbstractDB):
         res = self.tdb.getNumberCollectedTorrents()
         assert old_res - res == 20
 
+    @blocking_call_on_reactor_thread
+    def test_freeSpace_keeps_preferences(self):
+        self.tdb.freeSpace(1)
+        # a candidate that became a preference after the candidates were selected is not erased
+        torrent_id = self.tdb._eviction_candidates[0]
+        self.tdb._db.execute_write(u"INSERT INTO MyPreference (torrent_id, destination_path, creation_time) "
+                                   u"VALUES (?, ?, ?)", (torrent_id, u"/tmp", 0))
+        self.assertEqual(self.tdb.freeSpace(1), 0)
+        self.assertTrue(self.tdb._db.fetchone(u"SELECT is_collected FROM Torrent WHERE torrent_id = ?",
+                                              (torrent_id,)))
+
+
+    @blocking_call_on_reactor_thread
+    def test_addExternalTorrentsNoDef(self):
+        torrents = [(u"ubuntu %d" % i, [(u"ubuntu-%d.iso" % i, 1024 * i)] if i % 2 else
+                     [(u"disc %d/track %d.mp3" % (i, j), 1024 * j) for j in xrange(1, 5)],
+                     ["http://tracker%d.example.org/announce" % (i % 3)] if i % 4 else [], 1234567890 + i)
+                    for i in xrange(1, 21)]
+        torrents.append((u"no files", [], [], 1234567890))
+        single_infohashes = [("single %d" % i).ljust(20) for i in xrange(len(torrents))]
+        bulk_infohashes = [("bulk %d" % i).ljust(20) for i in xrange(len(torrents))]
+
+        single_ids, _ = self.tdb.addOrGetTorrentIDSReturn(single_infohashes)
+        for infohash, torrent in zip(single_infohashes, torrents):
+            self.tdb.addExternalTorrentNoDef(infohash, *torrent)
+        bulk_ids, _ = self.tdb.addOrGetTorrentIDSReturn(bulk_infohashes)
+        self.tdb.addExternalTorrentsNoDef([(torrent_id, infohash) + torrent
+                                           for torrent_id, infohash, torrent in zip(bulk_ids, bulk_infohashes, torrents)])
+
+        def get_stored(torrent_id):
+            row = self.tdb._db.fetchone(u"SELECT name, length, creation_date, num_files, secret, category, status, "
+                                        u"comment, is_collected FROM Torrent WHERE torrent_id = ?", (torrent_id,))
+            index = self.tdb._db.fetchone(u"SELECT swarmname, filenames, fileextensions FROM FullTextIndex "
+                                          u"WHERE rowid = ?", (torrent_id,))
+            files = self.tdb._db.fetchall(u"SELECT path, length FROM TorrentFiles WHERE torrent_id = ? "
+                                          u"ORDER BY path", (torrent_id,))
+            return row, index, files, sorted(self.tdb.getTrackerListByTorrentID(torrent_id))
+
+        for single_id, bulk_id in zip(single_ids, bulk_ids):
+            self.assertEqual(get_stored(bulk_id), get_stored(single_id))
+        self.assertIn(u"http://tracker1.example.org/announce", get_stored(bulk_ids[0])[3])
+        self.assertIsNone(get_stored(bulk_ids[-1])[1])
+
 
 class TestMyPreferenceDBHandler(AbstractDB):
 
@@ -365,3 +421,140 @@ class TestMyPreferenceDBHandler(AbstractDB):
         for k in res:
             data = res[k]
             assert isinstance(data, basestring), "data is not destination_path: %s" % type(data)
+
+
+class TestChannelCastDBHandler(AbstractDB):
+
+    @blocking_call_on_reactor_thread
+    def setUp(self):
+        super(TestChannelCastDBHandler, self).setUp()
+        self.sqlitedb.initial_begin()
+        DBUpgrader(self.session, self.sqlitedb, torrent_store=None).start_migrate()
+        self.assertEqual(self.sqlitedb.version, LATEST_DB_VERSION)
+
+        self.cdb = ChannelCastDBHandler(self.session)
+
+    @blocking_call_on_reactor_thread
+    def tearDown(self):
+        self.cdb.close()
+        self.cdb = None
+
+        super(TestChannelCastDBHandler, self).tearDown()
+
+    def add_modification(self, dispersy_id, channeltorrent_id, modification_type):
+        self.cdb.on_metadata_from_dispersy(u"torrent" if channeltorrent_id else u"channel", channeltorrent_id, None,
+                                           1, dispersy_id, None, "mid@%d" % dispersy_id, modification_type,
+                                           u"value %d" % dispersy_id, 1234567890, None, dispersy_id - 1)
+        self.cdb.set_latest_metadata(1, channeltorrent_id, None, modification_type, dispersy_id, dispersy_id - 1,
+                                     dispersy_id)
+
+    @blocking_call_on_reactor_thread
+    def test_get_dispersy_ids_from_channel_id(self):
+        torrents = self.cdb._db.fetchall(u"SELECT torrent_id, infohash FROM Torrent LIMIT 3")
+        self.cdb._db.executemany(u"INSERT INTO _ChannelTorrents (dispersy_id, torrent_id, channel_id) VALUES (?, ?, 1)",
+                                 [(100, torrents[0][0]), (101, torrents[1][0])])
+        infohashes = [str2bin(infohash) for _, infohash in torrents]
+
+        self.assertEqual(self.cdb.getDispersyIdsFromChannelId(1, infohashes), {infohashes[0]: 100, infohashes[1]: 101})
+        self.assertEqual(self.cdb.getDispersyIdsFromChannelId(2, infohashes), {})
+
+    @blocking_call_on_reactor_thread
+    def test_latest_metadata(self):
+        self.assertIsNone(self.cdb.get_latest_metadata(1, 7, None, u"name"))
+        self.add_modification(10, 7, u"name")
+        self.add_modification(11, None, u"name")
+        self.assertEqual(self.cdb.get_latest_metadata(1, 7, None, u"name"), (10, 9, 10))
+        self.assertEqual(self.cdb.get_latest_metadata(1, None, None, u"name"), (11, 10, 11))
+        self.assertIsNone(self.cdb.get_latest_metadata(1, 7, None, u"description"))
+
+    @blocking_call_on_reactor_thread
+    def test_latest_metadata_invalidated(self):
+        self.add_modification(10, 7, u"name")
+        self.add_modification(11, None, u"name")
+
+        # a moderated modification is no longer a candidate
+        self.cdb.on_moderation(1, 20, None, None, 10, u"spam", 1234567890, 0)
+        self.assertIsNone(self.cdb.get_latest_metadata(1, 7, None, u"name"))
+        self.assertIsNotNone(self.cdb.get_latest_metadata(1, None, None, u"name"))
+
+        self.cdb.set_latest_metadata(1, 7, None, u"name", 10, 9, 10)
+        self.cdb.on_remove_moderation(1, 20, False)
+        self.assertIsNone(self.cdb.get_latest_metadata(1, 7, None, u"name"))
+
+        self.cdb.on_remove_metadata_from_dispersy(1, 11, False)
+        self.assertIsNone(self.cdb.get_latest_metadata(1, None, None, u"name"))
+
+    @blocking_call_on_reactor_thread
+    def test_channel_samples_bounded(self):
+        max_channel_samples = SqliteCacheDBHandler.MAX_CHANNEL_SAMPLES
+        SqliteCacheDBHandler.MAX_CHANNEL_SAMPLES = 2
+        try:
+            for channel_id in [1, 2, 1, 3]:
+                self.cdb._get_channel_sample(channel_id)
+        finally:
+            SqliteCacheDBHandler.MAX_CHANNEL_SAMPLES = max_channel_samples
+        self.assertEqual(self.cdb._channel_samples.keys(), [1, 3])
+
+    @blocking_call_on_reactor_thread
+    def test_random_torrents_distribution(self):
+        # channel 1 has 2000 torrents and channel 2 has 100, all older torrents should be about equally likely
+        for channel_id, nr_torrents in [(1, 2000), (2, 100)]:
+            sample = self.cdb._channel_samples[channel_id] = ChannelTorrentSample()
+            for time_stamp in xrange(nr_torrents):
+                sample.add(time_stamp, (channel_id, time_stamp))
+
+        picks = defaultdict(int)
+        for _ in xrange(1000):
+            torrent_dict = {}
+            self.cdb._get_recent_and_random([(1, "cid1"), (2, "cid2")], 15, 10, torrent_dict)
+            self.assertEqual(sum(len(torrents) for torrents in torrent_dict.itervalues()), 25)
+            for channel_id, time_stamp in set.union(*torrent_dict.values()):
+                if channel_id == 2:
+                    picks[u"small channel"] += 1
+                elif time_stamp < 1936:
+                    picks[u"reservoir"] += 1
+                elif time_stamp < 1985:
+                    picks[u"recent but older"] += 1
+
+        # 100 and 49 of the 2085 older torrents, pooling the samples without weights picks them about half and a
+        # quarter of the time
+        self.assertEqual(sum(picks.values()), 10000)
+        self.assertLess(picks[u"small channel"], 10000 * 0.1)
+        self.assertLess(picks[u"recent but older"], 10000 * 0.05)
+
+
+class TestChannelTorrentSample(BaseTestCase):
+
+    def test_recent(self):
+        sample = ChannelTorrentSample(nr_recent=3, nr_random=2)
+        for time_stamp in [5, 1, 9, 3, 7]:
+            sample.add(time_stamp, str(time_stamp))
+        self.assertEqual(sample.recent, [(5, "5"), (7, "7"), (9, "9")])
+        self.assertEqual(sorted(sample.reservoir), [(1, "1"), (3, "3")])
+        self.assertEqual(len(sample), 5)
+
+    def test_reservoir_bounded(self):
+        sample = ChannelTorrentSample(nr_recent=2, nr_random=5)
+        for time_stamp in xrange(1000):
+            sample.add(time_stamp, str(time_stamp))
+        self.assertEqual(len(sample.reservoir), 5)
+        self.assertEqual(sample.nr_older, 998)
+        self.assertTrue(all(time_stamp < 998 for time_stamp, _ in sample.reservoir))
+
+    def test_get_older(self):
+        sample = ChannelTorrentSample(nr_recent=3, nr_random=3)
+        for time_stamp in xrange(6):
+            sample.add(time_stamp, str(time_stamp))
+        self.assertEqual(sorted(sample.get_older(4)), [(1.0, (0, "0")), (1.0, (1, "1")), (1.0, (2, "2")),
+                                                       (1.0, (3, "3"))])
+
+        for time_stamp in xrange(6, 12):
+            sample.add(time_stamp, str(time_stamp))
+        # the reservoir of 3 torrents stands for all 9 older torrents
+        self.assertEqual(sorted(weight for weight, _ in sample.get_older(12)), [1.0] * 3 + [3.0] * 3)
+
+    def test_weighted_sample(self):
+        population = [(1.0, "a"), (1000.0, "b"), (1.0, "c")]
+        self.assertEqual(sorted(weighted_sample(population, 5)), ["a", "b", "c"])
+        picks = [weighted_sample(population, 1)[0] for _ in xrange(100)]
+        self.assertGreater(picks.count("b"), 90)
@@ -0,0 +1,65 @@
+from threading import Event
+
+from twisted.internet.threads import blockingCallFromThread
+from twisted.python.threadable import isInIOThread
+
+from Tribler.Core.APIImplementation.startupgraph import StartupGraph
+from Tribler.Core.Utilities.twisted_thread import reactor
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class TestStartupGraph(BaseTestCase):
+
+    def setUp(self):
+        self.graph = StartupGraph(u"test")
+        self.called = []
+
+    def step(self, name, result=None):
+        def call():
+            self.called.append(name)
+            if isinstance(result, Exception):
+                raise result
+        return call
+
+    def test_dependencies(self):
+        self.graph.add_step("a", self.step("a"))
+        self.graph.add_step("b", self.step("b"), ["a"])
+        self.graph.add_step("c", self.step("c"), ["b", "disabled"], in_thread=False)
+
+        timings = blockingCallFromThread(reactor, self.graph.run)
+        self.assertEqual(self.called, ["a", "b", "c"])
+        self.assertEqual(list(timings), ["a", "b", "c"])
+
+    def test_concurrent(self):
+        started = Event()
+
+        def wait():
+            # only returns when the other step runs at the same time
+            self.assertTrue(started.wait(10))
+
+        self.graph.add_step("wait", wait)
+        self.graph.add_step("start", started.set)
+        blockingCallFromThread(reactor, self.graph.run)
+
+    def test_failure(self):
+        self.graph.add_step("a", self.step("a", ValueError()))
+        self.graph.add_step("b", self.step("b"), ["a"])
+        self.graph.add_step("c", self.step("c"))
+
+        self.assertRaises(ValueError, blockingCallFromThread, reactor, self.graph.run)
+        self.assertEqual(sorted(self.called), ["a", "c"])
+        self.assertEqual(self.graph.timings["b"], (None, 0.0))
+
+    def test_empty(self):
+        self.assertEqual(blockingCallFromThread(reactor, self.graph.run), {})
+
+    def test_reactor_thread(self):
+        threads = {}
+
+        def record(name):
+            threads[name] = isInIOThread()
+
+        self.graph.add_step("thread", lambda: record("thread"))
+        self.graph.add_step("reactor", lambda: record("reactor"), in_thread=False)
+        blockingCallFromThread(reactor, self.graph.run)
+        self.assertEqual(threads, {"thread": False, "reactor": True})
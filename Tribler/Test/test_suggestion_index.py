@@ -0,0 +1,47 @@
+from Tribler.Core.Utilities.suggestion_index import SuggestionIndex, levenshtein, get_trigrams
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class TestSuggestionIndex(BaseTestCase):
+
+    def setUp(self):
+        self.index = SuggestionIndex()
+        self.index.load([u"ubuntu desktop amd64", u"ubuntu server i386", u"pioneer one s01e01",
+                         u"pioneer one s01e06", u"night of the living dead"])
+
+    def test_levenshtein(self):
+        self.assertEqual(levenshtein(u"kitten", u"sitting"), 3)
+        self.assertEqual(levenshtein(u"", u"abc"), 3)
+        self.assertEqual(levenshtein(u"abc", u"abc"), 0)
+
+    def test_get_trigrams(self):
+        self.assertEqual(get_trigrams(u"abc"), {u"$ab", u"abc", u"bc$"})
+
+    def test_load(self):
+        self.assertTrue(self.index.is_loaded)
+        self.assertEqual(self.index.get_frequency(u"ubuntu"), 2)
+        self.assertEqual(self.index.get_frequency(u"unknown"), 0)
+
+        # loading a loaded index does not count the terms twice
+        self.index.load([u"ubuntu desktop"])
+        self.assertEqual(self.index.get_frequency(u"ubuntu"), 2)
+
+    def test_get_completions(self):
+        self.assertEqual(self.index.get_completions(u"ub", 5), [u"ubuntu"])
+        self.assertEqual(self.index.get_completions(u"ubuntu", 5), [])
+        self.assertEqual(sorted(self.index.get_completions(u"s0", 5)), [u"s01e01", u"s01e06"])
+        self.assertEqual(len(self.index.get_completions(u"s0", 1)), 1)
+
+    def test_add_swarmname(self):
+        self.index.add_swarmname(u"ubuntustudio desktop")
+        self.assertEqual(self.index.get_completions(u"ubuntu", 5), [u"ubuntustudio"])
+        self.assertEqual(self.index.get_completions(u"d", 5), [u"desktop", u"dead"])
+
+    def test_get_similar_terms(self):
+        self.assertEqual(self.index.get_similar_terms(u"ubunto", 1), [(1, u"ubuntu")])
+        self.assertEqual(self.index.get_similar_terms(u"pionere", 2), [(2, u"pioneer")])
+        self.assertEqual(self.index.get_similar_terms(u"xyzxyz", 2), [])
+
+    def test_get_similar_terms_repeated_trigrams(self):
+        self.index.add_swarmname(u"aaaaab")
+        self.assertEqual(self.index.get_similar_terms(u"aaaaaa", 1), [(1, u"aaaaab")])
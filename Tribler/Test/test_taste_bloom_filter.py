@@ -0,0 +1,164 @@
+from hashlib import sha1
+
+from Tribler.Test.test_as_server import BaseTestCase
+from Tribler.community.search.community import (SearchCommunity, MAX_TASTE_PREFERENCES,
+                                                TASTE_BLOOM_FILTER_MAX_ERROR_RATE)
+from Tribler.community.search.conversion import SearchConversion
+from Tribler.dispersy.util import blocking_call_on_reactor_thread
+
+
+def create_infohash(i):
+    return sha1(str(i)).digest()
+
+
+class FakeMyPreferenceDB(object):
+
+    def __init__(self, preferences):
+        self.preferences = preferences
+
+    def getMyPrefListInfohash(self, returnDeleted=True, limit=None):
+        return self.preferences[:limit]
+
+
+def create_community(preferences):
+    # the taste bloom filter only depends on these attributes, there is no need to start dispersy
+    community = SearchCommunity.__new__(SearchCommunity)
+    community._mypref_db = FakeMyPreferenceDB(preferences)
+    community._my_preferences = None
+    community._my_preferences_set = None
+    community.taste_bloom_filter = None
+    community.taste_bloom_filter_keys = 0
+    community.taste_bloom_filter_version = 0
+    return community
+
+
+class TestTasteBloomFilter(BaseTestCase):
+
+    @blocking_call_on_reactor_thread
+    def test_add_preference(self):
+        community = create_community([create_infohash(i) for i in xrange(100)])
+        community.get_my_preferences()
+        bloom_filter = community.taste_bloom_filter
+        version = community.taste_bloom_filter_version
+
+        community.on_my_preference_added(None, None, create_infohash(100))
+
+        # the preference is added to the existing bloom filter
+        self.assertIs(community.taste_bloom_filter, bloom_filter)
+        self.assertIn(create_infohash(100), bloom_filter)
+        self.assertEqual(community.taste_bloom_filter_keys, 101)
+        self.assertEqual(community.taste_bloom_filter_version, version + 1)
+        self.assertEqual(community.get_my_preferences()[0], create_infohash(100))
+
+        # a known preference becomes the most recent one, the bloom filter does not change
+        community.on_my_preference_added(None, None, create_infohash(50))
+        self.assertEqual(community.taste_bloom_filter_version, version + 1)
+        self.assertEqual(community.get_my_preferences()[:2], [create_infohash(50), create_infohash(100)])
+        self.assertEqual(len(community.get_my_preferences()), 101)
+        self.assertEqual(community._my_preferences_set, set(community.get_my_preferences()))
+
+    @blocking_call_on_reactor_thread
+    def test_delete_preference(self):
+        community = create_community([create_infohash(i) for i in xrange(100)])
+        community.get_my_preferences()
+        version = community.taste_bloom_filter_version
+
+        community.on_my_preference_deleted(None, None, create_infohash(50))
+
+        # the bloom filter is rebuilt without the removed preference
+        self.assertNotIn(create_infohash(50), community.get_my_preferences())
+        self.assertNotIn(create_infohash(50), community._my_preferences_set)
+        self.assertNotIn(create_infohash(50), community.taste_bloom_filter)
+        self.assertEqual(community.taste_bloom_filter_keys, 99)
+        self.assertEqual(community.taste_bloom_filter_version, version + 1)
+
+        # an unknown preference does not change anything
+        community.on_my_preference_deleted(None, None, create_infohash(50))
+        self.assertEqual(community.taste_bloom_filter_version, version + 1)
+
+        # deleting the last preference removes the bloom filter
+        community = create_community([create_infohash(0)])
+        community.get_my_preferences()
+        community.on_my_preference_deleted(None, None, create_infohash(0))
+        self.assertEqual(community.get_my_preferences(), [])
+        self.assertIsNone(community.taste_bloom_filter)
+
+    @blocking_call_on_reactor_thread
+    def test_rebuild(self):
+        community = create_community([create_infohash(i) for i in xrange(10)])
+        community.get_my_preferences()
+
+        nr_rebuilds = 0
+        for i in xrange(10, 100):
+            bloom_filter = community.taste_bloom_filter
+            will_pass = community.get_taste_bloom_filter_error_rate(1) > TASTE_BLOOM_FILTER_MAX_ERROR_RATE
+            community.on_my_preference_added(None, None, create_infohash(i))
+
+            # the bloom filter is rebuilt exactly when it would pass the maximum error rate
+            self.assertEqual(community.taste_bloom_filter is not bloom_filter, will_pass)
+            self.assertLessEqual(community.get_taste_bloom_filter_error_rate(), TASTE_BLOOM_FILTER_MAX_ERROR_RATE)
+            self.assertEqual(community.taste_bloom_filter_keys, i + 1)
+            nr_rebuilds += will_pass
+
+        self.assertGreater(nr_rebuilds, 0)
+        self.assertTrue(all(create_infohash(i) in community.taste_bloom_filter for i in xrange(100)))
+
+    @blocking_call_on_reactor_thread
+    def test_max_preferences(self):
+        preferences = [create_infohash(i) for i in xrange(MAX_TASTE_PREFERENCES + 10)]
+        community = create_community(preferences)
+        self.assertEqual(community.get_my_preferences(), preferences[:MAX_TASTE_PREFERENCES])
+
+        community.on_my_preference_added(None, None, create_infohash(-1))
+
+        # the oldest preference is dropped
+        my_preferences = community.get_my_preferences()
+        self.assertEqual(len(my_preferences), MAX_TASTE_PREFERENCES)
+        self.assertEqual(my_preferences[0], create_infohash(-1))
+        self.assertEqual(my_preferences[-1], preferences[MAX_TASTE_PREFERENCES - 2])
+        self.assertEqual(community._my_preferences_set, set(my_preferences))
+
+
+class FakeBloomFilter(object):
+
+    functions = 3
+    size = 16
+    prefix = " "
+
+    def __init__(self):
+        self.nr_encoded = 0
+
+    @property
+    def bytes(self):
+        self.nr_encoded += 1
+        return "\x00\x01"
+
+
+class FakeCommunity(object):
+
+    taste_bloom_filter_version = 0
+
+
+class TestSearchConversion(BaseTestCase):
+
+    def test_encode_taste_bloom_filter(self):
+        # _encode_taste_bloom_filter only needs the community, not the meta messages
+        conversion = SearchConversion.__new__(SearchConversion)
+        conversion._community = FakeCommunity()
+        conversion._taste_bloom_filter_cache = (None, None, None)
+        bloom_filter = FakeBloomFilter()
+
+        encoded = conversion._encode_taste_bloom_filter(bloom_filter)
+        self.assertEqual(encoded, "\x03\x00\x10 \x00\x01")
+        self.assertEqual(conversion._encode_taste_bloom_filter(bloom_filter), encoded)
+        self.assertEqual(bloom_filter.nr_encoded, 1)
+
+        # a new version of the bloom filter is encoded again
+        conversion._community.taste_bloom_filter_version += 1
+        conversion._encode_taste_bloom_filter(bloom_filter)
+        self.assertEqual(bloom_filter.nr_encoded, 2)
+
+        # as is another bloom filter
+        other_bloom_filter = FakeBloomFilter()
+        conversion._encode_taste_bloom_filter(other_bloom_filter)
+        self.assertEqual(other_bloom_filter.nr_encoded, 1)
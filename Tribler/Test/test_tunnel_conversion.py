@@ -0,0 +1,43 @@
+from struct import pack
+
+from Tribler.Test.test_as_server import BaseTestCase
+from Tribler.community.tunnel.conversion import (TunnelConversion, PACKET_TYPE_UTP, PACKET_TYPE_UDP_TRACKER,
+                                                 PACKET_TYPE_DHT, PACKET_TYPE_DISPERSY)
+from Tribler.dispersy.endpoint import TUNNEL_PREFIX
+
+
+class TestTunnelConversion(BaseTestCase):
+
+    UTP_PACKET = pack('!BB', 0x41, 0) + '\x00' * 18
+    UDP_TRACKER_PACKET = pack('!QII', 0x41727101980, 0, 1234)
+    DHT_PACKET = 'd1:ad2:id20:abcdefghij0123456789e1:q4:ping1:t2:aa1:y1:qe'
+    DISPERSY_PACKET = TUNNEL_PREFIX + '\x00' * 23
+
+    def test_classify(self):
+        self.assertEqual(TunnelConversion.classify(self.UTP_PACKET), PACKET_TYPE_UTP)
+        self.assertEqual(TunnelConversion.classify(self.UDP_TRACKER_PACKET), PACKET_TYPE_UDP_TRACKER)
+        self.assertEqual(TunnelConversion.classify(self.DHT_PACKET), PACKET_TYPE_DHT)
+        self.assertEqual(TunnelConversion.classify(self.DISPERSY_PACKET), PACKET_TYPE_DISPERSY)
+
+    def test_classify_forbidden(self):
+        self.assertIsNone(TunnelConversion.classify('GET / HTTP/1.1\r\n\r\n' + '\xff' * 8))
+        self.assertIsNone(TunnelConversion.classify('d1:ai1ee'))
+        self.assertFalse(TunnelConversion.is_allowed('\xff' * 4))
+
+    def test_could_be_dht(self):
+        self.assertTrue(TunnelConversion.could_be_dht(self.DHT_PACKET))
+        self.assertTrue(TunnelConversion.could_be_dht('d1:rd2:id20:abcdefghij0123456789e1:t2:aa1:y1:re'))
+        self.assertTrue(TunnelConversion.could_be_dht('d1:eli201e10:Error texte1:t2:aa1:y1:ee'))
+
+    def test_could_be_dht_forbidden(self):
+        # the message type has to be the value of the top level key 'y'
+        for data in ['d7:payload6:1:y1:q4:datai1ee', 'd1:ad1:y1:qee', 'l1:y1:qe' + ' ' * 8, 'd1:y1:xe',
+                     'd1:y1:q1:ai1e', 'd1:y1:q1:ai1ee trailing e', 'd1:y1:q1:a99:xe', 'd1:y1:q1:ai1xee',
+                     'd1:y1:q1:a' + 'l' * 100 + 'e' * 101]:
+            self.assertFalse(TunnelConversion.could_be_dht(data), data)
+            self.assertIsNone(TunnelConversion.classify(data, PACKET_TYPE_DHT), data)
+
+    def test_classify_hint(self):
+        self.assertEqual(TunnelConversion.classify(self.DHT_PACKET, PACKET_TYPE_DHT), PACKET_TYPE_DHT)
+        self.assertEqual(TunnelConversion.classify(self.UTP_PACKET, PACKET_TYPE_DHT), PACKET_TYPE_UTP)
+        self.assertIsNone(TunnelConversion.classify('\xff' * 4, PACKET_TYPE_UTP))
@@ -0,0 +1,116 @@
+import json
+
+from Tribler.Main.webUI import webUI
+from Tribler.Main.webUI.webUI import WebUI
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class FakeTorrent(object):
+
+    def __init__(self, infohash, name):
+        self.infohash = infohash
+        self.name = name
+        self.length = 1000
+        self.state = set()
+        self.progress = 0.5
+        self.ds = None
+
+
+class FakeLibraryManager(object):
+
+    def __init__(self):
+        self.guiUtility = None
+        self.torrents = [FakeTorrent(chr(i) * 20, u"torrent %d" % i) for i in xrange(3)]
+
+    def getHitsInCategory(self):
+        return len(self.torrents), self.torrents
+
+
+class TestWebUIList(BaseTestCase):
+
+    def setUp(self):
+        self.library_manager = FakeLibraryManager()
+        self.webui = WebUI(self.library_manager, None, 0)
+        self.webui.currentTokens.add("token")
+
+    def tearDown(self):
+        WebUI.delInstance()
+
+    def update(self):
+        self.webui.on_download_states([], {})
+
+    def test_list_full(self):
+        return_dict = self.webui.doList({})
+        self.assertEqual([row[2] for row in return_dict['torrents']], ["torrent 0", "torrent 1", "torrent 2"])
+
+    def test_list_changes(self):
+        cache_id = self.webui.doList({})['torrentc']
+
+        self.library_manager.torrents[1].progress = 1.0
+        del self.library_manager.torrents[2]
+        self.update()
+
+        return_dict = self.webui.doList({'cid': cache_id})
+        self.assertEqual([row[2] for row in return_dict['torrentp']], ["torrent 1"])
+        self.assertEqual(return_dict['torrentm'], [(chr(2) * 20).encode('hex')])
+
+        return_dict = self.webui.doList({'cid': return_dict['torrentc']})
+        self.assertEqual(return_dict['torrentp'], [])
+        self.assertEqual(return_dict['torrentm'], [])
+
+    def test_list_unknown_cache_id(self):
+        cache_id = self.webui.doList({})['torrentc']
+        return_dict = self.webui.doList({'cid': cache_id + 1})
+        self.assertEqual(len(return_dict['torrents']), 3)
+        self.assertNotIn('torrentp', return_dict)
+
+    def test_list_forgotten_removals(self):
+        cache_id = self.webui.doList({})['torrentc']
+
+        max_removed_torrents = webUI.MAX_REMOVED_TORRENTS
+        webUI.MAX_REMOVED_TORRENTS = 1
+        try:
+            del self.library_manager.torrents[2]
+            self.update()
+            self.webui.doList({})
+            del self.library_manager.torrents[1]
+            self.update()
+            return_dict = self.webui.doList({'cid': cache_id})
+        finally:
+            webUI.MAX_REMOVED_TORRENTS = max_removed_torrents
+
+        # the first removal is no longer known, so the client has to replace its whole list
+        self.assertEqual([row[2] for row in return_dict['torrents']], ["torrent 0"])
+        self.assertNotIn('torrentm', return_dict)
+
+    def test_events_changed_fields(self):
+        cache_id = self.webui.doList({})['torrentc']
+
+        self.library_manager.torrents[0].progress = 1.0
+        self.library_manager.torrents.append(FakeTorrent(chr(3) * 20, u"torrent 3"))
+        self.update()
+
+        return_dict = json.loads(self.webui.events(token="token", cid=cache_id))
+        self.assertEqual([row[2] for row in return_dict['torrentp']], ["torrent 3"])
+        infohash, fields = return_dict['torrentd'][0]
+        self.assertEqual(infohash, (chr(0) * 20).encode('hex'))
+        # progress, downloaded and remaining bytes
+        self.assertEqual(sorted(fields), ["18", "4", "5"])
+
+    def test_events_timeout(self):
+        cache_id = self.webui.doList({})['torrentc']
+        return_dict = json.loads(self.webui.events(token="token", cid=cache_id, timeout=0.1))
+        self.assertEqual(return_dict['torrentc'], cache_id)
+        self.assertEqual(return_dict['torrentp'], [])
+        self.assertEqual(return_dict['torrentd'], [])
+
+    def test_refresh_only_for_active_clients(self):
+        # without clients the refresh thread leaves the rows alone, the next request rebuilds them
+        self.assertFalse(self.webui._has_active_clients())
+        self.webui.doList({})
+        self.assertTrue(self.webui._has_active_clients())
+
+        self.webui._last_request -= webUI.CLIENT_IDLE_TIMEOUT
+        self.assertFalse(self.webui._has_active_clients())
+        self.webui._long_poll_clients = 1
+        self.assertTrue(self.webui._has_active_clients())
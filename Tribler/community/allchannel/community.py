@@ -1,15 +1,20 @@
+import logging
+from heapq import heappush, heappushpop, nlargest
 from random import sample
 from time import time
 
 from twisted.internet.task import LoopingCall
 from twisted.python.threadable import isInIOThread
 
+from Tribler.Core.Utilities.recently_requested import RecentlyRequested
 from .conversion import AllChannelConversion
 from Tribler.community.allchannel.message import DelayMessageReqChannelMessage
 from Tribler.community.allchannel.payload import (ChannelCastRequestPayload, ChannelCastPayload, VoteCastPayload,
                                                   ChannelSearchPayload, ChannelSearchResponsePayload)
 from Tribler.community.channel.community import ChannelCommunity
+from Tribler.community.channel.packet_cache import PacketCache
 from Tribler.community.channel.preview import PreviewChannelCommunity
+from Tribler.community.channel.preview_tracker import PreviewTracker, MAX_PREVIEW_COMMUNITIES
 from Tribler.dispersy.authentication import MemberAuthentication
 from Tribler.dispersy.community import Community
 from Tribler.dispersy.conversion import DefaultConversion
@@ -25,6 +30,9 @@ CHANNELCAST_FIRST_MESSAGE = 3.0
 CHANNELCAST_INTERVAL = 15.0
 CHANNELCAST_BLOCK_PERIOD = 10.0 * 60.0  # block for 10 minutes
 UNLOAD_COMMUNITY_INTERVAL = 60.0
+# the number of most recent torrents kept by ChannelCastDBStub, and the number of torrent packets it decodes at once
+RECENT_TORRENTS_SIZE = 50
+TORRENT_INDEX_BATCH_SIZE = 1000
 
 DEBUG = False
 
@@ -116,7 +124,7 @@ class AllChannelCommunity(Community):
         super(AllChannelCommunity, self).__init__(*args, **kwargs)
 
         self._blocklist = {}
-        self._recentlyRequested = []
+        self._recently_requested = None
 
         self.tribler_session = None
         self.auto_join_channel = None
@@ -124,12 +132,15 @@ class AllChannelCommunity(Community):
         self._channelcast_db = None
         self._votecast_db = None
         self._peer_db = None
+        self._packet_cache = None
+        self._previews = None
 
     def initialize(self, tribler_session=None, auto_join_channel=False):
         super(AllChannelCommunity, self).initialize()
 
         self.tribler_session = tribler_session
         self.auto_join_channel = auto_join_channel
+        max_previews = MAX_PREVIEW_COMMUNITIES
 
         if tribler_session is not None:
             from Tribler.Core.simpledefs import NTFY_CHANNELCAST, NTFY_VOTECAST, NTFY_PEERS
@@ -139,11 +150,26 @@ class AllChannelCommunity(Community):
             self._votecast_db = tribler_session.open_dbhandler(NTFY_VOTECAST)
             self._peer_db = tribler_session.open_dbhandler(NTFY_PEERS)
 
+            if tribler_session.lm.rtorrent_handler:
+                self._recently_requested = tribler_session.lm.rtorrent_handler.recently_requested
+
+            max_previews = tribler_session.get_max_preview_communities()
+
         else:
             self._channelcast_db = ChannelCastDBStub(self._dispersy)
             self._votecast_db = VoteCastDBStub(self._dispersy)
             self._peer_db = PeerDBStub(self._dispersy)
 
+        self._packet_cache = PacketCache(self._dispersy.database)
+        if self._recently_requested is None:
+            self._recently_requested = RecentlyRequested()
+
+        # track the preview communities that were loaded before this community
+        self._previews = PreviewTracker(max_size=max_previews)
+        for community in self._dispersy.get_communities():
+            if isinstance(community, PreviewChannelCommunity):
+                self._previews.touch(community)
+
         self.register_task(u"channelcast",
                            LoopingCall(self.create_channelcast)).start(CHANNELCAST_FIRST_MESSAGE, now=True)
 
@@ -481,7 +507,7 @@ class AllChannelCommunity(Community):
         assert len(cid) == 20
 
         try:
-            return self._dispersy.get_community(cid, True)
+            community = self._dispersy.get_community(cid, True)
         except CommunityNotFoundException:
             if self.auto_join_channel:
                 self._logger.info("join channel community %s", cid.encode("HEX"))
@@ -492,14 +518,31 @@ class AllChannelCommunity(Community):
                 return PreviewChannelCommunity.init_community(self._dispersy, self._dispersy.get_member(mid=cid),
                                                               self._my_member, tribler_session=self.tribler_session)
 
+        if isinstance(community, PreviewChannelCommunity):
+            self._previews.touch(community)
+        return community
+
+    def add_preview_community(self, community):
+        """
+        Starts tracking a newly loaded preview community, it is unloaded once it is no longer used.
+        """
+        self._previews.touch(community)
+
+    def get_preview_memory_estimates(self):
+        """
+        Returns the estimated number of bytes used by every loaded preview community, by cid.
+        """
+        return self._previews.get_memory_estimates()
+
     def unload_preview(self):
-        cleanpoint = time() - 300
-        inactive = [community for community in self.dispersy._communities.itervalues() if isinstance(
-            community, PreviewChannelCommunity) and community.init_timestamp < cleanpoint]
-        self._logger.debug("cleaning %d/%d previewchannel communities", len(inactive), len(self.dispersy._communities))
+        nr_expired = self._previews.unload_expired()
+        self._logger.debug("cleaning %d/%d previewchannel communities", nr_expired, nr_expired + len(self._previews))
 
-        for community in inactive:
-            community.unload_community()
+        # estimating the memory use walks every preview community, only do so when it is logged
+        if self._logger.isEnabledFor(logging.DEBUG):
+            estimates = self.get_preview_memory_estimates()
+            self._logger.debug("%d loaded previewchannel communities use an estimated %d bytes, at most %d bytes each",
+                               len(estimates), sum(estimates.itervalues()), max(estimates.values() or [0]))
 
     def _get_channel_id(self, cid):
         assert isinstance(cid, str)
@@ -519,8 +562,8 @@ class AllChannelCommunity(Community):
 
         collect = []
 
-        # filter infohashes using recentlyRequested
-        infohashes = filter(lambda infohash: infohash not in self._recentlyRequested, infohashes)
+        # filter infohashes using recently_requested
+        infohashes = self._recently_requested.filter(infohashes)
 
         # only request updates if nrT < 100 or we have not received an update in the last half hour
         if nrTorrrents < 100 or latestUpdate < (time() - 1800):
@@ -530,8 +573,9 @@ class AllChannelCommunity(Community):
                 if not haveTorrents[i]:
                     collect.append(infohashes[i])
 
-        self._recentlyRequested.extend(collect)
-        self._recentlyRequested = self._recentlyRequested[:100]
+        self._recently_requested.add(collect)
+        self._logger.debug("collecting %d torrents, %d duplicate requests skipped", len(collect),
+                           self._recently_requested.nr_duplicates)
 
         return collect
 
@@ -541,27 +585,11 @@ class AllChannelCommunity(Community):
 
         channel_id = self._get_channel_id(cid)
 
-        packets = []
-        for infohash in infohashes:
-            dispersy_id = self._channelcast_db.getTorrentFromChannelId(
-                channel_id, infohash, ['ChannelTorrents.dispersy_id'])
-
-            if dispersy_id and dispersy_id > 0:
-                try:
-                    # 2. get the message
-                    packets.append(self._get_packet_from_dispersy_id(dispersy_id, "torrent"))
-                except RuntimeError:
-                    pass
-
-        return packets
-
-    def _get_packet_from_dispersy_id(self, dispersy_id, messagename):
-        try:
-            packet, = self._dispersy.database.execute(
-                u"SELECT sync.packet FROM community JOIN sync ON sync.community = community.id WHERE sync.id = ?", (dispersy_id,)).next()
-        except StopIteration:
-            raise RuntimeError("Unknown dispersy_id")
-        return str(packet)
+        dispersy_ids = self._channelcast_db.getDispersyIdsFromChannelId(channel_id, infohashes)
+        # torrents without a message have no dispersy id, or one that is not positive
+        dispersy_ids = [dispersy_ids.get(infohash) for infohash in infohashes]
+        return self._packet_cache.get_packets([dispersy_id for dispersy_id in dispersy_ids
+                                               if dispersy_id is not None and dispersy_id > 0])
 
 
 class ChannelCastDBStub():
@@ -572,11 +600,16 @@ class ChannelCastDBStub():
         self.mychannel = False
         self.latest_result = 0
 
+        # the dispersy ids of the torrents by infohash, created from the sync table on first use and updated by
+        # newTorrent.  the infohashes are also kept in a list to sample from
         self.cachedTorrents = None
+        self.cachedInfohashes = []
+        # a heap of (global_time, infohash) of the RECENT_TORRENTS_SIZE most recent torrents, least recent first
         self.recentTorrents = []
 
     def convert_to_messages(self, results):
-        messages = self._dispersy.convert_packets_to_messages(str(packet) for packet, _ in results)
+        # the packets in the sync table have been verified when they were stored
+        messages = self._dispersy.convert_packets_to_messages((str(packet) for packet, _ in results), verify=False)
         for packet_id, message in zip((packet_id for _, packet_id in results), messages):
             if message:
                 message.packet_id = packet_id
@@ -592,8 +625,8 @@ class ChannelCastDBStub():
     def getRecentAndRandomTorrents(self, NUM_OWN_RECENT_TORRENTS=15, NUM_OWN_RANDOM_TORRENTS=10, NUM_OTHERS_RECENT_TORRENTS=15, NUM_OTHERS_RANDOM_TORRENTS=10, NUM_OTHERS_DOWNLOADED=5):
         torrent_dict = {}
 
-        for _, payload in self.recentTorrents[:max(NUM_OWN_RECENT_TORRENTS, NUM_OTHERS_RECENT_TORRENTS)]:
-            torrent_dict.setdefault(self.channel_id, set()).add(payload.infohash)
+        for _, infohash in nlargest(max(NUM_OWN_RECENT_TORRENTS, NUM_OTHERS_RECENT_TORRENTS), self.recentTorrents):
+            torrent_dict.setdefault(self.channel_id, set()).add(infohash)
 
         if len(self.recentTorrents) >= NUM_OWN_RECENT_TORRENTS:
             for infohash in self.getRandomTorrents(self.channel_id, max(NUM_OWN_RANDOM_TORRENTS, NUM_OTHERS_RANDOM_TORRENTS)):
@@ -602,18 +635,13 @@ class ChannelCastDBStub():
         return torrent_dict
 
     def getRandomTorrents(self, channel_id, limit=15):
-        torrents = self._cachedTorrents.keys()
+        torrents = self._cachedInfohashes
         if len(torrents) > limit:
             return sample(torrents, limit)
-        return torrents
+        return list(torrents)
 
     def newTorrent(self, message):
-        self._cachedTorrents[message.payload.infohash] = message
-
-        self.recentTorrents.append((message.distribution.global_time, message.payload))
-        self.recentTorrents.sort(reverse=True)
-        self.recentTorrents[:50]
-
+        self._addTorrent(message)
         self.latest_result = time()
 
     def setChannelId(self, channel_id, mychannel):
@@ -625,17 +653,15 @@ class ChannelCastDBStub():
             return self.channel_id
 
     def hasTorrents(self, channel_id, infohashes):
-        returnAr = []
-        for infohash in infohashes:
-            if infohash in self._cachedTorrents:
-                returnAr.append(True)
-            else:
-                returnAr.append(False)
-        return returnAr
+        cachedTorrents = self._cachedTorrents
+        return [infohash in cachedTorrents for infohash in infohashes]
 
     def getTorrentFromChannelId(self, channel_id, infohash, keys):
-        if infohash in self._cachedTorrents:
-            return self._cachedTorrents[infohash].packet_id
+        return self._cachedTorrents.get(infohash)
+
+    def getDispersyIdsFromChannelId(self, channel_id, infohashes):
+        cachedTorrents = self._cachedTorrents
+        return dict((infohash, cachedTorrents[infohash]) for infohash in infohashes if infohash in cachedTorrents)
 
     def on_dynamic_settings(self, channel_id):
         pass
@@ -643,22 +669,45 @@ class ChannelCastDBStub():
     @property
     def _cachedTorrents(self):
         if self.cachedTorrents is None:
-            self.cachedTorrents = {}
             self._cacheTorrents()
 
         return self.cachedTorrents
 
+    @property
+    def _cachedInfohashes(self):
+        if self.cachedTorrents is None:
+            self._cacheTorrents()
+
+        return self.cachedInfohashes
+
+    def _addTorrent(self, message):
+        infohash = message.payload.infohash
+        is_new = infohash not in self._cachedTorrents
+        self.cachedTorrents[infohash] = message.packet_id
+        if not is_new:
+            return
+
+        self.cachedInfohashes.append(infohash)
+        recent = (message.distribution.global_time, infohash)
+        if len(self.recentTorrents) < RECENT_TORRENTS_SIZE:
+            heappush(self.recentTorrents, recent)
+        elif recent > self.recentTorrents[0]:
+            heappushpop(self.recentTorrents, recent)
+
     def _cacheTorrents(self):
-        sql = u"SELECT sync.packet, sync.id FROM sync JOIN meta_message ON sync.meta_message = meta_message.id JOIN community ON community.id = sync.community WHERE meta_message.name = 'torrent'"
-        results = list(self._dispersy.database.execute(sql))
-        messages = self.convert_to_messages(results)
+        self.cachedTorrents = {}
 
-        for _, message in messages:
-            self._cachedTorrents[message.payload.infohash] = message
-            self.recentTorrents.append((message.distribution.global_time, message.payload))
+        # decode the packets in batches, only their dispersy ids and infohashes are kept
+        sql = u"SELECT sync.packet, sync.id FROM sync JOIN meta_message ON sync.meta_message = meta_message.id JOIN community ON community.id = sync.community WHERE meta_message.name = 'torrent' AND sync.id > ? ORDER BY sync.id LIMIT ?"
+        last_id = 0
+        while True:
+            results = list(self._dispersy.database.execute(sql, (last_id, TORRENT_INDEX_BATCH_SIZE)))
+            for _, message in self.convert_to_messages(results):
+                self._addTorrent(message)
 
-        self.recentTorrents.sort(reverse=True)
-        self.recentTorrents[:50]
+            if len(results) < TORRENT_INDEX_BATCH_SIZE:
+                break
+            last_id = results[-1][1]
 
 
 class VoteCastDBStub():
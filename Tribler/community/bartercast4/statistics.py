@@ -1,31 +1,71 @@
 from Tribler.dispersy.database import Database
 import random
+from heapq import nlargest
 from operator import itemgetter
-from collections import defaultdict
+from collections import defaultdict, deque
 from os import path
 from threading import RLock
 import logging
 
 
+# merge the pending increments into the statistics once this many of them have been queued
+MAX_PENDING_INCREMENTS = 1000
+
+
 class BarterStatistics(object):
     def __init__(self):
         self.db = None
         self._db_counter = dict()
         self._lock = RLock()
-        self.bartercast = defaultdict()
+        # increments are queued without taking the lock (deque.append is thread safe) and merged into
+        # self._bartercast by the first reader or once MAX_PENDING_INCREMENTS have been queued
+        self._pending = deque()
+        self._dirty = set()
+        self._bartercast = defaultdict()
         self.db_closed = True
         for t in BartercastStatisticTypes.reverse_mapping:
-            self.bartercast[t] = defaultdict()
+            self._bartercast[t] = defaultdict()
         self._logger = logging.getLogger(self.__class__.__name__)
 
+    @property
+    def bartercast(self):
+        self.merge_pending()
+        return self._bartercast
+
+    @bartercast.setter
+    def bartercast(self, statistics):
+        with self._lock:
+            self._pending.clear()
+            self._dirty.clear()
+            self._bartercast = statistics
+
     def dict_inc_bartercast(self, stats_type, peer, value=1):
-        if not hasattr(self, "bartercast"):
-                self._logger.error(u"bartercast doesn't exist in statistics")
+        self._pending.append((stats_type, peer, value))
+
+        # don't wait for a reader that currently holds the lock, it will merge our increment as well
+        if len(self._pending) >= MAX_PENDING_INCREMENTS and self._lock.acquire(False):
+            try:
+                self._merge_pending()
+            finally:
+                self._lock.release()
+
+    def merge_pending(self):
+        """
+        Merges the queued increments into the statistics.
+        """
         with self._lock:
-            if peer not in self.bartercast[stats_type]:
-                self.bartercast[stats_type][peer] = value
-            else:
-                self.bartercast[stats_type][peer] += value
+            self._merge_pending()
+
+    def _merge_pending(self):
+        pending = self._pending
+        bartercast = self._bartercast
+        while pending:
+            stats_type, peer, value = pending.popleft()
+            if stats_type not in bartercast:
+                bartercast[stats_type] = defaultdict()
+            stats = bartercast[stats_type]
+            stats[peer] = stats.get(peer, 0) + value
+            self._dirty.add((stats_type, peer))
 
     def get_top_n_bartercast_statistics(self, key, n):
         """
@@ -35,24 +75,22 @@ class BarterStatistics(object):
         @TODO check if random portion should be larger or smaller
         """
         with self._lock:
-            # shouldn't happen but dont crash the program when bartercast statistics are not available
-            if not hasattr(self, "bartercast"):
-                self._logger.error(u"bartercast doesn't exist in statistics")
-                return []
-            if not key in getattr(self, "bartercast").keys():
+            bartercast = self.bartercast
+            if not key in bartercast:
                 self._logger.error(u"%s doesn't exist in bartercast statistics" % key)
                 return []
-            d = getattr(self, "bartercast")[key]
+            d = bartercast[key]
             if d is not None:
                 random_n = n / 2
                 fixed_n = n - random_n
-                sorted_list = sorted(d.items(), key=itemgetter(1), reverse=True)
-                top_stats = sorted_list[0:fixed_n]
+                top_stats = nlargest(fixed_n, d.iteritems(), key=itemgetter(1))
                 self._logger.debug("len d: %d, fixed_n: %d" % (len(d), fixed_n))
                 if len(d) <= fixed_n:
                     random_stats = []
                 else:
-                    random_stats = random.sample(sorted_list[fixed_n:len(d)], min(random_n, len(d) - fixed_n))
+                    top_peers = set(peer for peer, _ in top_stats)
+                    other_stats = [item for item in d.iteritems() if item[0] not in top_peers]
+                    random_stats = random.sample(other_stats, min(random_n, len(other_stats)))
                 return top_stats + random_stats
             return None
 
@@ -79,10 +117,20 @@ class BarterStatistics(object):
 
         self._init_database(dispersy)
         self._logger.debug("persisting bc data")
-        for t in self.bartercast:
-            for peer in self.bartercast[t]:
-                self.db.execute(u"INSERT OR REPLACE INTO statistic (type, peer, value) values (?, ?, ?)", (t, unicode(peer), self.bartercast[t][peer]))
-        self._logger.debug("data persisted")
+        with self._lock:
+            self._merge_pending()
+            dirty, self._dirty = self._dirty, set()
+            rows = [(t, unicode(peer), self._bartercast[t][peer]) for t, peer in dirty]
+
+        # only the peers that changed since the last call are written, in a single transaction
+        try:
+            self.db.executemany(u"INSERT OR REPLACE INTO statistic (type, peer, value) values (?, ?, ?)", rows)
+        except:
+            # keep the peers dirty, the next call writes their (by then possibly newer) values
+            with self._lock:
+                self._dirty.update(dirty)
+            raise
+        self._logger.debug("%d rows persisted", len(rows))
 
     def load_statistics(self, dispersy):
         """
@@ -776,6 +776,8 @@ class ChannelCommunity(Community):
 
                 elif message_name == u"playlist":
                     playlist_id = self._get_playlist_id_from_message(modifying_dispersy_id)
+                    if not playlist_id:
+                        self._logger.info("CANNOT FIND playlist_id %s", modifying_dispersy_id)
                     playlistDict[modifying_dispersy_id] = playlist_id
 
                 authentication_member = message.authentication.member
@@ -811,22 +813,21 @@ class ChannelCommunity(Community):
                     channeltorrent_id = channeltorrentDict[modifying_dispersy_id]
 
                     if channeltorrent_id:
-                        latest = self._get_latest_modification_from_torrent_id(channeltorrent_id, modification_type)
-                        if not latest or latest.packet_id == dispersy_id:
+                        if self._update_latest_modification(channeltorrent_id, None, message):
                             self._channelcast_db.on_torrent_modification_from_dispersy(
                                 channeltorrent_id, modification_type, modification_value)
 
                 elif message_name == u"playlist":
                     playlist_id = playlistDict[modifying_dispersy_id]
 
-                    latest = self._get_latest_modification_from_playlist_id(playlist_id, modification_type)
-                    if not latest or latest.packet_id == dispersy_id:
-                        self._channelcast_db.on_playlist_modification_from_dispersy(
-                            playlist_id, modification_type, modification_value)
+                    # an unknown playlist would otherwise be taken for a modification of the channel itself
+                    if playlist_id:
+                        if self._update_latest_modification(None, playlist_id, message):
+                            self._channelcast_db.on_playlist_modification_from_dispersy(
+                                playlist_id, modification_type, modification_value)
 
                 elif message_name == u"channel":
-                    latest = self._get_latest_modification_from_channel_id(modification_type)
-                    if not latest or latest.packet_id == dispersy_id:
+                    if self._update_latest_modification(None, None, message):
                         self._channelcast_db.on_channel_modification_from_dispersy(
                             self._channel_id, modification_type, modification_value)
 
@@ -1177,47 +1178,102 @@ class ChannelCommunity(Community):
     def _get_latest_modification_from_channel_id(self, type_name):
         assert isinstance(type_name, basestring), "type_name is not a basestring: %s" % repr(type_name)
 
-        # 1. get the dispersy identifier from the channel_id
-        dispersy_ids = self._channelcast_db._db.fetchall(
-            u"SELECT dispersy_id, prev_global_time " + \
-            u"FROM ChannelMetaData WHERE type = ? " + \
-            u"AND channel_id = ? " + \
-            u"AND id NOT IN (SELECT metadata_id FROM MetaDataTorrent) " + \
-            u"AND id NOT IN (SELECT metadata_id FROM MetaDataPlaylist) " + \
-            u"AND dispersy_id not in (SELECT cause FROM Moderations " + \
-            u"WHERE channel_id = ?) ORDER BY prev_global_time DESC",
-            (type_name, self._channel_id, self._channel_id))
-        return self._determine_latest_modification(dispersy_ids)
+        def get_dispersy_ids():
+            # 1. get the dispersy identifier from the channel_id
+            return self._channelcast_db._db.fetchall(
+                u"SELECT dispersy_id, prev_global_time " + \
+                u"FROM ChannelMetaData WHERE type = ? " + \
+                u"AND channel_id = ? " + \
+                u"AND id NOT IN (SELECT metadata_id FROM MetaDataTorrent) " + \
+                u"AND id NOT IN (SELECT metadata_id FROM MetaDataPlaylist) " + \
+                u"AND dispersy_id not in (SELECT cause FROM Moderations " + \
+                u"WHERE channel_id = ?) ORDER BY prev_global_time DESC",
+                (type_name, self._channel_id, self._channel_id))
+        return self._get_latest_modification(None, None, type_name, get_dispersy_ids)
 
     def _get_latest_modification_from_torrent_id(self, channeltorrent_id, type_name):
         assert isinstance(channeltorrent_id, (int, long)), "channeltorrent_id type is '%s'" % type(channeltorrent_id)
         assert isinstance(type_name, basestring), "type_name is not a basestring: %s" % repr(type_name)
 
-        # 1. get the dispersy identifier from the channel_id
-        dispersy_ids = self._channelcast_db._db.fetchall(u"SELECT dispersy_id, prev_global_time " + \
-                                                         u"FROM ChannelMetaData, MetaDataTorrent " + \
-                                                         u"WHERE ChannelMetaData.id = MetaDataTorrent.metadata_id " + \
-                                                         u"AND type = ? AND channeltorrent_id = ? " + \
-                                                         u"AND dispersy_id not in " + \
-                                                         u"(SELECT cause FROM Moderations WHERE channel_id = ?) " + \
-                                                         u"ORDER BY prev_global_time DESC",
-            (type_name, channeltorrent_id, self._channel_id))
-        return self._determine_latest_modification(dispersy_ids)
+        def get_dispersy_ids():
+            # 1. get the dispersy identifier from the channel_id
+            return self._channelcast_db._db.fetchall(u"SELECT dispersy_id, prev_global_time " + \
+                                                     u"FROM ChannelMetaData, MetaDataTorrent " + \
+                                                     u"WHERE ChannelMetaData.id = MetaDataTorrent.metadata_id " + \
+                                                     u"AND type = ? AND channeltorrent_id = ? " + \
+                                                     u"AND dispersy_id not in " + \
+                                                     u"(SELECT cause FROM Moderations WHERE channel_id = ?) " + \
+                                                     u"ORDER BY prev_global_time DESC",
+                (type_name, channeltorrent_id, self._channel_id))
+        return self._get_latest_modification(channeltorrent_id, None, type_name, get_dispersy_ids)
 
     def _get_latest_modification_from_playlist_id(self, playlist_id, type_name):
         assert isinstance(playlist_id, (int, long)), "playlist_id type is '%s'" % type(playlist_id)
         assert isinstance(type_name, basestring), "type_name is not a basestring: %s" % repr(type_name)
 
-        # 1. get the dispersy identifier from the channel_id
-        dispersy_ids = self._channelcast_db._db.fetchall(u"SELECT dispersy_id, prev_global_time " + \
-                                                         u"FROM ChannelMetaData, MetaDataPlaylist " + \
-                                                         u"WHERE ChannelMetaData.id = MetaDataPlaylist.metadata_id " + \
-                                                         u"AND type = ? AND playlist_id = ? " + \
-                                                         u"AND dispersy_id not in " + \
-                                                         u"(SELECT cause FROM Moderations WHERE channel_id = ?) " + \
-                                                         u"ORDER BY prev_global_time DESC",
-            (type_name, playlist_id, self._channel_id))
-        return self._determine_latest_modification(dispersy_ids)
+        def get_dispersy_ids():
+            # 1. get the dispersy identifier from the channel_id
+            return self._channelcast_db._db.fetchall(u"SELECT dispersy_id, prev_global_time " + \
+                                                     u"FROM ChannelMetaData, MetaDataPlaylist " + \
+                                                     u"WHERE ChannelMetaData.id = MetaDataPlaylist.metadata_id " + \
+                                                     u"AND type = ? AND playlist_id = ? " + \
+                                                     u"AND dispersy_id not in " + \
+                                                     u"(SELECT cause FROM Moderations WHERE channel_id = ?) " + \
+                                                     u"ORDER BY prev_global_time DESC",
+                (type_name, playlist_id, self._channel_id))
+        return self._get_latest_modification(None, playlist_id, type_name, get_dispersy_ids)
+
+    def _get_latest_modification(self, channeltorrent_id, playlist_id, type_name, get_dispersy_ids):
+        """
+        Returns the latest modification of type TYPE_NAME of this channel, or of one of its torrents or playlists.
+
+        The latest modification is looked up in the LatestMetaData table, and only when it is not there it is
+        determined from all modifications returned by GET_DISPERSY_IDS and stored.
+        """
+        latest = self._channelcast_db.get_latest_metadata(self._channel_id, channeltorrent_id, playlist_id, type_name)
+        if latest:
+            try:
+                packet = self._dispersy.load_message_by_packetid(self, latest[0])
+                if packet:
+                    return packet.load_message()
+            except RuntimeError:
+                pass
+
+        message = self._determine_latest_modification(get_dispersy_ids())
+        if message:
+            self._channelcast_db.set_latest_metadata(self._channel_id, channeltorrent_id, playlist_id, type_name,
+                                                     message.packet_id,
+                                                     message.payload.prev_modification_global_time,
+                                                     message.distribution.global_time)
+        return message
+
+    def _update_latest_modification(self, channeltorrent_id, playlist_id, message):
+        """
+        Stores MESSAGE as the latest modification of its type when it is newer than the stored one, and returns
+        whether MESSAGE is the latest modification.
+        """
+        modification_type = unicode(message.payload.modification_type)
+        latest = self._channelcast_db.get_latest_metadata(self._channel_id, channeltorrent_id, playlist_id,
+                                                          modification_type)
+        if not latest:
+            if channeltorrent_id:
+                latest = self._get_latest_modification_from_torrent_id(channeltorrent_id, modification_type)
+            elif playlist_id:
+                latest = self._get_latest_modification_from_playlist_id(playlist_id, modification_type)
+            else:
+                latest = self._get_latest_modification_from_channel_id(modification_type)
+            return not latest or latest.packet_id == message.packet_id
+
+        # _determine_latest_modification picks the highest prev_global_time, and then the highest global_time
+        dispersy_id, prev_global_time, global_time = latest
+        if (message.payload.prev_modification_global_time, message.distribution.global_time) > \
+                (prev_global_time, global_time):
+            self._channelcast_db.set_latest_metadata(self._channel_id, channeltorrent_id, playlist_id,
+                                                     modification_type, message.packet_id,
+                                                     message.payload.prev_modification_global_time,
+                                                     message.distribution.global_time)
+            return True
+        return dispersy_id == message.packet_id
 
     @warnIfNotDispersyThread
     def _determine_latest_modification(self, list):
@@ -1,14 +1,131 @@
 import zlib
+from itertools import chain
 from random import sample
 from struct import pack, unpack_from
 
 from Tribler.Core.Utilities.encoding import encode, decode
+from Tribler.Core.Utilities.lru_cache import LRUCache
 from Tribler.dispersy.conversion import BinaryConversion
 from Tribler.dispersy.message import DropPacket, Packet, DelayPacketByMissingMessage, DelayPacketByMissingMember
 
 
 DEBUG = False
 
+# the number of packed torrent messages a TorrentPacker keeps
+PACKED_TORRENTS_CACHE_SIZE = 1000
+# torrents in the wild have been seen to have 1000+ trackers, only the first ones are sent when a message is too big
+MAX_PACKED_TRACKERS = 10
+ENCODED_FILES_CHUNK_SIZE = 256
+
+
+class TorrentPacker(object):
+    """
+    Packs the payload of torrent messages into at most max_len compressed bytes, dropping trackers and files when a
+    torrent does not fit. The packed messages are cached per infohash, as the same torrent is packed again every time
+    it is synced to another peer.
+    """
+
+    def __init__(self, cache_size=PACKED_TORRENTS_CACHE_SIZE):
+        super(TorrentPacker, self).__init__()
+        self._packed = LRUCache(cache_size)
+
+    def pack(self, payload, max_len):
+        key = (payload.infohash, payload.timestamp, payload.name, max_len)
+        packed = self._packed.get(key)
+        if packed is None:
+            packed = self._pack(payload, max_len)
+            self._packed.put(key, packed)
+        return packed
+
+    def _pack(self, payload, max_len):
+        """
+        Returns the compressed encoding of (infohash and timestamp, name, files, trackers), byte for byte what encode
+        returns for that tuple. The parts of the tuple are encoded once and concatenated for every try, and a try
+        stops compressing as soon as the message is too big.
+        """
+        head = "a4t" + _encode_item(pack('!20sQ', payload.infohash, payload.timestamp)) + _encode_item(payload.name)
+        files = payload.files
+        trackers = payload.trackers
+
+        # the files are encoded in chunks when they are compressed, so a torrent with many files that does not fit
+        # is only encoded up to the point where that is known
+        encoded_chunks = []
+
+        def encode_files():
+            yield "%dt" % len(files)
+            for index, start in enumerate(xrange(0, len(files), ENCODED_FILES_CHUNK_SIZE)):
+                if index == len(encoded_chunks):
+                    chunk = files[start:start + ENCODED_FILES_CHUNK_SIZE]
+                    # strip the version and the number of items from the encoded chunk
+                    encoded_chunks.append(encode(chunk)[len(str(len(chunk))) + 2:])
+                yield encoded_chunks[index]
+
+        packed = _compress(chain((head,), encode_files(), (_encode_item(trackers),)), max_len)
+        if packed is None and len(trackers) > MAX_PACKED_TRACKERS:
+            trackers = trackers[:MAX_PACKED_TRACKERS]
+            packed = _compress(chain((head,), encode_files(), (_encode_item(trackers),)), max_len)
+        if packed is not None:
+            return packed
+
+        # send as many files of a random sample as fit, assuming every file takes at least one compressed byte. The
+        # number of files doubles until they do not fit, after which it is found with a binary search, so only
+        # about twice the files that fit are encoded and every try compresses at most that many files.
+        files = sample(files, min(len(files), max_len))
+        tail = _encode_item(trackers)
+        encoded_files = []
+
+        def compress_files(nr_files):
+            encoded_files.extend(_encode_item(file_) for file_ in files[len(encoded_files):nr_files])
+            return _compress((head, "%dt" % nr_files, "".join(encoded_files[:nr_files]), tail), max_len)
+
+        packed = compress_files(0)
+        if packed is None:
+            # the torrent does not fit even without files
+            return _compress((head, "0t", tail))
+
+        fits, too_many = 0, 1
+        while too_many <= len(files):
+            candidate = compress_files(too_many)
+            if candidate is None:
+                break
+            fits, packed = too_many, candidate
+            too_many *= 2
+        too_many = min(too_many, len(files) + 1)
+
+        while too_many - fits > 1:
+            middle = (fits + too_many) // 2
+            candidate = compress_files(middle)
+            if candidate is None:
+                too_many = middle
+            else:
+                fits, packed = middle, candidate
+        return packed
+
+
+def _encode_item(value):
+    """
+    Returns the encoding of value as an item of a container, i.e. without the version.
+    """
+    return encode(value)[1:]
+
+
+def _compress(parts, budget=None):
+    """
+    Returns the compressed concatenation of parts, or None as soon as it is known to be larger than budget bytes.
+    """
+    compressor = zlib.compressobj()
+    compressed = []
+    compressed_len = 0
+    for part in parts:
+        for offset in xrange(0, len(part), 65536):
+            compressed.append(compressor.compress(part[offset:offset + 65536]))
+            compressed_len += len(compressed[-1])
+            if budget is not None and compressed_len > budget:
+                return None
+    compressed.append(compressor.flush())
+    compressed = "".join(compressed)
+    return None if budget is not None and len(compressed) > budget else compressed
+
 
 class ChannelConversion(BinaryConversion):
 
@@ -46,6 +163,8 @@ class ChannelConversion(BinaryConversion):
                                  self._encode_mark_torrent,
                                  self._decode_mark_torrent)
 
+        self._torrent_packer = TorrentPacker()
+
     def _encode_channel(self, message):
         return encode((message.payload.name, message.payload.description)),
 
@@ -75,29 +194,7 @@ class ChannelConversion(BinaryConversion):
 
     def _encode_torrent(self, message):
         max_len = self._community.dispersy_sync_bloom_filter_bits / 8
-
-        files = message.payload.files
-        trackers = message.payload.trackers
-
-        def create_msg():
-            normal_msg = (pack('!20sQ', message.payload.infohash, message.payload.timestamp), message.payload.name,
-                          tuple(files), tuple(trackers))
-            normal_msg = encode(normal_msg)
-            return zlib.compress(normal_msg)
-
-        compressed_msg = create_msg()
-        while len(compressed_msg) > max_len:
-            if len(trackers) > 10:
-                # only use first 10 trackers, .torrents in the wild have been seen to have 1000+ trackers...
-                trackers = trackers[:10]
-            else:
-                # reduce files by the amount we are currently to big
-                reduce_by = max_len / (len(compressed_msg) * 1.0)
-                nr_files_to_include = int(len(files) * reduce_by)
-                files = sample(files, nr_files_to_include)
-
-            compressed_msg = create_msg()
-        return compressed_msg,
+        return self._torrent_packer.pack(message.payload, max_len),
 
     def _decode_torrent(self, placeholder, offset, data):
         uncompressed_data = zlib.decompress(data[offset:])
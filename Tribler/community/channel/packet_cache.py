@@ -0,0 +1,51 @@
+from Tribler.Core.Utilities.lru_cache import LRUCache
+
+# the number of packets kept by a PacketCache
+PACKET_CACHE_SIZE = 500
+
+
+class PacketCache(object):
+    """
+    Loads packets from the dispersy sync table by dispersy id, all missing packets at once, and keeps the most recently
+    served ones. Peers collecting torrents request the same popular torrents over and over. Cached packets are only
+    served while their ids are still in the sync table, which is checked without loading the packets.
+    """
+
+    def __init__(self, database, cache_size=PACKET_CACHE_SIZE):
+        super(PacketCache, self).__init__()
+        self._database = database
+        self._packets = LRUCache(cache_size)
+
+    def get_packets(self, dispersy_ids):
+        """
+        Returns the packets with the given dispersy ids in the same order, leaving out the ids that are not in the sync
+        table.
+        """
+        unique_ids = set(dispersy_ids)
+        cached = [dispersy_id for dispersy_id in unique_ids if dispersy_id in self._packets]
+        if cached:
+            # a packet that was removed from the sync table since it was cached, e.g. because it was undone, is dropped
+            parameters = u",".join(u"?" * len(cached))
+            existing = set(dispersy_id for dispersy_id, in self._database.execute(
+                u"SELECT id FROM sync WHERE id IN (%s)" % parameters, tuple(cached)))
+            for dispersy_id in cached:
+                if dispersy_id not in existing:
+                    self._packets.pop(dispersy_id)
+
+        to_select = [dispersy_id for dispersy_id in unique_ids if dispersy_id not in self._packets]
+        loaded = {}
+        if to_select:
+            parameters = u",".join(u"?" * len(to_select))
+            loaded = dict((dispersy_id, str(packet)) for dispersy_id, packet in self._database.execute(
+                u"SELECT sync.id, sync.packet FROM community JOIN sync ON sync.community = community.id "
+                u"WHERE sync.id IN (%s)" % parameters, tuple(to_select)))
+
+        packets = []
+        for dispersy_id in dispersy_ids:
+            packet = self._packets.get(dispersy_id) or loaded.get(dispersy_id)
+            if packet is None:
+                continue
+
+            self._packets.put(dispersy_id, packet)
+            packets.append(packet)
+        return packets
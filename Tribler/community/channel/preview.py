@@ -13,6 +13,14 @@ class PreviewChannelCommunity(ChannelCommunity):
         super(PreviewChannelCommunity, self).__init__(*args, **kargs)
         self.init_timestamp = time()
 
+    def initialize(self, tribler_session=None):
+        super(PreviewChannelCommunity, self).initialize(tribler_session)
+
+        from Tribler.community.allchannel.community import AllChannelCommunity
+        for community in self.dispersy.get_communities():
+            if isinstance(community, AllChannelCommunity):
+                community.add_preview_community(self)
+
     @property
     def dispersy_enable_bloom_filter_sync(self):
         return False
@@ -0,0 +1,73 @@
+import sys
+from collections import deque
+
+from Tribler.Core.Utilities.lru_cache import LRUCache
+
+# the number of preview communities that are loaded at once, and how long an unused preview community stays loaded
+MAX_PREVIEW_COMMUNITIES = 50
+PREVIEW_COMMUNITY_TTL = 5 * 60
+
+
+def estimate_memory_usage(community):
+    """
+    Returns a rough estimate of the number of bytes used by a community: the community itself, plus the containers it
+    holds and their direct contents. Objects shared with other communities, like the dispersy instance, are left out.
+    """
+    size = sys.getsizeof(community) + sys.getsizeof(community.__dict__)
+    for value in community.__dict__.itervalues():
+        if isinstance(value, dict):
+            size += sys.getsizeof(value) + sum(sys.getsizeof(key) + sys.getsizeof(item)
+                                               for key, item in value.iteritems())
+        elif isinstance(value, (list, tuple, set, frozenset, deque)):
+            size += sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class PreviewTracker(object):
+    """
+    Keeps track of the loaded preview communities, least recently used first. A preview community is unloaded when it
+    was not used for ttl seconds, or when more than max_size other preview communities were used after it.
+    """
+
+    def __init__(self, max_size=MAX_PREVIEW_COMMUNITIES, ttl=PREVIEW_COMMUNITY_TTL):
+        super(PreviewTracker, self).__init__()
+        # the community of every cid, least recently used first
+        self._previews = LRUCache(max_size, ttl)
+
+    def __len__(self):
+        return len(self._previews)
+
+    def __contains__(self, community):
+        return self._previews.peek(community.cid) is community
+
+    def touch(self, community):
+        """
+        Marks a preview community as used now, unloading the least recently used ones when there are too many.
+        """
+        for _, dropped in self._previews.put(community.cid, community):
+            self._unload(dropped)
+
+    def unload_expired(self):
+        """
+        Unloads the preview communities that were not used for ttl seconds and returns how many expired.
+        """
+        expired = self._previews.expire()
+        for _, community in expired:
+            self._unload(community)
+        return len(expired)
+
+    def get_memory_estimates(self):
+        """
+        Returns the estimated number of bytes used by every loaded preview community, by cid.
+        """
+        return dict((cid, estimate_memory_usage(community))
+                    for cid, community in self._previews.items() if self._is_loaded(community))
+
+    @staticmethod
+    def _is_loaded(community):
+        # a preview community that was reclassified or unloaded elsewhere is no longer the one dispersy knows
+        return community.dispersy._communities.get(community.cid) is community
+
+    def _unload(self, community):
+        if self._is_loaded(community):
+            community.unload_community()
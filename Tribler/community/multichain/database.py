@@ -11,7 +11,12 @@ DATABASE_DIRECTORY = path.join(u"sqlite")
 """ Path to the database location + dispersy._workingdirectory"""
 DATABASE_PATH = path.join(DATABASE_DIRECTORY, u"multichain.db")
 """ Version to keep track if the db schema needs to be updated."""
-LATEST_DB_VERSION = 1
+LATEST_DB_VERSION = 2
+""" Indexes used to find the blocks of a member without scanning the whole chain."""
+index_schema = u"""
+CREATE INDEX IF NOT EXISTS multi_chain_requester_idx ON multi_chain(mid_requester, sequence_number_requester);
+CREATE INDEX IF NOT EXISTS multi_chain_responder_idx ON multi_chain(mid_responder, sequence_number_responder);
+"""
 """ Schema for the MultiChain DB."""
 schema = u"""
 CREATE TABLE IF NOT EXISTS multi_chain(
@@ -32,9 +37,14 @@ CREATE TABLE IF NOT EXISTS multi_chain(
  signature_responder		TEXT NOT NULL
 );
 
+""" + index_schema + u"""
 CREATE TABLE option(key TEXT PRIMARY KEY, value BLOB);
 INSERT INTO option(key, value) VALUES('database_version', '""" + str(LATEST_DB_VERSION) + u"""');
 """
+""" Upgrade script from version 1 to version 2."""
+upgrade_to_version_2_script = index_schema + u"""
+UPDATE option SET value = '2' WHERE key = 'database_version';
+"""
 
 
 class MultiChainDB(Database):
@@ -54,6 +64,8 @@ class MultiChainDB(Database):
         """
         super(MultiChainDB, self).__init__(path.join(working_directory, DATABASE_PATH))
         self._dispersy = dispersy
+        """ Cache of the latest block of each member: mid -> (sequence_number, block_hash, total_up, total_down)."""
+        self._latest_blocks = {}
         self.open()
 
     def add_block(self, block):
@@ -77,21 +89,53 @@ class MultiChainDB(Database):
             u"VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
             data)
 
+        self._update_latest_block(block.mid_requester, block.sequence_number_requester, block.id,
+                                  block.total_up_requester, block.total_down_requester)
+        self._update_latest_block(block.mid_responder, block.sequence_number_responder, block.id,
+                                  block.total_up_responder, block.total_down_responder)
+
+    def _update_latest_block(self, mid, sequence_number, block_id, total_up, total_down):
+        """
+        Update the cached latest block of a member after a block has been added.
+        Members that are not cached are left alone, they will be looked up on first use.
+        """
+        latest_block = self._latest_blocks.get(mid)
+        if latest_block and sequence_number > latest_block[0]:
+            self._latest_blocks[mid] = (sequence_number, block_id, total_up, total_down)
+
+    def _get_latest_block(self, mid):
+        """
+        Get the latest block of a member, either from the cache or from the database.
+        :param mid: The mid of the member.
+        :return: (sequence_number, block_hash, total_up, total_down) or None if no block is known.
+        """
+        if mid in self._latest_blocks:
+            return self._latest_blocks[mid]
+
+        db_mid = buffer(mid)
+        requester_query = u"SELECT sequence_number_requester, block_hash, total_up_requester, total_down_requester " \
+                          u"FROM multi_chain WHERE mid_requester = ? ORDER BY sequence_number_requester DESC LIMIT 1"
+        responder_query = u"SELECT sequence_number_responder, block_hash, total_up_responder, total_down_responder " \
+                          u"FROM multi_chain WHERE mid_responder = ? ORDER BY sequence_number_responder DESC LIMIT 1"
+        candidates = [self.execute(requester_query, (db_mid,)).fetchone(),
+                      self.execute(responder_query, (db_mid,)).fetchone()]
+        candidates = [candidate for candidate in candidates if candidate is not None]
+        if not candidates:
+            return None
+
+        sequence_number, block_hash, total_up, total_down = max(candidates, key=lambda candidate: candidate[0])
+        latest_block = (sequence_number, str(block_hash), total_up, total_down)
+        self._latest_blocks[mid] = latest_block
+        return latest_block
+
     def get_previous_id(self, mid):
         """
         Get the id of the latest block in the chain for a specific public key.
         :param mid: The mid for which the latest hash has to be found.
         :return: block_id
         """
-        mid = buffer(mid)
-        db_query = u"SELECT block_hash, MAX(sequence_number) FROM " \
-                   u"(SELECT block_hash, sequence_number_requester AS sequence_number FROM multi_chain " \
-                   u"WHERE mid_requester == ? UNION SELECT block_hash, sequence_number_responder " \
-                   u"FROM multi_chain WHERE mid_responder = ?)"
-
-        db_result = self.execute(db_query, (mid, mid)).fetchone()[0]
-
-        return str(db_result) if db_result else None
+        latest_block = self._get_latest_block(mid)
+        return latest_block[1] if latest_block else None
 
     def get_by_block_id(self, block_id):
         """
@@ -118,12 +162,15 @@ class MultiChainDB(Database):
                    u"total_up_requester, total_down_requester, sequence_number_requester,  previous_hash_requester, " \
                    u"total_up_responder, total_down_responder, sequence_number_responder,  previous_hash_responder," \
                    u"mid_requester, signature_requester, mid_responder, signature_responder " \
-                   u"FROM (" \
-                   u"SELECT *, sequence_number_requester AS sequence_number, mid_requester AS mid FROM `multi_chain` " \
-                   u"UNION " \
-                   u"SELECT *, sequence_number_responder AS sequence_number, mid_responder AS mid FROM `multi_chain`) " \
-                   u"WHERE sequence_number = ? AND mid = ? LIMIT 1"
-        db_result = self.execute(db_query, (sequence_number, buffer(mid))).fetchone()
+                   u"FROM `multi_chain` WHERE mid_requester = ? AND sequence_number_requester = ? " \
+                   u"UNION ALL " \
+                   u"SELECT up, down, " \
+                   u"total_up_requester, total_down_requester, sequence_number_requester,  previous_hash_requester, " \
+                   u"total_up_responder, total_down_responder, sequence_number_responder,  previous_hash_responder," \
+                   u"mid_requester, signature_requester, mid_responder, signature_responder " \
+                   u"FROM `multi_chain` WHERE mid_responder = ? AND sequence_number_responder = ? LIMIT 1"
+        mid = buffer(mid)
+        db_result = self.execute(db_query, (mid, sequence_number, mid, sequence_number)).fetchone()
         # Create a DB Block or return None
         return self._create_database_block(db_result)
 
@@ -166,14 +213,8 @@ class MultiChainDB(Database):
         :param mid: Corresponding public key
         :return: sequence number (integer) or -1 if no block is known
         """
-        mid = buffer(mid)
-        db_query = u"SELECT MAX(sequence_number) FROM (" \
-                   u"SELECT sequence_number_requester AS sequence_number " \
-                   u"FROM multi_chain WHERE mid_requester == ? UNION " \
-                   u"SELECT sequence_number_responder AS sequence_number " \
-                   u"FROM multi_chain WHERE mid_responder = ? )"
-        db_result = self.execute(db_query, (mid, mid)).fetchone()[0]
-        return db_result if db_result is not None else -1
+        latest_block = self._get_latest_block(mid)
+        return latest_block[0] if latest_block else -1
 
     def get_total(self, mid):
         """
@@ -182,17 +223,8 @@ class MultiChainDB(Database):
         :param mid: Corresponding mid
         :return: (total_up (int), total_down (int)) or (-1, -1) if no block is known.
         """
-        mid = buffer(mid)
-        db_query = u"SELECT total_up, total_down, MAX(sequence_number) FROM (" \
-                   u"SELECT total_up_requester AS total_up, total_down_requester AS total_down, " \
-                   u"sequence_number_requester AS sequence_number FROM multi_chain " \
-                   u"WHERE mid_requester == ? UNION " \
-                   u"SELECT total_up_responder AS total_up, total_down_responder AS total_down, " \
-                   u"sequence_number_responder AS sequence_number FROM multi_chain WHERE mid_responder = ? )" \
-                   u"LIMIT 1"
-        db_result = self.execute(db_query, (mid, mid)).fetchone()
-        return (db_result[0], db_result[1]) if db_result[0] is not None and db_result[1] is not None \
-            else (-1, -1)
+        latest_block = self._get_latest_block(mid)
+        return (latest_block[2], latest_block[3]) if latest_block else (-1, -1)
 
     def open(self, initial_statements=True, prepare_visioning=True):
         return super(MultiChainDB, self).open(initial_statements, prepare_visioning)
@@ -215,6 +247,12 @@ class MultiChainDB(Database):
             self.executescript(schema)
             self.commit()
 
+        else:
+            # upgrade to version 2: add the member indexes
+            if database_version < 2:
+                self.executescript(upgrade_to_version_2_script)
+                self.commit()
+
         return LATEST_DB_VERSION
 
 
@@ -2,12 +2,14 @@
 from random import shuffle
 from time import time
 from binascii import hexlify
+from math import exp
 from traceback import print_exc
 
 from twisted.internet.task import LoopingCall
 
-from Tribler.Core.CacheDB.sqlitecachedb import bin2str
 from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.Utilities.recently_requested import RecentlyRequested
+from Tribler.community.channel.packet_cache import PacketCache
 from Tribler.community.channel.payload import TorrentPayload
 from Tribler.community.channel.preview import PreviewChannelCommunity
 from Tribler.community.search.conversion import SearchConversion
@@ -26,12 +28,19 @@ from Tribler.dispersy.exception import CommunityNotFoundException
 from Tribler.dispersy.message import Message
 from Tribler.dispersy.requestcache import RandomNumberCache, IntroductionRequestCache
 from Tribler.dispersy.resolution import PublicResolution
+from Tribler.dispersy.util import call_on_reactor_thread
 
 
 DEBUG = False
 SWIFT_INFOHASHES = 0
 CREATE_TORRENT_COLLECT_INTERVAL = 5
 
+# the taste bloom filter is created for TASTE_BLOOM_FILTER_ERROR_RATE, new preferences are added to it until its
+# estimated false positive rate passes TASTE_BLOOM_FILTER_MAX_ERROR_RATE
+TASTE_BLOOM_FILTER_ERROR_RATE = 0.005
+TASTE_BLOOM_FILTER_MAX_ERROR_RATE = 0.01
+MAX_TASTE_PREFERENCES = 500
+
 
 class SearchCommunity(Community):
 
@@ -66,11 +75,20 @@ class SearchCommunity(Community):
         self._torrent_db = None
         self._mypref_db = None
         self._notifier = None
+        self._packet_cache = None
 
         self._rtorrent_handler = None
+        self._recently_requested = None
+
+        # my most recent preferences, newest first
+        self._my_preferences = None
+        self._my_preferences_set = None
 
         self.taste_bloom_filter = None
-        self.taste_bloom_filter_key = None
+        # the number of keys added to taste_bloom_filter
+        self.taste_bloom_filter_keys = 0
+        # increased whenever taste_bloom_filter changes, allows the conversion to cache its encoding
+        self.taste_bloom_filter_version = 0
 
         self.torrent_cache = None
 
@@ -84,26 +102,41 @@ class SearchCommunity(Community):
         # self.taste_buddies.append([1, time(), Candidate(("127.0.0.1", 1234), False))
 
         if self.integrate_with_tribler:
-            from Tribler.Core.simpledefs import NTFY_CHANNELCAST, NTFY_TORRENTS, NTFY_MYPREFERENCES
+            from Tribler.Core.simpledefs import (NTFY_CHANNELCAST, NTFY_TORRENTS, NTFY_MYPREFERENCES, NTFY_INSERT,
+                                                 NTFY_DELETE)
 
             # tribler channelcast database
             self._channelcast_db = tribler_session.open_dbhandler(NTFY_CHANNELCAST)
             self._torrent_db = tribler_session.open_dbhandler(NTFY_TORRENTS)
             self._mypref_db = tribler_session.open_dbhandler(NTFY_MYPREFERENCES)
             self._notifier = tribler_session.notifier
+            self._notifier.add_observer(self.on_my_preference_added, NTFY_MYPREFERENCES, [NTFY_INSERT])
+            self._notifier.add_observer(self.on_my_preference_deleted, NTFY_MYPREFERENCES, [NTFY_DELETE])
 
             # torrent collecting
             self._rtorrent_handler = tribler_session.lm.rtorrent_handler
+            if self._rtorrent_handler:
+                self._recently_requested = self._rtorrent_handler.recently_requested
         else:
             self._channelcast_db = ChannelCastDBStub(self._dispersy)
             self._torrent_db = None
             self._mypref_db = None
             self._notifier = None
 
+        self._packet_cache = PacketCache(self._dispersy.database)
+        if self._recently_requested is None:
+            self._recently_requested = RecentlyRequested()
+
         self.register_task(u"create torrent collect requests",
                            LoopingCall(self.create_torrent_collect_requests)).start(CREATE_TORRENT_COLLECT_INTERVAL,
                                                                                     now=True)
 
+    def unload_community(self):
+        if self._notifier:
+            self._notifier.remove_observer(self.on_my_preference_added)
+            self._notifier.remove_observer(self.on_my_preference_deleted)
+        super(SearchCommunity, self).unload_community()
+
     def initiate_meta_messages(self):
         return super(SearchCommunity, self).initiate_meta_messages() + [
             Message(self, u"search-request",
@@ -225,6 +258,73 @@ class SearchCommunity(Community):
 
         return [0, time(), candidate]
 
+    def get_my_preferences(self):
+        """
+        Returns my MAX_TASTE_PREFERENCES most recent preferences, leaving out the removed downloads. They are loaded
+        from the database once and kept up to date by on_my_preference_added and on_my_preference_deleted afterwards.
+        """
+        if self._my_preferences is None:
+            self._my_preferences = self._mypref_db.getMyPrefListInfohash(returnDeleted=False,
+                                                                         limit=MAX_TASTE_PREFERENCES) \
+                if self._mypref_db else []
+            self._my_preferences_set = set(self._my_preferences)
+            self.rebuild_taste_bloom_filter()
+        return self._my_preferences
+
+    @call_on_reactor_thread
+    def on_my_preference_added(self, subject, change_type, infohash):
+        if self._my_preferences is None:
+            return
+
+        if infohash in self._my_preferences_set:
+            # a known preference becomes my most recent one, it is in the bloom filter already
+            self._my_preferences.remove(infohash)
+            self._my_preferences.insert(0, infohash)
+            return
+
+        self._my_preferences.insert(0, infohash)
+        self._my_preferences_set.add(infohash)
+        if len(self._my_preferences) > MAX_TASTE_PREFERENCES:
+            # the bloom filter keeps matching the dropped preference until it is rebuilt, which is harmless as
+            # it is an old preference of mine
+            self._my_preferences_set.discard(self._my_preferences.pop())
+
+        if self.taste_bloom_filter is None or \
+                self.get_taste_bloom_filter_error_rate(1) > TASTE_BLOOM_FILTER_MAX_ERROR_RATE:
+            self.rebuild_taste_bloom_filter()
+        else:
+            self.taste_bloom_filter.add_key(infohash)
+            self.taste_bloom_filter_keys += 1
+            self.taste_bloom_filter_version += 1
+
+    @call_on_reactor_thread
+    def on_my_preference_deleted(self, subject, change_type, infohash):
+        if self._my_preferences is None or infohash not in self._my_preferences_set:
+            return
+
+        # keys can not be removed from a bloom filter
+        self._my_preferences.remove(infohash)
+        self._my_preferences_set.discard(infohash)
+        self.rebuild_taste_bloom_filter()
+
+    def get_taste_bloom_filter_error_rate(self, additional_keys=0):
+        """
+        Estimates the false positive rate of the taste bloom filter once additional_keys more keys are added.
+        """
+        functions, bits = self.taste_bloom_filter.functions, self.taste_bloom_filter.size
+        return (1.0 - exp(-float(functions) * (self.taste_bloom_filter_keys + additional_keys) / bits)) ** functions
+
+    def rebuild_taste_bloom_filter(self):
+        if self._my_preferences:
+            # no prefix changing, we want false positives (make sure it is a single char)
+            self.taste_bloom_filter = BloomFilter(TASTE_BLOOM_FILTER_ERROR_RATE, len(self._my_preferences), prefix=' ')
+            self.taste_bloom_filter.add_keys(self._my_preferences)
+            self.taste_bloom_filter_keys = len(self._my_preferences)
+        else:
+            self.taste_bloom_filter = None
+            self.taste_bloom_filter_keys = 0
+        self.taste_bloom_filter_version += 1
+
     def create_introduction_request(self, destination, allow_sync, is_fast_walker=False):
         assert isinstance(destination, WalkCandidate), [type(destination), destination]
 
@@ -233,20 +333,7 @@ class SearchCommunity(Community):
 
         advice = True
         if not is_fast_walker:
-            my_preferences = sorted(self._mypref_db.getMyPrefListInfohash(limit=500))
-            num_preferences = len(my_preferences)
-
-            my_pref_key = u",".join(map(bin2str, my_preferences))
-            if my_pref_key != self.taste_bloom_filter_key:
-                if num_preferences > 0:
-                    # no prefix changing, we want false positives (make sure it is a single char)
-                    self.taste_bloom_filter = BloomFilter(0.005, len(my_preferences), prefix=' ')
-                    self.taste_bloom_filter.add_keys(my_preferences)
-                else:
-                    self.taste_bloom_filter = None
-
-                self.taste_bloom_filter_key = my_pref_key
-
+            num_preferences = len(self.get_my_preferences())
             taste_bloom_filter = self.taste_bloom_filter
 
             cache = self._request_cache.add(IntroductionRequestCache(self, destination))
@@ -273,7 +360,7 @@ class SearchCommunity(Community):
         super(SearchCommunity, self).on_introduction_request(messages)
 
         if any(message.payload.taste_bloom_filter for message in messages):
-            my_preferences = self._mypref_db.getMyPrefListInfohash(limit=500)
+            my_preferences = self.get_my_preferences()
         else:
             my_preferences = []
 
@@ -513,8 +600,10 @@ class SearchCommunity(Community):
 
         infohashes_to_collect = [infohash for infohash in to_collect_dict
                                  if infohash and self.tribler_session.has_collected_torrent(infohash)]
+        infohashes_to_collect = self._recently_requested.filter(infohashes_to_collect)[:5]
         if infohashes_to_collect:
-            for infohash in infohashes_to_collect[:5]:
+            self._recently_requested.add(infohashes_to_collect)
+            for infohash in infohashes_to_collect:
                 for candidate in to_collect_dict[infohash]:
                     self._logger.debug(u"requesting .torrent after receiving ping/pong %s %s",
                                        candidate, hexlify(infohash))
@@ -643,48 +732,29 @@ class SearchCommunity(Community):
     def _get_packets_from_infohashes(self, cid, infohashes):
         packets = []
 
-        def add_packet(dispersy_id):
-            if dispersy_id and dispersy_id > 0:
-                try:
-                    packet = self._get_packet_from_dispersy_id(dispersy_id, "torrent")
-                    if packet:
-                        packets.append(packet)
-                except RuntimeError:
-                    pass
-
         if cid == self._master_member.mid:
             channel_id = None
         else:
             channel_id = self._get_channel_id(cid)
 
-        for infohash in infohashes:
-            dispersy_id = None
-
-            # 1. try to find the torrentmessage for this cid, infohash combination
-            if channel_id:
-                dispersy_id = self._channelcast_db.getTorrentFromChannelId(channel_id, infohash, ['ChannelTorrents.dispersy_id'])
-            else:
-                torrent = self._torrent_db.getTorrent(infohash, ['dispersy_id'], include_mypref=False)
-                if torrent:
-                    dispersy_id = torrent['dispersy_id']
-
-                    # 2. if still not found, create a new torrentmessage and return this one
-                    if not dispersy_id:
-                        message = self.create_torrent(infohash, store=True, update=False, forward=False)
-                        if message:
-                            packets.append(message.packet)
-            add_packet(dispersy_id)
+        # 1. try to find the torrentmessages for this cid, infohash combinations
+        if channel_id:
+            dispersy_ids = self._channelcast_db.getDispersyIdsFromChannelId(channel_id, infohashes)
+        else:
+            dispersy_ids = self._torrent_db.getDispersyIdsFromInfohashes(infohashes)
+            for infohash in infohashes:
+                # 2. if still not found, create a new torrentmessage and return this one
+                if infohash in dispersy_ids and not dispersy_ids[infohash]:
+                    message = self.create_torrent(infohash, store=True, update=False, forward=False)
+                    if message:
+                        packets.append(message.packet)
+
+        # torrents without a message have no dispersy id, or one that is not positive
+        dispersy_ids = [dispersy_ids.get(infohash) for infohash in infohashes]
+        packets.extend(self._packet_cache.get_packets([dispersy_id for dispersy_id in dispersy_ids
+                                                       if dispersy_id is not None and dispersy_id > 0]))
         return packets
 
-    def _get_packet_from_dispersy_id(self, dispersy_id, messagename):
-        # 1. get the packet
-        try:
-            packet, _ = self._dispersy.database.execute(u"SELECT sync.packet, sync.id FROM community JOIN sync ON sync.community = community.id WHERE sync.id = ?", (dispersy_id,)).next()
-        except StopIteration:
-            raise RuntimeError(u"Unknown dispersy_id")
-
-        return str(packet)
-
 
 class ChannelCastDBStub(object):
 
@@ -716,6 +786,11 @@ class ChannelCastDBStub(object):
         if infohash in self._cachedTorrents:
             return self._cachedTorrents[infohash].packet_id
 
+    def getDispersyIdsFromChannelId(self, channel_id, infohashes):
+        cachedTorrents = self._cachedTorrents
+        return dict((infohash, cachedTorrents[infohash].packet_id) for infohash in infohashes
+                    if infohash in cachedTorrents)
+
     def on_dynamic_settings(self, channel_id):
         pass
 
@@ -5,6 +5,7 @@ from math import ceil
 import zlib
 
 from Tribler.Core.Utilities.encoding import encode, decode
+from Tribler.community.channel.conversion import TorrentPacker
 from Tribler.dispersy.message import DropPacket
 from Tribler.dispersy.conversion import BinaryConversion
 from Tribler.dispersy.bloomfilter import BloomFilter
@@ -21,11 +22,28 @@ class SearchConversion(BinaryConversion):
         self.define_meta_message(chr(5), community.get_meta_message(u"torrent-collect-response"), self._encode_torrent_collect_response, self._decode_torrent_collect_response)
         self.define_meta_message(chr(6), community.get_meta_message(u"torrent"), self._encode_torrent, self._decode_torrent)
 
+        # (bloom filter, version, encoding) of the last encoded taste bloom filter
+        self._taste_bloom_filter_cache = (None, None, None)
+        self._torrent_packer = TorrentPacker()
+
+    def _encode_taste_bloom_filter(self, taste_bloom_filter):
+        """
+        Encodes the taste bloom filter, the encoding is reused until the community changes its bloom filter.
+        """
+        version = self._community.taste_bloom_filter_version
+        cached_bloom_filter, cached_version, encoded = self._taste_bloom_filter_cache
+        if cached_bloom_filter is not taste_bloom_filter or cached_version != version:
+            encoded = pack('!BH', taste_bloom_filter.functions, taste_bloom_filter.size) + \
+                taste_bloom_filter.prefix + taste_bloom_filter.bytes
+            self._taste_bloom_filter_cache = (taste_bloom_filter, version, encoded)
+        return encoded
+
     def _encode_introduction_request(self, message):
         data = BinaryConversion._encode_introduction_request(self, message)
 
         if message.payload.taste_bloom_filter:
-            data.extend((pack('!IBH', message.payload.num_preferences, message.payload.taste_bloom_filter.functions, message.payload.taste_bloom_filter.size), message.payload.taste_bloom_filter.prefix, message.payload.taste_bloom_filter.bytes))
+            data.extend((pack('!I', message.payload.num_preferences),
+                         self._encode_taste_bloom_filter(message.payload.taste_bloom_filter)))
         return data
 
     def _decode_introduction_request(self, placeholder, offset, data):
@@ -263,28 +281,7 @@ class SearchConversion(BinaryConversion):
 
     def _encode_torrent(self, message):
         max_len = self._community.dispersy_sync_bloom_filter_bits / 8
-
-        files = message.payload.files
-        trackers = message.payload.trackers
-
-        def create_msg():
-            normal_msg = pack('!20sQ', message.payload.infohash, message.payload.timestamp), message.payload.name, tuple(files), tuple(trackers)
-            normal_msg = encode(normal_msg)
-            return zlib.compress(normal_msg)
-
-        compressed_msg = create_msg()
-        while len(compressed_msg) > max_len:
-            if len(trackers) > 10:
-                # only use first 10 trackers, .torrents in the wild have been seen to have 1000+ trackers...
-                trackers = trackers[:10]
-            else:
-                # reduce files by the amount we are currently to big
-                reduce_by = max_len / (len(compressed_msg) * 1.0)
-                nr_files_to_include = int(len(files) * reduce_by)
-                files = sample(files, nr_files_to_include)
-
-            compressed_msg = create_msg()
-        return compressed_msg,
+        return self._torrent_packer.pack(message.payload, max_len),
 
     def _decode_torrent(self, placeholder, offset, data):
         uncompressed_data = zlib.decompress(data[offset:])
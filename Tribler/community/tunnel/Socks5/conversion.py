@@ -22,6 +22,9 @@ REP_TTL_EXPIRED = 0x06
 REP_COMMAND_NOT_SUPPORTED = 0x07
 REP_ADDRESS_TYPE_NOT_SUPPORTED = 0x08
 
+# RSV (2), FRAG (1), ATYP (1), DST.ADDR (4) and DST.PORT (2)
+UDP_IPV4_HEADER_LENGTH = 10
+
 
 class MethodRequest(object):
 
@@ -84,7 +87,7 @@ def decode_methods_request(offset, data):
     """
     Try to decodes a METHOD request
     @param int offset: the offset to start in the data
-    @param str data: the serialised data to decode from
+    @param str|bytearray data: the serialised data to decode from
     @return: Tuple (offset, None) on failure, else (new_offset, MethodRequest)
     @rtype: (int, None|MethodRequest)
     """
@@ -100,6 +103,10 @@ def decode_methods_request(offset, data):
 
     offset += 2
 
+    # Check if we have all the methods
+    if len(data) - offset < number_of_methods:
+        return offset - 2, None
+
     methods = set([])
     for i in range(number_of_methods):
         method, = struct.unpack_from("!B", data, offset)
@@ -135,13 +142,23 @@ def __encode_address(address_type, address):
 
 
 def __decode_address(address_type, offset, data):
+    """
+    Decodes an address from data, which can be a str or a bytearray.
+    @return: tuple (new_offset, address) or (offset, None) if data does not contain the complete address
+    """
     if address_type == ADDRESS_TYPE_IPV4:
-        destination_address = socket.inet_ntoa(data[offset:offset + 4])
+        if len(data) - offset < 4:
+            return offset, None
+        destination_address = socket.inet_ntoa(str(data[offset:offset + 4]))
         offset += 4
     elif address_type == ADDRESS_TYPE_DOMAIN_NAME:
+        if len(data) - offset < 1:
+            return offset, None
         domain_length, = struct.unpack_from("!B", data, offset)
+        if len(data) - offset - 1 < domain_length:
+            return offset, None
         offset += 1
-        destination_address = data[offset:offset + domain_length]
+        destination_address = str(data[offset:offset + domain_length])
         offset += domain_length
     elif address_type == ADDRESS_TYPE_IPV6:
         raise IPV6AddrError()
@@ -155,9 +172,10 @@ def decode_request(orig_offset, data):
     """
     Try to decode a SOCKS5 request
     @param int orig_offset: the offset to start decoding in the data
-    @param str data: the raw data
-    @return: tuple (new_offset, Request) or (original_offset, None) on failure
+    @param str|bytearray data: the raw data
+    @return: tuple (new_offset, Request) or (original_offset, None) if data does not contain the complete request
     @rtype: (int, Request|None)
+    @raise ValueError: if the data is not a SOCKS5 request
     """
     offset = orig_offset
 
@@ -168,16 +186,16 @@ def decode_request(orig_offset, data):
     version, cmd, rsv, address_type = struct.unpack_from("!BBBB", data, offset)
     offset += 4
 
-    assert version == SOCKS_VERSION, (version, SOCKS_VERSION)
-    assert rsv == 0
+    if version != SOCKS_VERSION or rsv != 0:
+        raise ValueError("Invalid SOCKS5 request")
 
     offset, destination_address = __decode_address(address_type, offset, data)
 
     # Check if we could decode address, if not bail out
-    if not destination_address:
+    if destination_address is None:
         return orig_offset, None
 
-        # Check if we have enough bytes
+    # Check if we have enough bytes
     if len(data) - offset < 2:
         return orig_offset, None
 
@@ -229,6 +247,27 @@ def decode_udp_packet(data):
                       destination_port, payload)
 
 
+def decode_udp_packet_ipv4_header(data):
+    """
+    Decodes the header of a SOCKS5 UDP packet with an IPv4 destination, without creating an UdpRequest
+    @param str data: the raw packet data
+    @return: tuple (frag, address, payload) where address is the 6 byte packed destination (ip, port),
+    or None if the packet does not have an IPv4 destination
+    @rtype: (int, str, str)|None
+    """
+    if len(data) < UDP_IPV4_HEADER_LENGTH or ord(data[3]) != ADDRESS_TYPE_IPV4:
+        return None
+    return ord(data[2]), data[4:UDP_IPV4_HEADER_LENGTH], data[UDP_IPV4_HEADER_LENGTH:]
+
+
+def decode_packed_ipv4_address(address):
+    """
+    Decodes a 6 byte packed IPv4 address, as returned by decode_udp_packet_ipv4_header
+    @rtype: (str, int)
+    """
+    return socket.inet_ntoa(address[:4]), struct.unpack("!H", address[4:])[0]
+
+
 def encode_udp_packet(rsv, frag, address_type, address, port, payload):
     """
     Encodes a SOCKS5 UDP packet
@@ -1,4 +1,7 @@
 import logging
+import socket
+import struct
+from collections import defaultdict
 
 from twisted.internet import reactor
 from twisted.internet.protocol import Protocol, DatagramProtocol, connectionDone, Factory
@@ -6,6 +9,13 @@ from twisted.internet.protocol import Protocol, DatagramProtocol, connectionDone
 from Tribler.community.tunnel import CIRCUIT_STATE_READY, CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP, CIRCUIT_ID_PORT
 from Tribler.community.tunnel.Socks5 import conversion
 
+# the number of packed destination addresses that each UDP association keeps decoded
+MAX_CACHED_ADDRESSES = 10000
+# the receive buffer of the UDP association, libtorrent sends bursts of datagrams
+UDP_RECEIVE_BUFFER_SIZE = 1024 * 1024
+# the number of bytes twisted may read from the UDP association before returning to the reactor
+UDP_MAX_THROUGHPUT = 1024 * 1024
+
 
 class ConnectionState(object):
 
@@ -32,7 +42,15 @@ class SocksUDPConnection(DatagramProtocol):
         else:
             self.remote_udp_address = None
 
+        # packed IPv4 address -> (host, port)
+        self._addresses = {}
+
         self.listen_port = reactor.listenUDP(0, self)
+        self.listen_port.maxThroughput = UDP_MAX_THROUGHPUT
+        try:
+            self.listen_port.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER_SIZE)
+        except socket.error:
+            self._logger.warning("Could not increase the receive buffer of the UDP association")
 
     def get_listen_port(self):
         return self.listen_port.getHost().port
@@ -43,6 +61,25 @@ class SocksUDPConnection(DatagramProtocol):
         else:
             self._logger.error("cannot send data, no clue where to send it to")
 
+    def decode_datagram(self, data):
+        """
+        Decodes a SOCKS5 UDP datagram. IPv4 destinations, which is what libtorrent sends, are decoded from their
+        packed form only once per destination.
+        @return: tuple (frag, destination, payload)
+        """
+        header = conversion.decode_udp_packet_ipv4_header(data)
+        if header is None:
+            request = conversion.decode_udp_packet(data)
+            return request.frag, request.destination, request.payload
+
+        frag, address, payload = header
+        destination = self._addresses.get(address)
+        if destination is None:
+            if len(self._addresses) >= MAX_CACHED_ADDRESSES:
+                self._addresses.clear()
+            destination = self._addresses[address] = conversion.decode_packed_ipv4_address(address)
+        return frag, destination, payload
+
     def datagramReceived(self, data, source):
         # if remote_address was not set before, use first one
         if self.remote_udp_address is None:
@@ -50,23 +87,24 @@ class SocksUDPConnection(DatagramProtocol):
 
         if self.remote_udp_address == source:
             try:
-                request = conversion.decode_udp_packet(data)
+                frag, destination, payload = self.decode_datagram(data)
             except conversion.IPV6AddrError:
                 self._logger.warning("Received an IPV6 udp datagram, dropping it (Not implemented yet)")
                 return
+            except (ValueError, struct.error):
+                self._logger.warning("Received an invalid udp datagram, dropping it")
+                return
 
-            if request.frag == 0:
-                circuit = self.socksconnection.select(request.destination)
+            if frag == 0:
+                circuit = self.socksconnection.select(destination)
 
                 if not circuit:
-                    self._logger.debug(
-                        "No circuits available, dropping %d bytes to %s", len(request.payload), request.destination)
+                    self._logger.debug("No circuits available, dropping %d bytes to %s", len(payload), destination)
                 elif circuit.state != CIRCUIT_STATE_READY:
-                    self._logger.debug(
-                        "Circuit is not ready, dropping %d bytes to %s", len(request.payload), request.destination)
+                    self._logger.debug("Circuit is not ready, dropping %d bytes to %s", len(payload), destination)
                 else:
-                    self._logger.debug("Sending data over circuit destined for %s:%d", *request.destination)
-                    circuit.tunnel_data(request.destination, request.payload)
+                    self._logger.debug("Sending data over circuit destined for %s:%d", *destination)
+                    circuit.tunnel_data(destination, payload)
             else:
                 self._logger.debug("No support for fragmented data, dropping")
         else:
@@ -96,12 +134,16 @@ class Socks5Connection(Protocol):
 
         self._udp_socket = None
         self.state = ConnectionState.BEFORE_METHOD_REQUEST
-        self.buffer = ''
+        self.buffer = bytearray()
 
         self.destinations = {}
+        # circuit -> number of destinations using it
+        self.circuits_in_use = defaultdict(int)
+        # origin -> encoded SOCKS5 UDP header
+        self._udp_headers = {}
 
     def dataReceived(self, data):
-        self.buffer = self.buffer + data
+        self.buffer.extend(data)
         while len(self.buffer) > 0:
             # We are at the initial state, so we expect a handshake request.
             if self.state == ConnectionState.BEFORE_METHOD_REQUEST:
@@ -113,8 +155,8 @@ class Socks5Connection(Protocol):
                 if not self._try_request():
                     break  # Not enough bytes so wait till we got more
             else:
-                self.logger.error("Throwing away buffer, not in CONNECTED or BEFORE_METHOD_REQUEST state")
-                self.buffer = ''
+                self._logger.error("Throwing away buffer, not in CONNECTED or BEFORE_METHOD_REQUEST state")
+                del self.buffer[:]
 
     def _try_handshake(self):
         """
@@ -122,6 +164,12 @@ class Socks5Connection(Protocol):
 
         :return: False if command could not been processes due to lack of bytes, True otherwise
         """
+        if self.buffer[0] != conversion.SOCKS_VERSION:
+            self._logger.error("Client has sent INVALID METHOD REQUEST")
+            del self.buffer[:]
+            self.close("invalid method request")
+            return False
+
         offset, request = conversion.decode_methods_request(0, self.buffer)
 
         # No (complete) HANDSHAKE received, so dont do anything
@@ -131,12 +179,12 @@ class Socks5Connection(Protocol):
         assert isinstance(request, conversion.MethodRequest), request
 
         # Consume the buffer
-        self.buffer = self.buffer[offset:]
+        del self.buffer[:offset]
 
         # Only accept NO AUTH
         if request.version != 0x05 or 0x00 not in request.methods:
             self._logger.error("Client has sent INVALID METHOD REQUEST")
-            self.buffer = ''
+            del self.buffer[:]
             self.close()
 
         else:
@@ -165,12 +213,18 @@ class Socks5Connection(Protocol):
         """
         self._logger.debug("Client has sent PROXY REQUEST")
 
-        offset, request = conversion.decode_request(0, self.buffer)
+        try:
+            offset, request = conversion.decode_request(0, self.buffer)
+        except (ValueError, conversion.IPV6AddrError):
+            self._logger.error("Client has sent INVALID PROXY REQUEST")
+            del self.buffer[:]
+            self.close("invalid proxy request")
+            return False
 
         if request is None:
             return False
 
-        self.buffer = self.buffer[offset:]
+        del self.buffer[:offset]
 
         assert isinstance(request, conversion.Request)
         self.state = ConnectionState.PROXY_REQUEST_RECEIVED
@@ -244,11 +298,26 @@ class Socks5Connection(Protocol):
             if not selected_circuit:
                 return None
 
-            self.destinations[destination] = selected_circuit
+            self.set_destination(destination, selected_circuit)
             self._logger.info("SELECT circuit {0} for {1}".format(self.destinations[destination].circuit_id,
                                                                   destination))
         return self.destinations[destination]
 
+    def set_destination(self, destination, circuit):
+        old_circuit = self.destinations.get(destination)
+        if old_circuit is circuit:
+            return
+        if old_circuit is not None:
+            self._release_circuit(old_circuit)
+
+        self.destinations[destination] = circuit
+        self.circuits_in_use[circuit] += 1
+
+    def _release_circuit(self, circuit):
+        self.circuits_in_use[circuit] -= 1
+        if self.circuits_in_use[circuit] <= 0:
+            del self.circuits_in_use[circuit]
+
     def circuit_dead(self, broken_circuit):
         """
         When a circuit breaks and it affects our operation we should re-add the
@@ -262,7 +331,7 @@ class Socks5Connection(Protocol):
         counter = 0
         for destination in affected_destinations:
             if destination in self.destinations:
-                del self.destinations[destination]
+                self._release_circuit(self.destinations.pop(destination))
                 counter += 1
 
         if counter > 0:
@@ -271,13 +340,17 @@ class Socks5Connection(Protocol):
         return affected_destinations
 
     def on_incoming_from_tunnel(self, community, circuit, origin, data, force=False):
-        if circuit in self.destinations.values() or force:
-            self.destinations[origin] = circuit
+        if circuit in self.circuits_in_use or force:
+            self.set_destination(origin, circuit)
 
             if self._udp_socket:
-                socks5_data = conversion.encode_udp_packet(
-                    0, 0, conversion.ADDRESS_TYPE_IPV4, origin[0], origin[1], data)
-                self._udp_socket.sendDatagram(socks5_data)
+                header = self._udp_headers.get(origin)
+                if header is None:
+                    if len(self._udp_headers) >= MAX_CACHED_ADDRESSES:
+                        self._udp_headers.clear()
+                    header = self._udp_headers[origin] = conversion.encode_udp_packet(
+                        0, 0, conversion.ADDRESS_TYPE_IPV4, origin[0], origin[1], '')
+                self._udp_socket.sendDatagram(header + data)
                 return True
         return False
 
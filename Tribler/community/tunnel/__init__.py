@@ -30,3 +30,10 @@ CIRCUIT_STATE_BROKEN = 'BROKEN'
 
 CIRCUIT_ID_PORT = 1024
 PING_INTERVAL = 15.0
+
+# Relayed bytes are accounted in batches, bartercast and multichain are updated every interval
+RELAY_ACCOUNTING_INTERVAL = 5.0
+
+# Hostnames resolved by exit sockets are cached for DNS_CACHE_TTL seconds, failed lookups for DNS_FAILURE_TTL
+DNS_CACHE_TTL = 300.0
+DNS_FAILURE_TTL = 30.0
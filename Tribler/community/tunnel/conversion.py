@@ -1,6 +1,5 @@
-from struct import pack, unpack_from
+from struct import pack, pack_into, unpack_from
 from socket import inet_ntoa, inet_aton, error as socket_error
-from libtorrent import bdecode
 
 from Tribler.dispersy.conversion import BinaryConversion
 from Tribler.dispersy.message import DropPacket
@@ -9,6 +8,52 @@ from Tribler.dispersy.endpoint import TUNNEL_PREFIX, TUNNEL_PREFIX_LENGHT
 ADDRESS_TYPE_IPV4 = 0x01
 ADDRESS_TYPE_DOMAIN_NAME = 0x02
 
+PACKET_TYPE_UTP = 1
+PACKET_TYPE_UDP_TRACKER = 2
+PACKET_TYPE_DHT = 3
+PACKET_TYPE_DISPERSY = 4
+
+# the values of the message type key 'y' of a bencoded DHT message: a query, response or error
+DHT_MESSAGE_TYPES = ('q', 'r', 'e')
+# bencoded values nested deeper than this are not accepted as DHT messages
+MAX_BENCODE_DEPTH = 32
+
+
+def _decode_bencoded_string(data, offset):
+    """
+    Returns the bencoded string at OFFSET in DATA and the offset after it, raises ValueError when there is none.
+    """
+    colon = data.index(':', offset)
+    length = data[offset:colon]
+    if not length.isdigit():
+        raise ValueError("Invalid string length")
+    end = colon + 1 + int(length)
+    if end > len(data):
+        raise ValueError("Truncated string")
+    return data[colon + 1:end], end
+
+
+def _skip_bencoded(data, offset, depth=0):
+    """
+    Returns the offset after the bencoded value at OFFSET in DATA, without decoding it. Raises ValueError when there is
+    no valid value.
+    """
+    kind = data[offset:offset + 1]
+    if kind == 'i':
+        end = data.index('e', offset)
+        int(data[offset + 1:end])
+        return end + 1
+    if kind in ('l', 'd'):
+        if depth >= MAX_BENCODE_DEPTH:
+            raise ValueError("Nested too deep")
+        offset += 1
+        while data[offset:offset + 1] != 'e':
+            if kind == 'd':
+                _, offset = _decode_bencoded_string(data, offset)
+            offset = _skip_bencoded(data, offset, depth + 1)
+        return offset + 1
+    return _decode_bencoded_string(data, offset)[1]
+
 
 class TunnelConversion(BinaryConversion):
 
@@ -443,6 +488,16 @@ class TunnelConversion(BinaryConversion):
         packet = packet[:circuit_id_pos] + pack('!I', new_circuit_id) + packet[circuit_id_pos + 4:]
         return packet
 
+    @staticmethod
+    def join_with_circuit_id(plaintext, encrypted, message_type, new_circuit_id):
+        """
+        Joins the plaintext and encrypted parts of a relayed packet and writes the new circuit id into it.
+        Only the (small) plaintext header is copied for patching, the encrypted part is copied once.
+        """
+        header = bytearray(plaintext)
+        pack_into('!I', header, 0 if message_type == u"data" else 31, new_circuit_id)
+        return str(header) + encrypted
+
     @staticmethod
     def get_circuit_id(packet, message_type):
         circuit_id_pos = 0 if message_type == u"data" else 31
@@ -537,21 +592,49 @@ class TunnelConversion(BinaryConversion):
 
     @staticmethod
     def could_be_dht(data):
+        # A DHT message is a bencoded dictionary with the message type as the value of its key 'y'. The values are
+        # skipped rather than decoded, only the top level keys and the message type are looked at.
+        if len(data) < 8 or data[0] != 'd' or data[-1] != 'e':
+            return False
         try:
-            decoded = bdecode(data)
-            if isinstance(decoded, dict) and decoded.get('y') in ['q', 'r', 'e']:
-                return True
-        except:
-            pass
-        return False
+            message_type = None
+            offset = 1
+            while data[offset:offset + 1] != 'e':
+                key, offset = _decode_bencoded_string(data, offset)
+                if key == 'y':
+                    message_type, offset = _decode_bencoded_string(data, offset)
+                else:
+                    offset = _skip_bencoded(data, offset, 1)
+        except ValueError:
+            return False
+        return offset + 1 == len(data) and message_type in DHT_MESSAGE_TYPES
 
     @staticmethod
     def could_be_dispersy(data):
         return data[:TUNNEL_PREFIX_LENGHT] == TUNNEL_PREFIX and len(data) >= (23 + TUNNEL_PREFIX_LENGHT)
 
+    @staticmethod
+    def classify(data, hint=None):
+        """
+        Returns the type of packet that data could be (one of the PACKET_TYPE_ constants), or None if it is not
+        allowed to exit. If a hint is given (usually the type of the previous packet of the same flow), that type
+        is checked first, so a flow normally costs a single header check per packet.
+        """
+        if hint is not None and PACKET_CHECKS[hint](data):
+            return hint
+        for packet_type, could_be in PACKET_CHECK_ORDER:
+            if packet_type != hint and could_be(data):
+                return packet_type
+        return None
+
     @staticmethod
     def is_allowed(data):
-        return (TunnelConversion.could_be_utp(data) or
-                TunnelConversion.could_be_udp_tracker(data) or
-                TunnelConversion.could_be_dht(data) or
-                TunnelConversion.could_be_dispersy(data))
+        return TunnelConversion.classify(data) is not None
+
+
+# the checks are ordered from specific and cheap to loose and expensive
+PACKET_CHECK_ORDER = [(PACKET_TYPE_DISPERSY, TunnelConversion.could_be_dispersy),
+                      (PACKET_TYPE_UTP, TunnelConversion.could_be_utp),
+                      (PACKET_TYPE_UDP_TRACKER, TunnelConversion.could_be_udp_tracker),
+                      (PACKET_TYPE_DHT, TunnelConversion.could_be_dht)]
+PACKET_CHECKS = dict(PACKET_CHECK_ORDER)
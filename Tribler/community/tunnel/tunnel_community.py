@@ -9,6 +9,7 @@ from collections import defaultdict
 from cryptography.exceptions import InvalidTag
 
 from twisted.internet import reactor
+from twisted.internet.defer import Deferred, fail, succeed
 from twisted.internet.protocol import DatagramProtocol
 from twisted.internet.task import LoopingCall
 
@@ -17,7 +18,8 @@ from Tribler.Core.Utilities.encoding import decode, encode
 from Tribler.community.bartercast4.statistics import BartercastStatisticTypes, _barter_statistics
 from Tribler.community.tunnel import (CIRCUIT_ID_PORT, CIRCUIT_STATE_EXTENDING, CIRCUIT_STATE_READY, CIRCUIT_TYPE_DATA,
                                       CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP, EXIT_NODE, EXIT_NODE_SALT, ORIGINATOR,
-                                      ORIGINATOR_SALT, PING_INTERVAL)
+                                      ORIGINATOR_SALT, PING_INTERVAL, RELAY_ACCOUNTING_INTERVAL, DNS_CACHE_TTL,
+                                      DNS_FAILURE_TTL)
 from Tribler.community.tunnel.Socks5.server import Socks5Server
 from Tribler.community.tunnel.conversion import TunnelConversion
 from Tribler.community.tunnel.crypto.tunnelcrypto import CryptoException, TunnelCrypto
@@ -99,6 +101,63 @@ class StatsRequestCache(RandomNumberCache):
         pass
 
 
+class CachedResolver(object):
+
+    """
+    Resolves hostnames without blocking the reactor and caches the results for DNS_CACHE_TTL seconds.
+    Concurrent lookups for the same hostname share a single query.
+    """
+
+    def __init__(self):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        # hostname -> (ip address or None, expiry time)
+        self._cache = {}
+        # hostname -> list of Deferreds waiting for the pending lookup
+        self._pending = {}
+
+    def get_cached(self, hostname):
+        """
+        Returns the cached ip address of hostname, or None if it is not known (or failed to resolve).
+        """
+        entry = self._cache.get(hostname)
+        if entry and entry[1] > time.time():
+            return entry[0]
+        return None
+
+    def resolve(self, hostname):
+        entry = self._cache.get(hostname)
+        if entry and entry[1] > time.time():
+            if entry[0] is None:
+                return fail(socket.gaierror("Can't resolve ip address for hostname %s" % hostname))
+            return succeed(entry[0])
+
+        deferred = Deferred()
+        if hostname in self._pending:
+            self._pending[hostname].append(deferred)
+        else:
+            self._pending[hostname] = [deferred]
+            reactor.resolve(hostname).addCallbacks(lambda ip_address: self._on_resolved(hostname, ip_address),
+                                                   lambda failure: self._on_failure(hostname, failure))
+        return deferred
+
+    def _on_resolved(self, hostname, ip_address):
+        self._logger.info("Resolved ip address %s for hostname %s", ip_address, hostname)
+        self._cache[hostname] = (ip_address, time.time() + DNS_CACHE_TTL)
+        for deferred in self._pending.pop(hostname, []):
+            deferred.callback(ip_address)
+
+    def _on_failure(self, hostname, failure):
+        self._logger.error("Can't resolve ip address for hostname %s", hostname)
+        self._cache[hostname] = (None, time.time() + DNS_FAILURE_TTL)
+        for deferred in self._pending.pop(hostname, []):
+            deferred.errback(failure)
+
+    def clear_expired(self):
+        now = time.time()
+        for hostname in [hostname for hostname, (_, expiry) in self._cache.iteritems() if expiry <= now]:
+            del self._cache[hostname]
+
+
 class TunnelExitSocket(DatagramProtocol):
 
     def __init__(self, circuit_id, community, sock_addr, mid=None):
@@ -109,6 +168,8 @@ class TunnelExitSocket(DatagramProtocol):
         self.circuit_id = circuit_id
         self.community = community
         self.ips = defaultdict(int)
+        # the packet type of the last allowed packet, per remote address
+        self.flow_types = {}
         self.bytes_up = self.bytes_down = 0
         self.creation_time = time.time()
         self.mid = mid
@@ -121,37 +182,50 @@ class TunnelExitSocket(DatagramProtocol):
     def enabled(self):
         return self.port is not None
 
+    def is_allowed(self, data, address):
+        packet_type = TunnelConversion.classify(data, self.flow_types.get(address))
+        if packet_type is None:
+            return False
+        self.flow_types[address] = packet_type
+        return True
+
     def sendto(self, data, destination):
         if self.check_num_packets(destination, False):
-            if TunnelConversion.is_allowed(data):
+            if self.is_allowed(data, destination):
                 if dispersy.util.is_valid_address(destination):
-                    ip_address = destination[0]
+                    self.write(data, destination)
                 else:
-                    try:
-                        ip_address = socket.gethostbyname(destination[0])
-                        self.tunnel_logger.info("Resolved ip address %s for hostname %s",
-                                                 ip_address,
-                                                 destination[0])
-                    except:
-                        self.tunnel_logger.error("Can't resolve ip address for hostname %s", destination[0])
-
-                try:
-                    self.transport.write(data, (ip_address, destination[1]))
-                except Exception, e:
-                    self.tunnel_logger.error("Failed to write data to transport: %s. Destination: %s",
-                                             e[1],
-                                             repr(destination))
-                    raise
-
-                self.community.increase_bytes_sent(self, len(data))
+                    ip_address = self.community.resolver.get_cached(destination[0])
+                    if ip_address:
+                        self.write(data, (ip_address, destination[1]))
+                    else:
+                        self.community.resolver.resolve(destination[0]).addCallbacks(
+                            lambda ip_address: self.write(data, (ip_address, destination[1])),
+                            lambda _: self.tunnel_logger.error("Dropping packet to unresolvable destination %s",
+                                                               repr(destination)))
             else:
                 self.tunnel_logger.error("dropping forbidden packets from exit socket with circuit_id %d",
                                          self.circuit_id)
 
+    def write(self, data, destination):
+        if not self.enabled:
+            # the exit socket was closed while we were resolving the destination
+            return
+
+        try:
+            self.transport.write(data, destination)
+        except Exception, e:
+            self.tunnel_logger.error("Failed to write data to transport: %s. Destination: %s",
+                                     e[1],
+                                     repr(destination))
+            raise
+
+        self.community.increase_bytes_sent(self, len(data))
+
     def datagramReceived(self, data, source):
         self.community.increase_bytes_received(self, len(data))
         if self.check_num_packets(source, True):
-            if TunnelConversion.is_allowed(data):
+            if self.is_allowed(data, source):
                 self.tunnel_data(source, data)
             else:
                 self.tunnel_logger.warning("dropping forbidden packets to exit socket with circuit_id %d",
@@ -273,6 +347,11 @@ class TunnelCommunity(Community):
         """ Set up later by Gumby/Tribler."""
         self.multichain_scheduler = None
 
+        # relayed bytes per (direction, sock_addr) that still have to be passed to bartercast and multichain
+        self.relay_bytes_pending = defaultdict(int)
+
+        self.resolver = CachedResolver()
+
     def initialize(self, tribler_session=None, settings=None):
         self.trsession = tribler_session
         self.settings = settings if settings else TunnelSettings(tribler_session=tribler_session)
@@ -289,6 +368,10 @@ class TunnelCommunity(Community):
 
         self.register_task("do_circuits", LoopingCall(self.do_circuits)).start(5, now=True)
         self.register_task("do_ping", LoopingCall(self.do_ping)).start(PING_INTERVAL)
+        self.register_task("flush_relay_accounting",
+                           LoopingCall(self.flush_relay_accounting)).start(RELAY_ACCOUNTING_INTERVAL, now=False)
+        self.register_task("clear_expired_dns_cache",
+                           LoopingCall(self.resolver.clear_expired)).start(DNS_CACHE_TTL, now=False)
 
         self.socks_server = Socks5Server(self, tribler_session.get_tunnel_community_socks5_listen_ports()
                                          if tribler_session else self.settings.socks_listen_ports)
@@ -379,6 +462,8 @@ class TunnelCommunity(Community):
         for circuit_id in self.exit_sockets.keys():
             self.remove_exit_socket(circuit_id, destroy=True)
 
+        self.flush_relay_accounting()
+
         super(TunnelCommunity, self).unload_community()
 
     @property
@@ -696,7 +781,9 @@ class TunnelCommunity(Community):
     def send_packet(self, candidates, message_type, packet):
         self.dispersy.endpoint.send(candidates, [packet], prefix=self.data_prefix if message_type == u"data" else None)
         self.statistics.increase_msg_count(u"outgoing", message_type, len(candidates))
-        self.tunnel_logger.debug("send %s to %s candidates: %s", message_type, len(candidates), map(str, candidates))
+        if self.tunnel_logger.isEnabledFor(logging.DEBUG):
+            self.tunnel_logger.debug("send %s to %s candidates: %s", message_type, len(candidates),
+                                     map(str, candidates))
         return len(packet)
 
     def send_destroy(self, candidate, circuit_id, reason):
@@ -715,7 +802,7 @@ class TunnelCommunity(Community):
 
             if this_relay:
                 this_relay.last_incoming = time.time()
-                self.increase_bytes_received(this_relay, len(packet))
+                self.increase_relay_bytes_received(this_relay, len(packet))
 
             plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, message_type)
             try:
@@ -727,10 +814,9 @@ class TunnelCommunity(Community):
             except CryptoException, e:
                 self.tunnel_logger.error(str(e))
                 return False
-            packet = plaintext + encrypted
 
-            packet = TunnelConversion.swap_circuit_id(packet, message_type, circuit_id, next_relay.circuit_id)
-            self.increase_bytes_sent(next_relay, self.send_packet(
+            packet = TunnelConversion.join_with_circuit_id(plaintext, encrypted, message_type, next_relay.circuit_id)
+            self.increase_relay_bytes_sent(next_relay, self.send_packet(
                 [Candidate(next_relay.sock_addr, False)], message_type, packet))
 
             return True
@@ -1259,6 +1345,32 @@ class TunnelCommunity(Community):
                                            self.relay_session_keys[circuit_id][EXIT_NODE_SALT])
         raise CryptoException("Direction must be either ORIGINATOR or EXIT_NODE")
 
+    def increase_relay_bytes_sent(self, relay, num_bytes):
+        # fast path for relay_packet: bartercast and multichain are updated by flush_relay_accounting
+        relay.bytes_up += num_bytes
+        self.stats['bytes_relay_up'] += num_bytes
+        self.relay_bytes_pending[(True, relay.sock_addr)] += num_bytes
+
+    def increase_relay_bytes_received(self, relay, num_bytes):
+        relay.bytes_down += num_bytes
+        self.stats['bytes_relay_down'] += num_bytes
+        self.relay_bytes_pending[(False, relay.sock_addr)] += num_bytes
+
+    def flush_relay_accounting(self):
+        relay_bytes_pending, self.relay_bytes_pending = self.relay_bytes_pending, defaultdict(int)
+        for (is_sent, sock_addr), num_bytes in relay_bytes_pending.iteritems():
+            peer = (sock_addr[0], sock_addr[1])
+            if is_sent:
+                _barter_statistics.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_RELAY_BYTES_SENT,
+                                                       "%s:%s" % peer, num_bytes)
+                if self.multichain_scheduler:
+                    self.multichain_scheduler.update_amount_send(peer, num_bytes)
+            else:
+                _barter_statistics.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_RELAY_BYTES_RECEIVED,
+                                                       "%s:%s" % peer, num_bytes)
+                if self.multichain_scheduler:
+                    self.multichain_scheduler.update_amount_received(peer, num_bytes)
+
     def increase_bytes_sent(self, obj, num_bytes):
         if isinstance(obj, Circuit):
             obj.bytes_up += num_bytes
@@ -232,6 +232,18 @@ CREATE TABLE IF NOT EXISTS MetaDataPlaylist (
 );
 CREATE INDEX IF NOT EXISTS MePlaylistIndex ON MetaDataPlaylist(playlist_id);
 
+CREATE TABLE IF NOT EXISTS LatestMetaData (
+  channel_id            integer         NOT NULL,
+  channeltorrent_id     integer         NOT NULL DEFAULT (0),
+  playlist_id           integer         NOT NULL DEFAULT (0),
+  type                  text            NOT NULL,
+  dispersy_id           integer         NOT NULL,
+  prev_global_time      integer,
+  global_time           integer,
+  PRIMARY KEY (channel_id, channeltorrent_id, playlist_id, type)
+);
+CREATE INDEX IF NOT EXISTS LaMeDispersyIndex ON LatestMetaData(dispersy_id);
+
 CREATE TABLE IF NOT EXISTS _ChannelVotes (
   channel_id            integer,
   voter_id              integer,
@@ -277,7 +289,7 @@ COMMIT TRANSACTION create_table;
 
 BEGIN TRANSACTION init_values;
 
-INSERT INTO MyInfo VALUES ('version', 28);
+INSERT INTO MyInfo VALUES ('version', 29);
 
 INSERT INTO TrackerInfo (tracker) VALUES ('no-DHT');
 INSERT INTO TrackerInfo (tracker) VALUES ('DHT');